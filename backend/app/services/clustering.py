@@ -0,0 +1,151 @@
+import os
+import threading
+import hdbscan
+import joblib
+from sklearn.decomposition import TruncatedSVD
+from sqlalchemy import update
+from models import Lead
+from app.utils.embeddings import decode_embeddings
+from app.services.embedding_store import load_workorder_embeddings
+
+CLUSTER_MODEL_DIR = os.getenv('CLUSTER_MODEL_DIR', './cluster_models')
+# Refit once this fraction of leads has been assigned incrementally since the last fit
+CLUSTER_DRIFT_THRESHOLD = float(os.getenv('CLUSTER_DRIFT_THRESHOLD', '0.25'))
+# ...or once this fraction of incrementally assigned leads fell outside every cluster
+CLUSTER_NOISE_DRIFT_THRESHOLD = float(os.getenv('CLUSTER_NOISE_DRIFT_THRESHOLD', '0.5'))
+CLUSTER_SVD_COMPONENTS = 32
+
+_model_locks = {}
+_model_locks_lock = threading.Lock()
+
+
+def _reduce(svd, embeddings):
+    if svd is not None:
+        return svd.transform(embeddings)
+    return embeddings[:, :CLUSTER_SVD_COMPONENTS] if embeddings.shape[1] > CLUSTER_SVD_COMPONENTS else embeddings
+
+
+def _singleton_noise(labels, next_label):
+    # Each noise point (-1) gets its own fresh label, as the UI expects
+    labels = [int(label) for label in labels]
+    for i, label in enumerate(labels):
+        if label == -1:
+            labels[i] = next_label
+            next_label += 1
+    return labels, next_label
+
+
+def fit_cluster_model(embeddings):
+    """Fit SVD + HDBSCAN on an (n, d) float32 matrix; returns `(model, labels)`."""
+    svd = None
+    if embeddings.shape[0] > CLUSTER_SVD_COMPONENTS:
+        svd = TruncatedSVD(n_components=CLUSTER_SVD_COMPONENTS, random_state=42)
+        svd.fit(embeddings)
+    reduced = _reduce(svd, embeddings)
+    clusterer = None
+    if len(reduced) >= 2:
+        clusterer = hdbscan.HDBSCAN(min_cluster_size=2, prediction_data=True)
+        raw_labels = clusterer.fit_predict(reduced)
+    else:
+        raw_labels = [-1] * len(reduced)
+    next_label = int(max(raw_labels, default=-1)) + 1
+    labels, next_label = _singleton_noise(raw_labels, next_label)
+    model = {
+        "svd": svd,
+        "clusterer": clusterer,
+        "dimensions": int(embeddings.shape[1]),
+        "next_label": next_label,
+        "fitted_count": len(labels),
+        "assigned_since_fit": 0,
+        "noise_since_fit": 0,
+    }
+    return model, labels
+
+
+def predict_clusters(model, embeddings):
+    """Assign new embeddings to the fitted clusters without refitting; updates drift counters."""
+    if model["clusterer"] is None:
+        raw_labels = [-1] * len(embeddings)
+    else:
+        raw_labels, _ = hdbscan.approximate_predict(model["clusterer"], _reduce(model["svd"], embeddings))
+    labels, model["next_label"] = _singleton_noise(raw_labels, model["next_label"])
+    model["assigned_since_fit"] += len(labels)
+    model["noise_since_fit"] += int(sum(1 for label in raw_labels if label == -1))
+    return labels
+
+
+def needs_refit(model, incoming=0):
+    """True when incremental assignment has drifted too far from the fitted model."""
+    if model["clusterer"] is None:
+        return True
+    assigned = model["assigned_since_fit"] + incoming
+    if assigned > CLUSTER_DRIFT_THRESHOLD * model["fitted_count"]:
+        return True
+    if model["assigned_since_fit"] >= 20 and model["noise_since_fit"] > CLUSTER_NOISE_DRIFT_THRESHOLD * model["assigned_since_fit"]:
+        return True
+    return False
+
+
+def _model_path(workorder_id):
+    return os.path.join(CLUSTER_MODEL_DIR, f'workorder_{workorder_id}.joblib')
+
+
+def load_cluster_model(workorder_id):
+    path = _model_path(workorder_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        return joblib.load(path)
+    except Exception:
+        # A corrupt or incompatible model just forces a refit
+        return None
+
+
+def save_cluster_model(workorder_id, model):
+    os.makedirs(CLUSTER_MODEL_DIR, exist_ok=True)
+    tmp_path = _model_path(workorder_id) + '.tmp'
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, _model_path(workorder_id))
+
+
+def _workorder_lock(workorder_id):
+    with _model_locks_lock:
+        return _model_locks.setdefault(workorder_id, threading.Lock())
+
+
+def cluster_workorder(session, workorder_id, force_refit=False):
+    """Give every embedded lead of a workorder a cluster_id; the caller commits.
+
+    Leads without a cluster_id are assigned through the persisted model's
+    approximate prediction. All leads are refit from scratch when there is
+    no model yet, when the model's dimensions no longer match, when drift
+    passes the thresholds, or when `force_refit` is set. Returns 'refit',
+    'incremental' or 'unchanged'.
+    """
+    with _workorder_lock(workorder_id):
+        model = None if force_refit else load_cluster_model(workorder_id)
+        pending = session.query(Lead.id, Lead.buyer_persona_embedding).filter(
+            Lead.workorder_id == workorder_id,
+            Lead.buyer_persona_embedding.isnot(None),
+            Lead.cluster_id.is_(None)
+        ).order_by(Lead.id).all()
+        if model is not None and not pending:
+            return 'unchanged'
+        if model is not None and not needs_refit(model, len(pending)):
+            embeddings = decode_embeddings([row[1] for row in pending])
+            if embeddings.shape[1] == model["dimensions"]:
+                labels = predict_clusters(model, embeddings)
+                session.execute(update(Lead), [
+                    {"id": row[0], "cluster_id": label} for row, label in zip(pending, labels)
+                ])
+                save_cluster_model(workorder_id, model)
+                return 'incremental'
+        lead_ids, embeddings = load_workorder_embeddings(session, workorder_id)
+        if not len(lead_ids):
+            return 'unchanged'
+        model, labels = fit_cluster_model(embeddings)
+        session.execute(update(Lead), [
+            {"id": lead_id, "cluster_id": label} for lead_id, label in zip(lead_ids.tolist(), labels)
+        ])
+        save_cluster_model(workorder_id, model)
+        return 'refit'
@@ -0,0 +1,155 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Model of workorders created before providers were pluggable
+LEGACY_EMBEDDING_MODEL = 'openai/text-embedding-3-small'
+# Provider used for new workorders: a model id such as "openai/text-embedding-3-small" or "hashing/tf-1024"
+EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', LEGACY_EMBEDDING_MODEL)
+# Texts vectorized per chunk, and chunks vectorized in parallel, by the local hashing provider
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', '1000'))
+LOCAL_EMBEDDING_WORKERS = int(os.getenv('LOCAL_EMBEDDING_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+
+class EmbeddingProvider:
+    """Turns persona texts into vectors.
+
+    `model_id` ("<provider>/<model>") and `dimensions` are recorded on each
+    workorder, and a workorder is always embedded by the provider it was
+    created with, so vectors of different models never share a matrix,
+    cluster model or similarity scope. `dimensions` may be None when it is
+    only known from the first response.
+    """
+
+    name = None
+
+    def __init__(self, model):
+        self.model = model
+
+    @property
+    def model_id(self):
+        return f'{self.name}/{self.model}'
+
+    @property
+    def dimensions(self):
+        return None
+
+    def embed(self, texts):
+        """One float32 vector (or None) per text; empty texts get None."""
+        raise NotImplementedError
+
+
+def _flatten_persona(text):
+    # Personas are JSON objects with the same keys; only the values tell them apart
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return text
+    if not isinstance(value, (dict, list)):
+        return text
+    parts = []
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(reversed(list(item.values())))
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+        elif item is not None:
+            parts.append(str(item))
+    return ' '.join(parts)
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Local CPU embeddings from hashed word and bigram frequencies.
+
+    Terms are hashed into `dimensions` signed buckets with sublinear (log)
+    term frequency and English stop words removed, then L2-normalized. There
+    is no fitted vocabulary or IDF, so a text always maps to the same vector
+    no matter which batch or workorder it arrives in. Needs no network and
+    embeds thousands of personas per second per core; chunks of a large
+    batch are vectorized on `workers` threads.
+    """
+
+    name = 'hashing'
+
+    def __init__(self, model='tf-1024', batch_size=LOCAL_EMBEDDING_BATCH_SIZE, workers=LOCAL_EMBEDDING_WORKERS):
+        super().__init__(model)
+        kind, _, size = model.rpartition('-')
+        if kind != 'tf' or not size.isdigit():
+            raise ValueError(f'Unknown hashing embedding model: {model} (expected tf-<dimensions>)')
+        self._dimensions = int(size)
+        self.batch_size = batch_size
+        self.workers = workers
+        self._vectorizer = HashingVectorizer(
+            n_features=self._dimensions,
+            ngram_range=(1, 2),
+            stop_words='english',
+            alternate_sign=True,
+            norm=None,
+            dtype=np.float32,
+        )
+
+    @property
+    def dimensions(self):
+        return self._dimensions
+
+    def _embed_chunk(self, texts):
+        counts = self._vectorizer.transform([_flatten_persona(text) for text in texts])
+        # Sublinear term frequency, keeping the hash sign
+        counts.data = np.sign(counts.data) * np.log1p(np.abs(counts.data))
+        matrix = counts.toarray()
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def embed(self, texts):
+        embeddings = [None] * len(texts)
+        positions = [i for i, text in enumerate(texts) if text]
+        chunks = [positions[start:start + self.batch_size] for start in range(0, len(positions), self.batch_size)]
+        if len(chunks) > 1 and self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                matrices = list(executor.map(self._embed_chunk, ([texts[i] for i in chunk] for chunk in chunks)))
+        else:
+            matrices = [self._embed_chunk([texts[i] for i in chunk]) for chunk in chunks]
+        for chunk, matrix in zip(chunks, matrices):
+            for i, vector in zip(chunk, matrix):
+                embeddings[i] = vector
+        return embeddings
+
+
+# Provider name -> factory taking the model name
+_provider_factories = {'hashing': HashingEmbeddingProvider}
+_providers = {}
+_providers_lock = threading.Lock()
+_default_model_id = EMBEDDING_PROVIDER
+
+
+def register_embedding_provider(name, factory):
+    """Make `name/<model>` model ids resolve to `factory(model)`."""
+    with _providers_lock:
+        _provider_factories[name] = factory
+
+
+def get_embedding_provider(model_id=None):
+    """Provider for `model_id`, or for the configured default when None."""
+    model_id = model_id or _default_model_id
+    with _providers_lock:
+        provider = _providers.get(model_id)
+        if provider is None:
+            name, _, model = model_id.partition('/')
+            factory = _provider_factories.get(name)
+            if factory is None or not model:
+                raise ValueError(f'Unknown embedding provider: {model_id}')
+            provider = _providers[model_id] = factory(model)
+    return provider
+
+
+def set_embedding_provider(provider):
+    """Use `provider` for new workorders and for its own model id."""
+    global _default_model_id
+    with _providers_lock:
+        _providers[provider.model_id] = provider
+        _default_model_id = provider.model_id
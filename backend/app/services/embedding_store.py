@@ -0,0 +1,81 @@
+import os
+import threading
+import numpy as np
+from models import Lead
+from app.utils.embeddings import decode_embeddings
+
+# Directory of per-workorder embedding matrices kept next to the database
+EMBEDDING_MATRIX_DIR = os.getenv('EMBEDDING_MATRIX_DIR', './embedding_matrices')
+
+_generations = {}
+_generations_lock = threading.Lock()
+
+
+def _paths(workorder_id):
+    base = os.path.join(EMBEDDING_MATRIX_DIR, f'workorder_{workorder_id}')
+    return base + '.ids.npy', base + '.npy'
+
+
+def _generation(workorder_id):
+    with _generations_lock:
+        return _generations.get(workorder_id, 0)
+
+
+def invalidate_workorder_embeddings(workorder_id):
+    """Drop the side file of a workorder; call after writing any of its embeddings."""
+    with _generations_lock:
+        _generations[workorder_id] = _generations.get(workorder_id, 0) + 1
+        for path in _paths(workorder_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _save(workorder_id, ids, matrix):
+    os.makedirs(EMBEDDING_MATRIX_DIR, exist_ok=True)
+    # Matrix first: a reader only trusts the pair once the ids file exists
+    ids_path, matrix_path = _paths(workorder_id)
+    for path, array in ((matrix_path, matrix), (ids_path, ids)):
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+
+def _load(workorder_id):
+    ids_path, matrix_path = _paths(workorder_id)
+    try:
+        ids = np.load(ids_path)
+        matrix = np.load(matrix_path, mmap_mode='r')
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    if matrix.ndim != 2 or len(matrix) != len(ids):
+        return None
+    return ids, matrix
+
+
+def load_workorder_embeddings(session, workorder_id):
+    """`(lead_ids, matrix)` of every embedded lead of a workorder, in id order.
+
+    The matrix is a read-only float32 memory map of a contiguous side file,
+    so repeated loads cost one sequential read instead of decoding a BLOB per
+    row. The file is rebuilt from the database when it is missing.
+    """
+    cached = _load(workorder_id)
+    if cached is not None:
+        return cached
+    generation = _generation(workorder_id)
+    rows = session.query(Lead.id, Lead.buyer_persona_embedding).filter(
+        Lead.workorder_id == workorder_id,
+        Lead.buyer_persona_embedding.isnot(None)
+    ).order_by(Lead.id).all()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    matrix = np.ascontiguousarray(decode_embeddings([row[1] for row in rows]), dtype=np.float32)
+    with _generations_lock:
+        # Skip writing if embeddings changed while we were reading; the next load rebuilds
+        if rows and _generations.get(workorder_id, 0) == generation:
+            try:
+                _save(workorder_id, ids, matrix)
+            except OSError:
+                pass
+    return ids, matrix
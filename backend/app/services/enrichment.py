@@ -0,0 +1,670 @@
+import os
+import datetime
+import queue
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from sqlalchemy import case, func, update
+from models import Workorder, Lead
+from app.services.lead_processing import (
+    scrape_lead, generate_lead_persona, generate_buyer_persona_embeddings, embedding_to_bytes, content_hash,
+    EMBEDDING_BATCH_SIZE
+)
+from app.services.clustering import cluster_workorder
+from app.services.embedding_providers import get_embedding_provider
+from app.services.ingestion import ingest_leads
+from app.services.ranking import embedding_matrix_cache
+from app.services.vector_index import get_vector_index, index_workorder_embeddings
+from app.utils.cache import SCRAPE_CACHE_TTL
+from app.utils.metrics import get_metrics, in_workorder, span, increment
+
+# Number of leads enriched in parallel; workers mostly wait on the shared HTTP client
+ENRICHMENT_CONCURRENCY = int(os.getenv('ENRICHMENT_CONCURRENCY', '32'))
+# How many finished leads to accumulate before committing them
+ENRICHMENT_COMMIT_EVERY = int(os.getenv('ENRICHMENT_COMMIT_EVERY', '25'))
+# ...or after this many seconds, so slow leads don't hold finished stages uncommitted
+ENRICHMENT_COMMIT_INTERVAL = float(os.getenv('ENRICHMENT_COMMIT_INTERVAL', '2'))
+# Workorder jobs run at once, each with ENRICHMENT_CONCURRENCY workers; later ones wait in a queue
+ENRICHMENT_MAX_JOBS = int(os.getenv('ENRICHMENT_MAX_JOBS', '2'))
+# Pending leads read from the database per query
+ENRICHMENT_FETCH_BATCH = int(os.getenv('ENRICHMENT_FETCH_BATCH', '500'))
+# Seconds an enriched lead's results are copied to new leads of the same company without
+# scraping again; older ones are re-scraped, and only the persona is reused if the text is unchanged
+ENRICHMENT_REUSE_MAX_AGE = float(os.getenv('ENRICHMENT_REUSE_MAX_AGE', str(SCRAPE_CACHE_TTL)))
+
+# Workorder status lifecycle for background enrichment
+WORKORDER_QUEUED = 'queued'
+WORKORDER_ENRICHING = 'enriching'
+WORKORDER_CLUSTERING = 'clustering'
+WORKORDER_DONE = 'done'
+WORKORDER_FAILED = 'failed'
+
+# Per-lead enrichment status
+LEAD_PENDING = 'pending'
+LEAD_DONE = 'done'
+LEAD_FAILED = 'failed'
+
+# Per-lead stages, in order. `enrichment_stage` holds the last completed one,
+# so a resumed or retried lead continues from the stage after it. The search
+# fallback is part of the scrape stage; its result is kept in the scrape cache.
+STAGE_SCRAPE = 'scrape'
+STAGE_PERSONA = 'persona'
+STAGE_EMBEDDING = 'embedding'
+STAGE_CLUSTER = 'cluster'
+ENRICHMENT_STAGES = [STAGE_SCRAPE, STAGE_PERSONA, STAGE_EMBEDDING, STAGE_CLUSTER]
+
+# Workorders with a job running in this process, and with one waiting in the job queue
+_active_workorders = set()
+_queued_workorders = set()
+_active_workorders_lock = threading.Lock()
+# Jobs run on their own threads rather than the request threadpool; see submit_workorder_job
+_job_queue = queue.Queue()
+_job_threads = []
+
+
+@contextmanager
+def _claim_workorder(workorder_id):
+    with _active_workorders_lock:
+        claimed = workorder_id not in _active_workorders
+        _active_workorders.add(workorder_id)
+    try:
+        yield claimed
+    finally:
+        if claimed:
+            with _active_workorders_lock:
+                _active_workorders.discard(workorder_id)
+
+
+def is_job_active(workorder_id):
+    with _active_workorders_lock:
+        return workorder_id in _active_workorders or workorder_id in _queued_workorders
+
+
+def _job_worker():
+    while True:
+        workorder_id, job, args = _job_queue.get()
+        try:
+            job(workorder_id, *args)
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+        finally:
+            with _active_workorders_lock:
+                _queued_workorders.discard(workorder_id)
+
+
+def submit_workorder_job(job, workorder_id, *args):
+    """Queue `job(workorder_id, *args)` (run_workorder_job, resume_workorder_job or recluster_workorder_job).
+
+    At most ENRICHMENT_MAX_JOBS jobs run at once, so concurrent uploads
+    can't multiply enrichment workers, API calls and browsers. Returns
+    False without queueing when the workorder already has a job queued or
+    running. The threads are daemons: jobs cut short by a shutdown are
+    continued with `resume_workorder_job`.
+    """
+    with _active_workorders_lock:
+        if workorder_id in _active_workorders or workorder_id in _queued_workorders:
+            return False
+        _queued_workorders.add(workorder_id)
+        while len(_job_threads) < ENRICHMENT_MAX_JOBS:
+            thread = threading.Thread(target=_job_worker, name=f'enrichment-job-{len(_job_threads)}', daemon=True)
+            thread.start()
+            _job_threads.append(thread)
+    _job_queue.put((workorder_id, job, args))
+    return True
+
+
+def _set_workorder_status(session, workorder_id, status):
+    session.query(Workorder).filter(Workorder.id == workorder_id).update({Workorder.status: status})
+    session.commit()
+
+
+def _failure(lead_id, stage, error):
+    return {
+        "id": lead_id,
+        "enrichment_status": LEAD_FAILED,
+        "failed_stage": stage,
+        "enrichment_error": str(error)[:1000],
+    }
+
+
+def workorder_embedding_provider(session, workorder_id):
+    """`(provider, dimensions)` a workorder is embedded with.
+
+    Workorders without a recorded model are pinned to the configured default
+    provider here, so every lead of a workorder uses the same model even if
+    the configuration changes between runs.
+    """
+    workorder = session.query(Workorder).filter(Workorder.id == workorder_id).one()
+    if workorder.embedding_model is None:
+        provider = get_embedding_provider()
+        workorder.embedding_model = provider.model_id
+        workorder.embedding_dim = provider.dimensions
+        session.commit()
+    return get_embedding_provider(workorder.embedding_model), workorder.embedding_dim
+
+
+def _iter_pending_leads(session, workorder_id, ingestion_done=None, batch_size=ENRICHMENT_FETCH_BATCH):
+    """Yield pending leads in id order, as lists of up to `batch_size` rows.
+
+    Rows are `(lead_id, data, stage, extraction_stats, raw_text, persona,
+    enrichment_key)`; the large text columns are only read for leads whose
+    next stage needs them. While `ingestion_done` is unset, rows are still
+    being inserted, so an empty batch means waiting for more rather than
+    stopping.
+    """
+    last_id = 0
+    while True:
+        finished = ingestion_done is None or ingestion_done.is_set()
+        rows = session.query(
+            Lead.id, Lead.data, Lead.enrichment_stage, Lead.extraction_stats,
+            case((Lead.enrichment_stage == STAGE_SCRAPE, Lead.raw_webpage_text), else_=None),
+            case((Lead.enrichment_stage == STAGE_PERSONA, Lead.buyer_persona), else_=None),
+            Lead.enrichment_key
+        ).filter(
+            Lead.workorder_id == workorder_id,
+            Lead.enrichment_status == LEAD_PENDING,
+            Lead.id > last_id
+        ).order_by(Lead.id).limit(batch_size).all()
+        if rows:
+            last_id = rows[-1][0]
+            yield rows
+        elif finished:
+            return
+        else:
+            ingestion_done.wait(0.5)
+
+
+def _find_reusable_leads(session, keys, embedding_model):
+    """The most recently enriched done lead of each of `keys`, if enriched within ENRICHMENT_REUSE_MAX_AGE.
+
+    Returns `{key: (lead_id, same_model)}`. Leads embedded with
+    `embedding_model` are preferred; others can still lend their page text
+    and persona.
+    """
+    if not keys or ENRICHMENT_REUSE_MAX_AGE <= 0:
+        return {}
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=ENRICHMENT_REUSE_MAX_AGE)
+    rows = session.query(Lead.enrichment_key, Lead.id, Workorder.embedding_model, Lead.enriched_at).join(
+        Workorder, Lead.workorder_id == Workorder.id
+    ).filter(
+        Lead.enrichment_key.in_(keys),
+        Lead.enrichment_status == LEAD_DONE,
+        Lead.buyer_persona_embedding.isnot(None),
+        Lead.enriched_at >= cutoff
+    ).all()
+    best = {}
+    for key, lead_id, model, enriched_at in rows:
+        rank = (model == embedding_model, enriched_at)
+        if key not in best or rank > best[key][0]:
+            best[key] = (rank, lead_id)
+    return {key: (lead_id, rank[0]) for key, (rank, lead_id) in best.items()}
+
+
+def _find_unchanged_lead(session, key, text_hash, embedding_model):
+    """`(lead_id, same_model)` of a done lead of company `key` enriched from identical page text, or None."""
+    return session.query(Lead.id, Workorder.embedding_model == embedding_model).join(
+        Workorder, Lead.workorder_id == Workorder.id
+    ).filter(
+        Lead.enrichment_key == key,
+        Lead.source_text_hash == text_hash,
+        Lead.enrichment_status == LEAD_DONE,
+        Lead.buyer_persona_embedding.isnot(None)
+    ).order_by((Workorder.embedding_model == embedding_model).desc(), Lead.enriched_at.desc()).first()
+
+
+def _reused_enrichment(session, lead_id, same_model):
+    """Results of lead `lead_id` to copy: page text and persona, plus its embedding when `same_model`."""
+    columns = [Lead.raw_webpage_text, Lead.extraction_stats, Lead.source_text_hash, Lead.buyer_persona]
+    if same_model:
+        columns += [Lead.buyer_persona_embedding, Lead.enriched_at]
+    row = session.query(*columns).filter(Lead.id == lead_id).one()
+    return {column.key: value for column, value in zip(columns, row)}
+
+
+def _enrich_leads(session, workorder_id, concurrency, ingestion_done=None):
+    """Run the scrape, persona and embedding stages for every pending lead.
+
+    Each finished stage is written with its output and stage marker, in
+    commits of ENRICHMENT_COMMIT_EVERY updates or every
+    ENRICHMENT_COMMIT_INTERVAL seconds, so an interrupted job loses at most
+    the uncommitted stage results.
+
+    New leads are enriched once per `enrichment_key`: a lead of a company
+    enriched within ENRICHMENT_REUSE_MAX_AGE copies that lead's results,
+    duplicates within the job wait for the first one and copy its results,
+    and a re-scraped company whose page text is unchanged reuses its
+    earlier persona and embedding.
+    """
+    pending_updates = []
+    # Embeddings to add to the vector index once their rows are committed
+    pending_index = []
+    last_flush = time.monotonic()
+    provider, dimensions = workorder_embedding_provider(session, workorder_id)
+    # enrichment_key -> id of the lead enriching it in this job, and that lead's
+    # {"key", "followers": duplicate lead ids, "fields": its results so far}
+    leaders = {}
+    groups = {}
+
+    def record(lead_update):
+        # Queue a lead's update; a leader's final one is copied to its duplicates
+        pending_updates.append(lead_update)
+        group = groups.get(lead_update["id"])
+        if group is None:
+            return
+        group["fields"].update((k, v) for k, v in lead_update.items() if k != "id")
+        if lead_update.get("enrichment_status") not in (LEAD_DONE, LEAD_FAILED):
+            return
+        del groups[lead_update["id"]]
+        del leaders[group["key"]]
+        fields = group["fields"]
+        for follower_id in group["followers"]:
+            pending_updates.append({**fields, "id": follower_id})
+            if fields["enrichment_status"] == LEAD_DONE:
+                pending_index.append((follower_id, fields["buyer_persona_embedding"]))
+        if group["followers"]:
+            increment('lead_enrichment_reused_total', len(group["followers"]), source='duplicate')
+
+    def reuse(lead_id, source_id, same_model, source, **fields):
+        # Copy an earlier lead's results; without a matching embedding only the embedding stage is left
+        reused = {**_reused_enrichment(session, source_id, same_model), **fields}
+        increment('lead_enrichment_reused_total', source=source)
+        if same_model:
+            record({"id": lead_id, **reused, "enrichment_stage": STAGE_EMBEDDING, "enrichment_status": LEAD_DONE})
+            pending_index.append((lead_id, reused["buyer_persona_embedding"]))
+        else:
+            record({"id": lead_id, **reused, "enrichment_stage": STAGE_PERSONA})
+            embed_buffer.append((lead_id, reused["buyer_persona"]))
+
+    def flush_updates():
+        nonlocal last_flush
+        with span('db.commit', workorder_id):
+            if pending_updates:
+                session.execute(update(Lead), pending_updates)
+                pending_updates.clear()
+            session.commit()
+        embedding_matrix_cache.invalidate(workorder_id)
+        if pending_index:
+            get_vector_index().add(workorder_id, pending_index, provider.model_id)
+            pending_index.clear()
+        last_flush = time.monotonic()
+
+    def pending_leads():
+        # Rows with the reusable earlier lead of their company, looked up a batch at a time
+        for rows in _iter_pending_leads(session, workorder_id, ingestion_done):
+            keys = {row[6] for row in rows if row[2] is None and row[6] is not None}
+            reusable = _find_reusable_leads(session, keys, provider.model_id)
+            for row in rows:
+                yield row, reusable.get(row[6])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        lead_iter = pending_leads()
+        # future -> (lead_id, stage, lead_data) for scrape/persona work, future -> batch for embedding requests
+        in_flight = {}
+        embedding_futures = {}
+        # (lead_id, persona) pairs waiting for the next embedding batch
+        embed_buffer = []
+
+        def submit(fn, *args):
+            # Stage spans on the worker thread are timed under this workorder
+            return executor.submit(in_workorder(workorder_id, fn), *args)
+
+        def submit_next():
+            # Start the next lead that needs scraping or a persona; others are queued or finished inline
+            while True:
+                row, reusable = next(lead_iter, (None, None))
+                if row is None:
+                    return False
+                lead_id, lead_data, stage, stats, raw_text, persona, key = row
+                if stage is None:
+                    if key is not None and key in leaders:
+                        # Same company as a lead in flight: take its results when it finishes
+                        groups[leaders[key]]["followers"].append(lead_id)
+                        continue
+                    if reusable is not None:
+                        reuse(lead_id, *reusable, source='earlier')
+                        continue
+                    if key is not None:
+                        leaders[key] = lead_id
+                        groups[lead_id] = {"key": key, "followers": [], "fields": {}}
+                    in_flight[submit(scrape_lead, lead_data)] = (lead_id, STAGE_SCRAPE, lead_data)
+                    return True
+                if stage == STAGE_SCRAPE:
+                    future = submit(generate_lead_persona, raw_text, lead_data, stats)
+                    in_flight[future] = (lead_id, STAGE_PERSONA, lead_data)
+                    return True
+                if stage == STAGE_PERSONA:
+                    embed_buffer.append((lead_id, persona))
+                else:
+                    # Embedded before the job stopped; only clustering is left
+                    record({"id": lead_id, "enrichment_status": LEAD_DONE})
+
+        def flush_embeddings():
+            if embed_buffer:
+                batch = list(embed_buffer)
+                embed_buffer.clear()
+                future = submit(generate_buyer_persona_embeddings, [persona for _, persona in batch], provider)
+                embedding_futures[future] = batch
+
+        # Keep at most `concurrency` leads in flight so memory stays bounded
+        for _ in range(concurrency):
+            if not submit_next():
+                break
+        while in_flight or embedding_futures or embed_buffer:
+            if not in_flight:
+                # No more scraping to wait for; send the partial batch
+                flush_embeddings()
+            done, _ = wait(
+                set(in_flight) | set(embedding_futures), timeout=ENRICHMENT_COMMIT_INTERVAL,
+                return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                if future in embedding_futures:
+                    batch = embedding_futures.pop(future)
+                    try:
+                        embeddings = future.result()
+                    except Exception as e:
+                        print(e)
+                        traceback.print_exc()
+                        for lead_id, _ in batch:
+                            record(_failure(lead_id, STAGE_EMBEDDING, e))
+                        continue
+                    for (lead_id, _), embedding in zip(batch, embeddings):
+                        if embedding is None:
+                            record(_failure(lead_id, STAGE_EMBEDDING, 'No embedding returned'))
+                            continue
+                        if dimensions is None:
+                            # Provider without declared dimensions: the first vector fixes them
+                            dimensions = len(embedding)
+                            session.query(Workorder).filter(Workorder.id == workorder_id).update(
+                                {Workorder.embedding_dim: dimensions}
+                            )
+                        if len(embedding) != dimensions:
+                            record(_failure(
+                                lead_id, STAGE_EMBEDDING,
+                                f'Embedding has {len(embedding)} dimensions, workorder uses {dimensions}'
+                            ))
+                            continue
+                        embedding_bytes = embedding_to_bytes(embedding)
+                        record({
+                            "id": lead_id,
+                            "buyer_persona_embedding": embedding_bytes,
+                            "enriched_at": datetime.datetime.utcnow(),
+                            "enrichment_stage": STAGE_EMBEDDING,
+                            "enrichment_status": LEAD_DONE,
+                        })
+                        pending_index.append((lead_id, embedding_bytes))
+                    continue
+                lead_id, stage, lead_data = in_flight.pop(future)
+                try:
+                    if stage == STAGE_SCRAPE:
+                        raw_text, extraction_stats = future.result()
+                        text_hash = content_hash(raw_text) if raw_text else None
+                        key = groups[lead_id]["key"] if lead_id in groups else None
+                        unchanged = raw_text and key and _find_unchanged_lead(
+                            session, key, text_hash, provider.model_id
+                        )
+                        if not raw_text:
+                            record(_failure(lead_id, STAGE_SCRAPE, 'No webpage text found'))
+                        elif unchanged:
+                            # Page unchanged since the company was last enriched: keep that persona
+                            reuse(lead_id, *unchanged, source='unchanged_text', raw_webpage_text=raw_text,
+                                  extraction_stats=extraction_stats or None, source_text_hash=text_hash,
+                                  enriched_at=datetime.datetime.utcnow())
+                        else:
+                            record({
+                                "id": lead_id,
+                                "raw_webpage_text": raw_text,
+                                "extraction_stats": extraction_stats or None,
+                                "source_text_hash": text_hash,
+                                "enrichment_stage": STAGE_SCRAPE,
+                            })
+                            # Same lead, next stage: it keeps its slot
+                            next_future = submit(generate_lead_persona, raw_text, lead_data, extraction_stats)
+                            in_flight[next_future] = (lead_id, STAGE_PERSONA, lead_data)
+                            continue
+                    else:
+                        buyer_persona, extraction_stats = future.result()
+                        if not buyer_persona:
+                            record(_failure(lead_id, STAGE_PERSONA, 'No persona generated'))
+                        else:
+                            embed_buffer.append((lead_id, buyer_persona))
+                            record({
+                                "id": lead_id,
+                                "buyer_persona": buyer_persona,
+                                "extraction_stats": extraction_stats or None,
+                                "enrichment_stage": STAGE_PERSONA,
+                            })
+                except Exception as e:
+                    print(e)
+                    traceback.print_exc()
+                    record(_failure(lead_id, stage, e))
+                submit_next()
+            if len(embed_buffer) >= EMBEDDING_BATCH_SIZE:
+                flush_embeddings()
+            if len(pending_updates) >= ENRICHMENT_COMMIT_EVERY or (
+                    pending_updates and time.monotonic() - last_flush >= ENRICHMENT_COMMIT_INTERVAL):
+                flush_updates()
+    flush_updates()
+
+
+def _cluster_leads(session, workorder_id, force_refit=False):
+    # Assigns new leads to the persisted clusters, refitting only on drift unless forced
+    with span('cluster', workorder_id):
+        cluster_workorder(session, workorder_id, force_refit)
+    session.query(Lead).filter(
+        Lead.workorder_id == workorder_id,
+        Lead.enrichment_stage == STAGE_EMBEDDING,
+        Lead.cluster_id.isnot(None)
+    ).update({Lead.enrichment_stage: STAGE_CLUSTER}, synchronize_session=False)
+    session.commit()
+
+
+def _load_stage_timings(session, workorder_id):
+    # Earlier jobs' timings plus anything recorded since (e.g. the upload request)
+    persisted = session.query(Workorder.stage_timings).filter(Workorder.id == workorder_id).scalar()
+    get_metrics().load_workorder(workorder_id, persisted)
+
+
+def _save_stage_timings(session_factory, workorder_id):
+    timings = get_metrics().pop_workorder(workorder_id)
+    if timings is None:
+        return
+    session = session_factory()
+    try:
+        session.query(Workorder).filter(Workorder.id == workorder_id).update({Workorder.stage_timings: timings})
+        session.commit()
+    except Exception as e:
+        print(e)
+        traceback.print_exc()
+        session.rollback()
+    finally:
+        session.close()
+
+
+def run_enrichment_job(workorder_id, session_factory, concurrency=None, ingestion_done=None):
+    """Enrich and cluster all pending leads of a workorder in the background.
+
+    Stage timings are kept in memory while the job runs and saved to the
+    workorder when it ends.
+    """
+    session = session_factory()
+    try:
+        _load_stage_timings(session, workorder_id)
+        _set_workorder_status(session, workorder_id, WORKORDER_ENRICHING)
+        _enrich_leads(session, workorder_id, concurrency or ENRICHMENT_CONCURRENCY, ingestion_done)
+        # Catch up on embeddings committed but never indexed (e.g. by a job that crashed between the two);
+        # from here on the index is complete for this workorder and similarity requests skip the backfill
+        index_workorder_embeddings(session, workorder_id)
+        get_vector_index().mark_backfilled(workorder_id)
+        _set_workorder_status(session, workorder_id, WORKORDER_CLUSTERING)
+        _cluster_leads(session, workorder_id)
+        _set_workorder_status(session, workorder_id, WORKORDER_DONE)
+        return True
+    except Exception as e:
+        print(e)
+        traceback.print_exc()
+        session.rollback()
+        _set_workorder_status(session, workorder_id, WORKORDER_FAILED)
+        return False
+    finally:
+        session.close()
+        _save_stage_timings(session_factory, workorder_id)
+
+
+def _ingest(workorder_id, file_path, session_factory, ingestion_done, errors, skip_rows):
+    session = session_factory()
+    try:
+        ingest_leads(session, workorder_id, file_path, skip_rows=skip_rows)
+    except Exception as e:
+        print(e)
+        traceback.print_exc()
+        session.rollback()
+        errors.append(e)
+    finally:
+        session.close()
+        ingestion_done.set()
+
+
+def _run_workorder_job(workorder_id, file_path, session_factory, concurrency, skip_rows):
+    ingestion_done = threading.Event()
+    errors = []
+    ingest_thread = threading.Thread(
+        target=_ingest, args=(workorder_id, file_path, session_factory, ingestion_done, errors, skip_rows),
+        name=f'ingest-workorder-{workorder_id}', daemon=True
+    )
+    ingest_thread.start()
+    succeeded = run_enrichment_job(workorder_id, session_factory, concurrency, ingestion_done)
+    ingest_thread.join()
+    if succeeded and errors:
+        # Leads read before the error are enriched, but the workorder is incomplete
+        session = session_factory()
+        try:
+            _set_workorder_status(session, workorder_id, WORKORDER_FAILED)
+        finally:
+            session.close()
+
+
+def run_workorder_job(workorder_id, file_path, session_factory, concurrency=None, skip_rows=0):
+    """Stream an uploaded file into leads while enriching them as they arrive.
+
+    The first `skip_rows` rows of the file are assumed to be ingested already.
+    """
+    with _claim_workorder(workorder_id) as claimed:
+        if not claimed:
+            print(f'Workorder {workorder_id} already has a running job')
+            return
+        _run_workorder_job(workorder_id, file_path, session_factory, concurrency, skip_rows)
+
+
+def resume_workorder_job(workorder_id, session_factory, concurrency=None):
+    """Continue an interrupted workorder from where it stopped.
+
+    Rows of the uploaded file that were never ingested are read in, and only
+    leads that have not finished enrichment are processed, each from the
+    stage after its last completed one. Clustering always re-runs, which is
+    cheap when nothing changed.
+    """
+    with _claim_workorder(workorder_id) as claimed:
+        if not claimed:
+            print(f'Workorder {workorder_id} already has a running job')
+            return
+        session = session_factory()
+        try:
+            workorder = session.query(Workorder.status, Workorder.original_file_path).filter(
+                Workorder.id == workorder_id
+            ).first()
+            ingested = session.query(func.count(Lead.id)).filter(Lead.workorder_id == workorder_id).scalar()
+        finally:
+            session.close()
+        if workorder is None:
+            return
+        status, file_path = workorder
+        # Leads are inserted in file order and committed per batch, so the count is the resume point
+        if status != WORKORDER_DONE and file_path and os.path.exists(file_path):
+            _run_workorder_job(workorder_id, file_path, session_factory, concurrency, ingested)
+        else:
+            run_enrichment_job(workorder_id, session_factory, concurrency)
+
+
+def recluster_workorder_job(workorder_id, session_factory):
+    """Refit a workorder's clusters from scratch instead of assigning incrementally.
+
+    The workorder shows as `clustering` meanwhile and gets its previous
+    status back afterwards, whether or not the refit succeeded.
+    """
+    with _claim_workorder(workorder_id) as claimed:
+        if not claimed:
+            print(f'Workorder {workorder_id} already has a running job')
+            return
+        session = session_factory()
+        status = None
+        try:
+            status = session.query(Workorder.status).filter(Workorder.id == workorder_id).scalar()
+            _load_stage_timings(session, workorder_id)
+            _set_workorder_status(session, workorder_id, WORKORDER_CLUSTERING)
+            _cluster_leads(session, workorder_id, force_refit=True)
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+            session.rollback()
+        finally:
+            if status is not None:
+                _set_workorder_status(session, workorder_id, status)
+            session.close()
+            _save_stage_timings(session_factory, workorder_id)
+
+
+def reset_failed_leads(session, workorder_id, stage=None):
+    """Mark failed leads (optionally only those that failed at `stage`) pending again; the caller commits.
+
+    Their completed stages are kept, so a resumed job re-runs only the
+    failed stage onward. Returns the number of leads reset.
+    """
+    query = session.query(Lead).filter(
+        Lead.workorder_id == workorder_id,
+        Lead.enrichment_status == LEAD_FAILED
+    )
+    if stage is not None:
+        query = query.filter(Lead.failed_stage == stage)
+    return query.update({
+        Lead.enrichment_status: LEAD_PENDING,
+        Lead.failed_stage: None,
+        Lead.enrichment_error: None,
+    }, synchronize_session=False)
+
+
+def get_enrichment_progress(session, workorder_id):
+    counts = dict(
+        session.query(Lead.enrichment_status, func.count(Lead.id))
+        .filter(Lead.workorder_id == workorder_id)
+        .group_by(Lead.enrichment_status)
+        .all()
+    )
+    total = sum(counts.values())
+    done = counts.get(LEAD_DONE, 0)
+    failed = counts.get(LEAD_FAILED, 0)
+    stages = dict(
+        session.query(Lead.enrichment_stage, func.count(Lead.id))
+        .filter(Lead.workorder_id == workorder_id, Lead.enrichment_stage.isnot(None))
+        .group_by(Lead.enrichment_stage)
+        .all()
+    )
+    failed_stages = dict(
+        session.query(Lead.failed_stage, func.count(Lead.id))
+        .filter(Lead.workorder_id == workorder_id, Lead.enrichment_status == LEAD_FAILED)
+        .group_by(Lead.failed_stage)
+        .all()
+    )
+    return {
+        "total": total,
+        "done": done,
+        "failed": failed,
+        "pending": total - done - failed,
+        # Leads by last completed stage, and failed leads by the stage that failed
+        "stages": stages,
+        "failed_stages": {str(k): v for k, v in failed_stages.items()},
+        "running": is_job_active(workorder_id),
+    }
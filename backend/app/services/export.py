@@ -0,0 +1,92 @@
+import os
+import csv
+import io
+import tempfile
+import openpyxl
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from models import Lead
+from app.services.ranking import display_order_page
+
+# Leads read from the database per query while exporting
+EXPORT_FETCH_BATCH = int(os.getenv('EXPORT_FETCH_BATCH', '1000'))
+# Bytes of file content buffered before a chunk is sent
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+
+# Enrichment columns appended after the uploaded file's own columns
+EXPORT_COLUMNS = ['buyer_persona', 'cluster_id', 'status', 'rerank_score']
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_data_columns(session, workorder_id):
+    """Columns of the uploaded file, in file order, taken from the workorder's first lead."""
+    data = session.query(Lead.data).filter(Lead.workorder_id == workorder_id).order_by(Lead.id).limit(1).scalar()
+    return list(data or {})
+
+
+def iter_export_leads(session, workorder_id, batch_size=EXPORT_FETCH_BATCH):
+    """Yield `(data, buyer_persona, cluster_id, status, rerank_score)` in display order, a batch per query.
+
+    Pages through the leads with the lead listing's keyset query
+    (display_order_page), so memory is bounded by `batch_size` whatever
+    the workorder size.
+    """
+    after = None
+    while True:
+        query = session.query(
+            Lead.id, Lead.display_order, Lead.data, Lead.buyer_persona, Lead.cluster_id, Lead.status,
+            Lead.rerank_score
+        ).filter(Lead.workorder_id == workorder_id)
+        rows = display_order_page(query, after, batch_size)
+        for row in rows:
+            yield row[2], row[3], row[4], row[5] or 'unchecked', row[6]
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1][1], rows[-1][0])
+
+
+def _export_rows(session, workorder_id, data_columns):
+    yield data_columns + EXPORT_COLUMNS
+    for data, *enrichment in iter_export_leads(session, workorder_id):
+        yield [data.get(column) for column in data_columns] + enrichment
+
+
+def stream_csv(session, workorder_id):
+    """CSV of the workorder as UTF-8 chunks of about EXPORT_CHUNK_BYTES, written as rows are read."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in _export_rows(session, workorder_id, export_data_columns(session, workorder_id)):
+        writer.writerow(['' if value is None else value for value in row])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _xlsx_value(value):
+    # Control characters are not allowed in worksheet XML
+    return ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+
+
+def stream_xlsx(session, workorder_id, chunk_size=EXPORT_CHUNK_BYTES):
+    """XLSX of the workorder, written with a write-only workbook to a temporary file and sent in chunks.
+
+    Rows go straight to disk, so memory stays flat; the file can only be
+    sent once the workbook is complete, as a zip archive needs all parts.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Leads')
+    for row in _export_rows(session, workorder_id, export_data_columns(session, workorder_id)):
+        sheet.append([_xlsx_value(value) for value in row])
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
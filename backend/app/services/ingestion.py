@@ -0,0 +1,142 @@
+import os
+import datetime
+import itertools
+import math
+import numpy as np
+import openpyxl
+import pandas as pd
+from sqlalchemy import insert
+from models import Lead
+from app.utils.cache import normalize_url, normalize_query
+from app.utils.metrics import span
+
+# Rows parsed and inserted per batch
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '1000'))
+
+COMPANY_NAME_KEYS = ["company", "company name", "organisation", "organization", "business", "firm"]
+
+
+def extract_company_name(data):
+    # Try common keys for company name
+    for key in data.keys():
+        if key.lower() in COMPANY_NAME_KEYS:
+            return data[key]
+    # Fallback: first string value
+    for v in data.values():
+        if isinstance(v, str) and v.strip():
+            return v
+    return ""
+
+
+def enrichment_key(data):
+    """Identity of the company a row is enriched from, shared by rows that would scrape the same thing.
+
+    The normalized website (its domain, for homepages) when the row has one,
+    else the normalized company name used for the search fallback; None
+    when there is neither. Uses the same fields as scrape_lead_text. A
+    website too malformed to parse (e.g. `acme.com:abc`) is skipped, as
+    scraping will fall back to the name search for it too.
+    """
+    website = data.get('website') or data.get('Website')
+    if isinstance(website, str) and website.strip():
+        try:
+            return f'url:{normalize_url(website)}'
+        except ValueError:
+            pass
+    company_name = data.get('name') or data.get('Name')
+    if isinstance(company_name, str) and company_name.strip():
+        return f'name:{normalize_query(company_name)}'
+    return None
+
+
+def _clean_value(value):
+    # Keep lead data JSON-serializable: NaN becomes null, dates become ISO strings
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, np.generic):
+        return _clean_value(value.item())
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date, datetime.time)):
+        return None if pd.isna(value) else value.isoformat()
+    return value
+
+
+def _clean_row(row):
+    return {str(k): _clean_value(v) for k, v in row.items()}
+
+
+def iter_csv_rows(path, chunksize=INGEST_BATCH_SIZE):
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        for row in chunk.to_dict('records'):
+            yield _clean_row(row)
+
+
+def _header_names(header):
+    # Match pandas' naming for blank and duplicate header cells
+    names, seen = [], {}
+    for i, cell in enumerate(header):
+        name = str(cell) if cell is not None else f'Unnamed: {i}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def iter_xlsx_rows(path):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = _header_names(header)
+        for values in rows:
+            if values is None or all(v is None for v in values):
+                continue
+            yield _clean_row(dict(zip(names, values)))
+    finally:
+        workbook.close()
+
+
+def iter_lead_rows(path):
+    """Yield each row of an uploaded CSV or Excel file as a dict, without loading the whole file."""
+    lower = path.lower()
+    if lower.endswith('.csv'):
+        return iter_csv_rows(path)
+    if lower.endswith(('.xlsx', '.xlsm')):
+        return iter_xlsx_rows(path)
+    # Legacy formats such as .xls have no streaming reader
+    return (_clean_row(row) for row in pd.read_excel(path).to_dict('records'))
+
+
+def _insert_batch(session, workorder_id, batch):
+    with span('ingest.batch', workorder_id):
+        session.execute(insert(Lead), batch)
+        session.commit()
+
+
+def ingest_leads(session, workorder_id, path, batch_size=INGEST_BATCH_SIZE, skip_rows=0):
+    """Bulk-insert the rows of `path` as pending leads, committing every batch; returns the row count.
+
+    The first `skip_rows` rows are skipped, to resume an interrupted ingestion.
+    """
+    count = 0
+    batch = []
+    for lead_data in itertools.islice(iter_lead_rows(path), skip_rows, None):
+        batch.append({
+            "workorder_id": workorder_id,
+            "data": lead_data,
+            "company_name": extract_company_name(lead_data),
+            "enrichment_key": enrichment_key(lead_data),
+            "enrichment_status": 'pending',
+        })
+        if len(batch) >= batch_size:
+            _insert_batch(session, workorder_id, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        _insert_batch(session, workorder_id, batch)
+        count += len(batch)
+    return count
@@ -1,68 +1,169 @@
 import os
-import requests
 from dotenv import load_dotenv
 import traceback
 from app.utils.web_scraper import extract_text_with_selenium
-from bs4 import BeautifulSoup
+from app.utils.http_client import get_http_fetcher
+from app.utils.cache import get_scrape_cache, normalize_url, normalize_query, PersistentCache, SingleFlight
+import httpx
 import openai
 import re
-import array
-import hdbscan
 import numpy as np
 import json
-from sklearn.decomposition import TruncatedSVD
+import hashlib
+import threading
+from app.services.clustering import fit_cluster_model
+from app.services.embedding_providers import EmbeddingProvider, register_embedding_provider, get_embedding_provider
+from app.utils.embeddings import encode_embedding, decode_embeddings
+from app.utils.metrics import span, record_error, increment
+from app.utils.rate_limit import get_rate_limiter
+from app.utils.text_extraction import extract_main_text, select_informative_text
 
 load_dotenv()
 
 TAVILY_API_KEY = os.getenv('TAVILY_API_KEY', '')
-TAVILY_API_URL = 'https://api.tavily.com/search'
+# Tavily-compatible search endpoint; benchmarks point it at a local fake server
+TAVILY_API_URL = os.getenv('TAVILY_API_URL', 'https://api.tavily.com/search')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 openai.api_key = OPENAI_API_KEY
+# Point the OpenAI client at a compatible endpoint, e.g. a local fake server for benchmarks
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '')
+if OPENAI_BASE_URL:
+    openai.base_url = OPENAI_BASE_URL
+# Retries go through the provider rate limiter (see app.utils.rate_limit), not the SDK's own
+openai.max_retries = 0
 
+PERSONA_MODEL = 'gpt-4o-mini'
+# Default model of the OpenAI embedding provider (see embedding_providers)
+EMBEDDING_MODEL = 'text-embedding-3-small'
+# Personas embedded per OpenAI embeddings request
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '256'))
+# Persona and embedding results are memoized by a hash of the model and inputs
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', './llm_cache.db')
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(30 * 24 * 3600)))
 
-def extract_text_with_bs4(url):
+# The openai module doubles as the default client; tests and benchmarks can swap it
+_openai_client = openai
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+_llm_single_flight = SingleFlight()
+
+
+def set_openai_client(client):
+    """Use `client` (anything with `chat.completions.create` and `embeddings.create`) for LLM calls."""
+    global _openai_client
+    _openai_client = client
+
+
+def get_openai_client():
+    if _openai_client is openai and not OPENAI_API_KEY:
+        return None
+    return _openai_client
+
+
+def get_llm_cache():
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = PersistentCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL)
+    return _llm_cache
+
+
+def set_llm_cache(cache):
+    global _llm_cache
+    with _llm_cache_lock:
+        _llm_cache = cache
+
+
+# OpenAI SDK errors without a response that are worth retrying (connection errors and timeouts)
+OPENAI_TRANSIENT_ERRORS = (openai.APIConnectionError,)
+
+
+def content_hash(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# HTTP statuses that mean the page is gone rather than temporarily failing
+DEAD_PAGE_STATUS_CODES = {404, 410}
+
+
+def _is_dead_page_error(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in DEAD_PAGE_STATUS_CODES
+    return isinstance(error, httpx.ConnectError)
+
+def extract_text_with_bs4(url, stats=None):
+    """Fetch `url` and return its main text, one paragraph per line (see extract_main_text)."""
+    cache = get_scrape_cache()
     try:
-        if not url.startswith('http'):
-            url = f'https://{url}'
-        resp = requests.get(url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        for tag in soup(['script', 'style']):
-            tag.decompose()
-        text = soup.get_text(separator=' ', strip=True)
-        return text
-    except Exception as e:
-        print(e)
-        traceback.print_exc()
+        cache_key = normalize_url(url)
+    except ValueError as e:
+        # Not fetchable either; the caller falls back to searching by name
+        print(f'Unparseable website {url!r}: {e}')
+        record_error('scrape.bs4', e)
         return None
+    found, cached_text = cache.get('page_bs4', cache_key)
+    if found:
+        return cached_text
+    with span('scrape.bs4'):
+        try:
+            if not url.startswith('http'):
+                url = f'https://{url}'
+            resp = get_http_fetcher().get(url, headers={"User-Agent": "Mozilla/5.0"})
+            resp.raise_for_status()
+            text = extract_main_text(resp.text, stats)
+            cache.set('page_bs4', cache_key, text)
+            return text
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+            record_error('scrape.bs4', e)
+            if _is_dead_page_error(e):
+                cache.set_negative('page_bs4', cache_key)
+            return None
 
 def search_company_website(company_name):
     if not TAVILY_API_KEY:
         return None
+    cache = get_scrape_cache()
+    cache_key = normalize_query(company_name)
+    found, cached_url = cache.get('search', cache_key)
+    if found:
+        return cached_url
     payload = {
         "api_key": TAVILY_API_KEY,
         "query": f"{company_name} official website",
         "search_type": "web",
         "num_results": 1
     }
-    try:
-        resp = requests.post(TAVILY_API_URL, json=payload, timeout=10)
+
+    def search():
+        # The limiter retries, so the fetcher must not
+        resp = get_http_fetcher().post(TAVILY_API_URL, json=payload, max_retries=0)
         resp.raise_for_status()
-        data = resp.json()
-        if data.get('results'):
-            return data['results'][0].get('url')
-    except Exception:
-        traceback.print_exc()
+        return resp.json()
+
+    # Errors that outlast the limiter's retries fail the lead's scrape stage rather than passing as "not found"
+    with span('scrape.search'):
+        data = get_rate_limiter('tavily').call(search)
+    if data.get('results'):
+        url = data['results'][0].get('url')
+        if url:
+            cache.set('search', cache_key, url)
+            return url
+    cache.set_negative('search', cache_key)
     return None
 
 def preprocess_webpage_text(text):
     # Remove long continuous spaces and normalize whitespace
     return re.sub(r'\s+', ' ', text).strip()
 
-def generate_buyer_persona_from_text(raw_text, lead_data=None):
-    if not raw_text or not OPENAI_API_KEY:
+def generate_buyer_persona_from_text(raw_text, lead_data=None, stats=None):
+    client = get_openai_client()
+    if not raw_text or client is None:
         return None
-    context = preprocess_webpage_text(raw_text)
+    # Only the most informative paragraphs, within the token budget, go into the prompt
+    context = preprocess_webpage_text(select_informative_text(raw_text, stats=stats))
     data_context = f"Lead Data: {lead_data}\n" if lead_data else ""
     prompt = (
         "Given the following company webpage text and lead data, generate a detailed buyer persona for the company. "
@@ -71,40 +172,115 @@ def generate_buyer_persona_from_text(raw_text, lead_data=None):
         "Do not include any other text in your response other than the JSON.\n\n"
         f"{data_context}Webpage Text: {context}\n\nPersona:"
     )
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": "You are a B2B marketing analyst."},
-                      {"role": "user", "content": prompt}],
-            max_tokens=600,
-            temperature=0.7
-        )
+    messages = [{"role": "system", "content": "You are a B2B marketing analyst."},
+                {"role": "user", "content": prompt}]
+    cache = get_llm_cache()
+    cache_key = content_hash(PERSONA_MODEL, messages, 600, 0.7)
+
+    def complete():
+        with span('persona.openai'):
+            return client.chat.completions.create(
+                model=PERSONA_MODEL,
+                messages=messages,
+                max_tokens=600,
+                temperature=0.7
+            )
+
+    def compute():
+        found, cached_persona = cache.get('persona', cache_key)
+        if found:
+            return cached_persona
+        # Throttling and outages are retried by the limiter; what remains fails the persona stage
+        response = get_rate_limiter('openai').call(complete, transient=OPENAI_TRANSIENT_ERRORS)
         persona = response.choices[0].message.content.strip()
-        return persona.strip("```").strip("json")
-    except Exception as e:
-        print(e)
-        traceback.print_exc()
-        return None
+        persona = persona.strip("```").strip("json")
+        cache.set('persona', cache_key, persona)
+        return persona
 
-def generate_buyer_persona_embedding(persona):
-    if not persona or not OPENAI_API_KEY:
-        return None
-    try:
-        response = openai.embeddings.create(
-            model="text-embedding-3-small",
-            input=persona
-        )
-        embedding = response.data[0].embedding
-        return embedding
-    except Exception as e:
-        print(e)
-        traceback.print_exc()
+    # Identical prompts in flight at the same time share one completion
+    return _llm_single_flight.do(('persona', cache_key), compute)
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI embeddings API, in batched requests.
+
+    Results are memoized by (model, text), and duplicate texts are only sent once.
+    """
+
+    name = 'openai'
+    KNOWN_DIMENSIONS = {'text-embedding-3-small': 1536, 'text-embedding-3-large': 3072, 'text-embedding-ada-002': 1536}
+
+    def __init__(self, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE):
+        super().__init__(model)
+        self.batch_size = batch_size
+
+    @property
+    def dimensions(self):
+        return self.KNOWN_DIMENSIONS.get(self.model)
+
+    def embed(self, personas):
+        client = get_openai_client()
+        embeddings = [None] * len(personas)
+        if client is None:
+            return embeddings
+        cache = get_llm_cache()
+        # Map each distinct uncached text to the positions that need it
+        missing = {}
+        for i, persona in enumerate(personas):
+            if not persona:
+                continue
+            cache_key = content_hash(self.model, persona)
+            if persona in missing:
+                missing[persona][1].append(i)
+                continue
+            found, cached_bytes = cache.get('embedding', cache_key)
+            if found and cached_bytes is not None:
+                embeddings[i] = np.frombuffer(cached_bytes, dtype=np.float32)
+            else:
+                missing[persona] = (cache_key, [i])
+        texts = list(missing)
+        limiter = get_rate_limiter('openai')
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+
+            def create():
+                with span('embedding.openai'):
+                    return client.embeddings.create(
+                        model=self.model,
+                        input=batch
+                    )
+
+            # A batch that still fails after the limiter's retries fails the embedding stage;
+            # batches embedded before it are cached, so a retry only sends the rest
+            response = limiter.call(create, transient=OPENAI_TRANSIENT_ERRORS)
+            for item in response.data:
+                text = batch[item.index]
+                cache_key, positions = missing[text]
+                embedding = np.asarray(item.embedding, dtype=np.float32)
+                cache.set('embedding', cache_key, embedding.tobytes())
+                for i in positions:
+                    embeddings[i] = embedding
+        return embeddings
+
+
+register_embedding_provider('openai', OpenAIEmbeddingProvider)
+
+
+def generate_buyer_persona_embeddings(personas, provider=None):
+    """Embed many personas in batches; returns one float32 array (or None) per persona.
+
+    Uses `provider` (an EmbeddingProvider), by default the configured one.
+    """
+    with span('embedding'):
+        return (provider or get_embedding_provider()).embed(personas)
+
+def generate_buyer_persona_embedding(persona, provider=None):
+    if not persona:
         return None
+    return generate_buyer_persona_embeddings([persona], provider)[0]
 
 def embedding_to_bytes(embedding):
-    if embedding is None:
-        return None
-    return array.array('f', embedding).tobytes()
+    # Stored in the EMBEDDING_STORAGE format; read back with decode_embedding
+    return encode_embedding(embedding)
 
 def filter_persona_json(persona_str):
     try:
@@ -116,65 +292,74 @@ def filter_persona_json(persona_str):
 
 def cluster_lead_embeddings(embeddings_bytes_list):
     # Convert bytes to numpy arrays
-    embeddings = []
-    for emb_bytes in embeddings_bytes_list:
-        if emb_bytes:
-            arr = np.frombuffer(emb_bytes, dtype=np.float32)
-            embeddings.append(arr)
+    embeddings = [emb_bytes for emb_bytes in embeddings_bytes_list if emb_bytes]
     if not embeddings:
         return []
-    embeddings = np.stack(embeddings)
-    # SVD dimensionality reduction to 32 features
-    if embeddings.shape[0] > 32:
-        svd = TruncatedSVD(n_components=32, random_state=42)
-        reduced = svd.fit_transform(embeddings)
-    else:
-        reduced = embeddings[:, :32] if embeddings.shape[1] > 32 else embeddings
-    # HDBSCAN clustering
-    clusterer = hdbscan.HDBSCAN(min_cluster_size=2)
-    labels = clusterer.fit_predict(reduced)
-    max_label = max(labels)
-    new_labels = []
-    for i in labels:
-        if i == -1:
-            new_labels.append(max_label + 1)
-            max_label += 1
-        else:
-            new_labels.append(i)
-    return new_labels
+    _, labels = fit_cluster_model(decode_embeddings(embeddings))
+    return labels
 
-def process_lead(lead_data):
+def scrape_lead_text(lead_data, stats=None):
     # lead_data: dict, expects at least company name and maybe website
+    # stats: optional dict that collects extraction sizes and parse time
     website = lead_data.get('website') or lead_data.get('Website')
     raw_text = None
-    if website:
-        text = extract_text_with_bs4(website)
+    # Which fallback produced the text: bs4, selenium, search_bs4, search_selenium or none
+    path = 'none'
+    # Empty spreadsheet cells arrive as NaN floats rather than strings
+    if isinstance(website, str) and website.strip():
+        text = extract_text_with_bs4(website, stats)
         if text and len(text.split()) >= 25:
-            raw_text = text
+            raw_text, path = text, 'bs4'
         else:
-            text_selenium = extract_text_with_selenium(website)
+            text_selenium = extract_text_with_selenium(website, stats=stats)
             if text_selenium:
-                raw_text = text_selenium
+                raw_text, path = text_selenium, 'selenium'
     # If no website or failed to scrape, try TavilySearch
     if not raw_text:
         company_name = lead_data.get('name') or lead_data.get('Name')
-        if company_name:
+        if isinstance(company_name, str) and company_name.strip():
             found_url = search_company_website(company_name)
             if found_url:
-                text = extract_text_with_bs4(found_url)
+                text = extract_text_with_bs4(found_url, stats)
                 if text and len(text.split()) >= 25:
-                    raw_text = text
+                    raw_text, path = text, 'search_bs4'
                 else:
-                    text_selenium = extract_text_with_selenium(found_url)
+                    text_selenium = extract_text_with_selenium(found_url, stats=stats)
                     if text_selenium:
-                        raw_text = text_selenium
-    # Generate persona if we have raw_text
+                        raw_text, path = text_selenium, 'search_selenium'
+    increment('lead_scrape_path_total', path=path)
+    return raw_text
+
+def scrape_lead(lead_data):
+    """Scrape stage: `(raw_text, extraction_stats)` for one lead (website first, then search)."""
+    stats = {}
+    with span('scrape'):
+        return scrape_lead_text(lead_data, stats), stats
+
+def generate_lead_persona(raw_text, lead_data, stats=None):
+    """Persona stage: `(buyer_persona, extraction_stats)` with prompt sizes added to the stats."""
+    stats = dict(stats or {})
+    with span('persona'):
+        persona_raw = generate_buyer_persona_from_text(raw_text, lead_data, stats)
+    return (filter_persona_json(persona_raw) if persona_raw else None), stats
+
+def process_lead_text(lead_data):
+    """Scrape and generate the persona for one lead; embeddings are batched separately.
+
+    Returns `(raw_text, buyer_persona, extraction_stats)`, where the stats
+    dict holds HTML size, parse time and page/prompt sizes (None if nothing
+    was scraped).
+    """
+    raw_text, stats = scrape_lead(lead_data)
     buyer_persona = None
-    buyer_persona_embedding = None
     if raw_text:
-        persona_raw = generate_buyer_persona_from_text(raw_text, lead_data)
-        buyer_persona = filter_persona_json(persona_raw) if persona_raw else None
-        if buyer_persona:
-            embedding = generate_buyer_persona_embedding(buyer_persona)
-            buyer_persona_embedding = embedding_to_bytes(embedding) if embedding else None
-    return raw_text, buyer_persona, buyer_persona_embedding 
\ No newline at end of file
+        buyer_persona, stats = generate_lead_persona(raw_text, lead_data, stats)
+    return raw_text, buyer_persona, stats or None
+
+def process_lead(lead_data, provider=None):
+    raw_text, buyer_persona, _ = process_lead_text(lead_data)
+    buyer_persona_embedding = None
+    if buyer_persona:
+        embedding = generate_buyer_persona_embedding(buyer_persona, provider)
+        buyer_persona_embedding = embedding_to_bytes(embedding) if embedding is not None else None
+    return raw_text, buyer_persona, buyer_persona_embedding
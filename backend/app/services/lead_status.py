@@ -0,0 +1,61 @@
+import os
+from collections import defaultdict
+from sqlalchemy import update
+from models import Lead
+
+LEAD_STATUSES = ['unchecked', 'converted', 'failed', 'in-progress']
+# Lead ids bound per UPDATE statement, well below SQLite's variable limit
+STATUS_UPDATE_CHUNK = int(os.getenv('STATUS_UPDATE_CHUNK', '5000'))
+
+
+def _resolve_lead_ids(session, workorder_id, keys, key):
+    """Map each key to a lead id of the workorder, with one query; unknown keys are dropped.
+
+    With `key='index'` the keys are positions in the workorder's id-ordered
+    lead list, as the spreadsheet rows were uploaded; with `key='id'` they
+    are lead ids.
+    """
+    if key == 'index':
+        lead_ids = [row[0] for row in session.query(Lead.id).filter(
+            Lead.workorder_id == workorder_id
+        ).order_by(Lead.id).all()]
+        return {k: lead_ids[k] for k in keys if 0 <= k < len(lead_ids)}
+    existing = set()
+    for start in range(0, len(keys), STATUS_UPDATE_CHUNK):
+        chunk = keys[start:start + STATUS_UPDATE_CHUNK]
+        existing.update(row[0] for row in session.query(Lead.id).filter(
+            Lead.workorder_id == workorder_id, Lead.id.in_(chunk)
+        ))
+    return {k: k for k in keys if k in existing}
+
+
+def apply_status_updates(session, workorder_id, status_updates, key='index'):
+    """Set many lead statuses with one UPDATE per distinct status; the caller commits.
+
+    `status_updates` maps a lead index or id (see `key`) to a status. Entries
+    with an invalid status or an unknown lead are skipped. Returns the
+    applied updates as a list of `(key, lead_id, status)` in input order.
+    """
+    parsed = []
+    for raw_key, status in status_updates.items():
+        if status not in LEAD_STATUSES:
+            continue
+        try:
+            parsed.append((int(raw_key), status))
+        except (TypeError, ValueError):
+            continue
+    resolved = _resolve_lead_ids(session, workorder_id, [k for k, _ in parsed], key)
+    applied = [(k, resolved[k], status) for k, status in parsed if k in resolved]
+
+    ids_by_status = defaultdict(list)
+    for _, lead_id, status in applied:
+        ids_by_status[status].append(lead_id)
+    for status, lead_ids in ids_by_status.items():
+        for start in range(0, len(lead_ids), STATUS_UPDATE_CHUNK):
+            session.execute(
+                update(Lead)
+                .where(Lead.workorder_id == workorder_id, Lead.id.in_(lead_ids[start:start + STATUS_UPDATE_CHUNK]))
+                .values(status=status)
+                .execution_options(synchronize_session=False)
+            )
+    return applied
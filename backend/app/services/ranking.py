@@ -0,0 +1,241 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import update, or_, and_
+from models import Lead
+from app.services.embedding_store import load_workorder_embeddings, invalidate_workorder_embeddings
+
+# Upper bound on similarity-matrix elements computed at once (float32), ~64MB by default
+RERANK_BLOCK_ELEMENTS = int(os.getenv('RERANK_BLOCK_ELEMENTS', str(16 * 1024 * 1024)))
+# Number of workorders whose normalized embedding matrices are kept in memory
+RERANK_CACHE_WORKORDERS = int(os.getenv('RERANK_CACHE_WORKORDERS', '8'))
+
+# Statuses grouped after the unchecked leads, in display order
+RERANK_STATUS_GROUPS = ['converted', 'in-progress', 'failed']
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row; all-zero rows stay zero so their similarity is 0."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_similarity(queries, targets, k=1, block_elements=RERANK_BLOCK_ELEMENTS):
+    """Top-k cosine similarities of each normalized query row against normalized target rows.
+
+    Returns `(indices, scores)`, each shaped (len(queries), k) and sorted by
+    descending score. The similarity matrix is computed in blocks so memory
+    stays bounded by `block_elements` regardless of the set sizes.
+    """
+    n_queries, n_targets = len(queries), len(targets)
+    k = min(k, n_targets)
+    indices = np.zeros((n_queries, k), dtype=np.int64)
+    scores = np.zeros((n_queries, k), dtype=np.float32)
+    if n_queries == 0 or k == 0:
+        return indices, scores
+    target_block = min(n_targets, block_elements)
+    query_block = max(1, block_elements // target_block)
+    for q_start in range(0, n_queries, query_block):
+        q = queries[q_start:q_start + query_block]
+        best_scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((len(q), k), dtype=np.int64)
+        for t_start in range(0, n_targets, target_block):
+            sims = q @ targets[t_start:t_start + target_block].T
+            # Merge this block's candidates with the best seen so far
+            cand_scores = np.concatenate([best_scores, sims], axis=1)
+            cand_indices = np.concatenate([
+                best_indices,
+                np.broadcast_to(np.arange(t_start, t_start + sims.shape[1]), sims.shape)
+            ], axis=1)
+            if k == 1:
+                top = np.argmax(cand_scores, axis=1)[:, None]
+            else:
+                top = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(cand_scores, top, axis=1)
+            best_indices = np.take_along_axis(cand_indices, top, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        scores[q_start:q_start + len(q)] = np.take_along_axis(best_scores, order, axis=1)
+        indices[q_start:q_start + len(q)] = np.take_along_axis(best_indices, order, axis=1)
+    return indices, scores
+
+
+def max_similarity(queries, targets, block_elements=RERANK_BLOCK_ELEMENTS):
+    """Highest cosine similarity of each normalized query row to any target row (0 if no targets)."""
+    if len(targets) == 0:
+        return np.zeros(len(queries), dtype=np.float32)
+    _, scores = top_k_similarity(queries, targets, k=1, block_elements=block_elements)
+    return scores[:, 0]
+
+
+class WorkorderEmbeddings:
+    """Normalized embedding matrix of one workorder plus incremental converted-set scores."""
+
+    def __init__(self, ids, matrix):
+        self.ids = ids
+        self.matrix = matrix
+        self.lock = threading.Lock()
+        self._converted_rows = None
+        self._best_score = None
+        self._best_row = None
+
+    def converted_similarity(self, converted_rows, block_elements=RERANK_BLOCK_ELEMENTS):
+        """Best cosine similarity of every row to any row in `converted_rows` (0 if empty).
+
+        Scores are kept between calls and only the change in the converted set
+        is recomputed, so a status click costs O(N) instead of O(N*C).
+        """
+        converted_rows = np.asarray(sorted(converted_rows), dtype=np.int64)
+        with self.lock:
+            if len(converted_rows) == 0:
+                return np.zeros(len(self.ids), dtype=np.float32)
+            previous = self._converted_rows
+            if previous is None or len(previous) == 0:
+                added, removed = converted_rows, np.zeros(0, dtype=np.int64)
+                self._best_score = np.full(len(self.ids), -np.inf, dtype=np.float32)
+                self._best_row = np.full(len(self.ids), -1, dtype=np.int64)
+            else:
+                added = np.setdiff1d(converted_rows, previous)
+                removed = np.setdiff1d(previous, converted_rows)
+            if len(added):
+                idx, scores = top_k_similarity(self.matrix, self.matrix[added], 1, block_elements)
+                better = scores[:, 0] > self._best_score
+                self._best_score[better] = scores[better, 0]
+                self._best_row[better] = added[idx[better, 0]]
+            if len(removed):
+                # Rows whose best match left the converted set need a full rescan
+                stale = np.flatnonzero(np.isin(self._best_row, removed))
+                if len(stale):
+                    idx, scores = top_k_similarity(self.matrix[stale], self.matrix[converted_rows], 1, block_elements)
+                    self._best_score[stale] = scores[:, 0]
+                    self._best_row[stale] = converted_rows[idx[:, 0]]
+            self._converted_rows = converted_rows
+            return self._best_score.copy()
+
+
+class EmbeddingMatrixCache:
+    """In-process cache of each workorder's normalized embedding matrix.
+
+    Entries are loaded once (from the workorder's memory-mapped side file when
+    present) and reused until `invalidate` is called, which the enrichment job
+    does whenever it writes embeddings for the workorder.
+    """
+
+    def __init__(self, max_workorders=RERANK_CACHE_WORKORDERS):
+        self.max_workorders = max_workorders
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session, workorder_id):
+        with self._lock:
+            entry = self._entries.get(workorder_id)
+            if entry is not None:
+                self._entries.move_to_end(workorder_id)
+                return entry
+        ids, matrix = load_workorder_embeddings(session, workorder_id)
+        entry = WorkorderEmbeddings(ids, normalize_rows(matrix))
+        with self._lock:
+            self._entries[workorder_id] = entry
+            self._entries.move_to_end(workorder_id)
+            while len(self._entries) > self.max_workorders:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, workorder_id):
+        with self._lock:
+            self._entries.pop(workorder_id, None)
+        invalidate_workorder_embeddings(workorder_id)
+
+
+embedding_matrix_cache = EmbeddingMatrixCache()
+
+
+def _embedded_rows(session, workorder_id, lead_ids):
+    """Cached embeddings of a workorder and the position of each embedded lead in `lead_ids`."""
+    entry = embedding_matrix_cache.get(session, workorder_id)
+    positions = np.searchsorted(lead_ids, entry.ids)
+    if len(entry.ids) and (positions.max() >= len(lead_ids) or not np.array_equal(lead_ids[positions], entry.ids)):
+        # A cached lead no longer exists; reload from the database
+        embedding_matrix_cache.invalidate(workorder_id)
+        entry = embedding_matrix_cache.get(session, workorder_id)
+        positions = np.searchsorted(lead_ids, entry.ids)
+    return entry, positions
+
+
+def rerank_workorder(session, workorder_id):
+    """Order unchecked leads by their best similarity to any converted lead.
+
+    Unchecked leads come first, most similar first, followed by converted,
+    in-progress and failed leads in their previous display order. Leads
+    without an embedding keep their display_order. The similarity is kept as
+    `rerank_score` of unchecked leads (None for the others). Changed orders
+    and scores are written in one bulk UPDATE; the caller commits. Returns
+    the new order as a list of `(lead_id, status, display_order)`.
+    """
+    rows = session.query(Lead.id, Lead.status, Lead.display_order, Lead.rerank_score).filter(
+        Lead.workorder_id == workorder_id
+    ).order_by(Lead.id).all()
+    if not rows:
+        return []
+    lead_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    entry, positions = _embedded_rows(session, workorder_id, lead_ids)
+    if len(positions) == 0:
+        return []
+    # Everything below is indexed by row of the cached embedding matrix
+    statuses = np.array([rows[p][1] or 'unchecked' for p in positions.tolist()], dtype=object)
+    display_orders = np.array(
+        [rows[p][2] if rows[p][2] is not None else 99999 for p in positions.tolist()], dtype=np.int64
+    )
+    unchecked_rows = np.flatnonzero(statuses == 'unchecked')
+    converted_rows = np.flatnonzero(statuses == 'converted')
+
+    scores = entry.converted_similarity(converted_rows)[unchecked_rows]
+    # Rounded so unchanged scores compare equal to the stored ones and are not rewritten
+    score_by_row = dict(zip(unchecked_rows.tolist(), np.round(scores.astype(np.float64), 6).tolist()))
+    # Stable sorts keep id order among equal scores and equal display orders
+    order_parts = [unchecked_rows[np.argsort(-scores, kind='stable')]]
+    for group in RERANK_STATUS_GROUPS:
+        group_rows = np.flatnonzero(statuses == group)
+        order_parts.append(group_rows[np.argsort(display_orders[group_rows], kind='stable')])
+    new_order = np.concatenate(order_parts).tolist()
+
+    result = []
+    changed = []
+    for order, i in enumerate(new_order):
+        lead_id, status, previous_order, previous_score = rows[positions[i]]
+        score = score_by_row.get(i)
+        result.append((lead_id, status, order))
+        values = {}
+        if previous_order != order:
+            values["display_order"] = order
+        if previous_score != score:
+            values["rerank_score"] = score
+        if values:
+            changed.append({"id": lead_id, **values})
+    if changed:
+        session.execute(update(Lead), changed)
+    return result
+
+
+def display_order_page(query, after=None, limit=None):
+    """Rows of a Lead `query` in display order (display_order NULLS LAST, then id), after the key `after`.
+
+    The query must select Lead.id and Lead.display_order first; `after` is
+    the `(display_order, id)` of the last row of the previous page. Keyset
+    pagination, so every page is an index range scan however deep it is.
+    Shared by the lead listing and the export so both walk leads alike.
+    """
+    if after is not None:
+        after_order, after_id = after
+        if after_order is None:
+            query = query.filter(Lead.display_order.is_(None), Lead.id > after_id)
+        else:
+            query = query.filter(or_(
+                Lead.display_order > after_order,
+                and_(Lead.display_order == after_order, Lead.id > after_id),
+                Lead.display_order.is_(None)
+            ))
+    query = query.order_by(Lead.display_order.asc().nullslast(), Lead.id.asc())
+    return (query.limit(limit) if limit is not None else query).all()
@@ -0,0 +1,412 @@
+import os
+import sqlite3
+import threading
+import traceback
+import numpy as np
+from sqlalchemy import func
+from sklearn.cluster import MiniBatchKMeans
+from models import Lead, Workorder
+from app.services.ranking import normalize_rows, top_k_similarity, embedding_matrix_cache
+from app.utils.embeddings import decode_embedding
+from app.services.embedding_providers import LEGACY_EMBEDDING_MODEL
+
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', './vector_index.db')
+# Scopes with at most this many vectors are searched exactly instead of through the IVF lists
+VECTOR_INDEX_EXACT_THRESHOLD = int(os.getenv('VECTOR_INDEX_EXACT_THRESHOLD', '5000'))
+# Number of nearest IVF lists scanned per query
+VECTOR_INDEX_NPROBE = int(os.getenv('VECTOR_INDEX_NPROBE', '8'))
+# Retrain a scope's centroids once it has grown by this factor since the last training
+VECTOR_INDEX_RETRAIN_GROWTH = float(os.getenv('VECTOR_INDEX_RETRAIN_GROWTH', '2.0'))
+VECTOR_INDEX_MAX_LISTS = 1024
+VECTOR_INDEX_TRAINING_SAMPLE = 50000
+# Vectors read and reassigned at a time when a scope is retrained
+VECTOR_INDEX_TRAIN_CHUNK = 10000
+
+GLOBAL_SCOPE = 'global'
+
+
+def workorder_scope(workorder_id):
+    return f'workorder:{workorder_id}'
+
+
+def global_scope(embedding_model):
+    """All workorders embedded with `embedding_model`; vectors of other models are never compared."""
+    return f'{GLOBAL_SCOPE}:{embedding_model}'
+
+
+def is_global_scope(scope):
+    return scope.startswith(GLOBAL_SCOPE + ':')
+
+
+class VectorIndex:
+    """On-disk inverted-file (IVF) index over lead persona embeddings.
+
+    Every vector belongs to two scopes: its workorder and the global scope
+    across all workorders embedded with the same model. Each scope is partitioned into lists around
+    k-means centroids once it outgrows `exact_threshold`; a query scans the
+    `nprobe` nearest lists and rescores the candidates exactly. Small scopes
+    are always searched by brute force. Vectors are added incrementally and
+    assigned to the nearest existing centroid until the scope is retrained,
+    which happens on a background thread so adding never waits for k-means.
+    """
+
+    def __init__(self, path=VECTOR_INDEX_PATH, exact_threshold=VECTOR_INDEX_EXACT_THRESHOLD,
+                 nprobe=VECTOR_INDEX_NPROBE, retrain_growth=VECTOR_INDEX_RETRAIN_GROWTH):
+        self.path = path
+        self.exact_threshold = exact_threshold
+        self.nprobe = nprobe
+        self.retrain_growth = retrain_growth
+        self._lock = threading.RLock()
+        self._centroids = {}
+        # Background training thread per scope, and the lead ids added to a scope while it trains
+        self._training = {}
+        self._changed = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS vectors ('
+            ' lead_id INTEGER PRIMARY KEY,'
+            ' workorder_id INTEGER NOT NULL,'
+            ' vector BLOB NOT NULL,'
+            ' global_list INTEGER,'
+            ' workorder_list INTEGER,'
+            ' embedding_model TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_vectors_workorder_list ON vectors (workorder_id, workorder_list);'
+            'CREATE TABLE IF NOT EXISTS centroids ('
+            ' scope TEXT NOT NULL,'
+            ' list_id INTEGER NOT NULL,'
+            ' centroid BLOB NOT NULL,'
+            ' PRIMARY KEY (scope, list_id));'
+            'CREATE TABLE IF NOT EXISTS scopes ('
+            ' scope TEXT PRIMARY KEY,'
+            ' trained_count INTEGER NOT NULL);'
+            # Workorders whose leads were all indexed once; enrichment adds their new embeddings as it commits
+            'CREATE TABLE IF NOT EXISTS backfilled_workorders ('
+            ' workorder_id INTEGER PRIMARY KEY);'
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(vectors)')}
+        if 'embedding_model' not in columns:
+            # Index files from before pluggable embedding providers hold only OpenAI vectors
+            self._conn.execute(
+                f"ALTER TABLE vectors ADD COLUMN embedding_model TEXT NOT NULL DEFAULT '{LEGACY_EMBEDDING_MODEL}'"
+            )
+            self._conn.execute('DROP INDEX IF EXISTS ix_vectors_global_list')
+            for table in ('centroids', 'scopes'):
+                self._conn.execute(f'DELETE FROM {table} WHERE scope = ?', (GLOBAL_SCOPE,))
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_vectors_model_global_list ON vectors (embedding_model, global_list)'
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _scope_filter(scope):
+        if is_global_scope(scope):
+            return 'global_list', 'embedding_model = ?', (scope.split(':', 1)[1],)
+        return 'workorder_list', 'workorder_id = ?', (int(scope.split(':', 1)[1]),)
+
+    def _load_centroids(self, scope):
+        if scope not in self._centroids:
+            rows = self._conn.execute(
+                'SELECT centroid FROM centroids WHERE scope = ? ORDER BY list_id', (scope,)
+            ).fetchall()
+            self._centroids[scope] = np.stack([np.frombuffer(r[0], dtype=np.float32) for r in rows]) if rows else None
+        return self._centroids[scope]
+
+    def _assign(self, scope, vectors):
+        centroids = self._load_centroids(scope)
+        if centroids is None:
+            return [None] * len(vectors)
+        indices, _ = top_k_similarity(vectors, centroids, 1)
+        return indices[:, 0].tolist()
+
+    def count(self, scope):
+        _, where, params = self._scope_filter(scope)
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM vectors WHERE {where}', params).fetchone()[0]
+
+    def add(self, workorder_id, items, embedding_model):
+        """Insert or replace `(lead_id, embedding)` pairs of one workorder embedded with `embedding_model`."""
+        items = [(lead_id, embedding) for lead_id, embedding in items if embedding is not None]
+        if not items:
+            return
+        vectors = normalize_rows(np.stack([
+            decode_embedding(e) if isinstance(e, (bytes, bytearray)) else np.asarray(e, dtype=np.float32)
+            for _, e in items
+        ]))
+        scope = workorder_scope(workorder_id)
+        model_scope = global_scope(embedding_model)
+        with self._lock:
+            global_lists = self._assign(model_scope, vectors)
+            workorder_lists = self._assign(scope, vectors)
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO vectors '
+                '(lead_id, workorder_id, vector, global_list, workorder_list, embedding_model) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (lead_id, workorder_id, vector.tobytes(), g, w, embedding_model)
+                    for (lead_id, _), vector, g, w in zip(items, vectors, global_lists, workorder_lists)
+                ]
+            )
+            self._conn.commit()
+            for s in (scope, model_scope):
+                if s in self._changed:
+                    self._changed[s].update(lead_id for lead_id, _ in items)
+                self._maybe_train(s)
+
+    def backfilled_workorders(self):
+        with self._lock:
+            return {r[0] for r in self._conn.execute('SELECT workorder_id FROM backfilled_workorders')}
+
+    def mark_backfilled(self, workorder_id):
+        with self._lock:
+            self._conn.execute('INSERT OR IGNORE INTO backfilled_workorders (workorder_id) VALUES (?)', (workorder_id,))
+            self._conn.commit()
+
+    def indexed_lead_ids(self, workorder_id):
+        with self._lock:
+            rows = self._conn.execute('SELECT lead_id FROM vectors WHERE workorder_id = ?', (workorder_id,)).fetchall()
+        return {r[0] for r in rows}
+
+    def get_vectors(self, lead_ids):
+        """Normalized vectors for `lead_ids`, as `(found_ids, matrix)`."""
+        lead_ids = list(lead_ids)
+        found_ids, vectors = [], []
+        with self._lock:
+            # Chunk to stay under SQLite's bound-parameter limit
+            for start in range(0, len(lead_ids), 900):
+                chunk = lead_ids[start:start + 900]
+                rows = self._conn.execute(
+                    f'SELECT lead_id, vector FROM vectors WHERE lead_id IN ({",".join("?" * len(chunk))})', chunk
+                ).fetchall()
+                for lead_id, blob in rows:
+                    found_ids.append(lead_id)
+                    vectors.append(np.frombuffer(blob, dtype=np.float32))
+        matrix = np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return found_ids, matrix
+
+    def _maybe_train(self, scope):
+        # Called with the lock held
+        thread = self._training.get(scope)
+        if thread is not None and thread.is_alive():
+            return
+        count = self.count(scope)
+        if count <= self.exact_threshold:
+            return
+        row = self._conn.execute('SELECT trained_count FROM scopes WHERE scope = ?', (scope,)).fetchone()
+        if row is None or count >= row[0] * self.retrain_growth:
+            thread = threading.Thread(target=self._train_in_background, args=(scope,), daemon=True)
+            self._training[scope] = thread
+            thread.start()
+
+    def _train_in_background(self, scope):
+        try:
+            self.train(scope)
+        except Exception as e:
+            print(f"Error training vector index scope {scope}: {e}")
+            traceback.print_exc()
+            return
+        with self._lock:
+            # Catch up with whatever was added while this training ran
+            self._training.pop(scope, None)
+            self._maybe_train(scope)
+
+    def wait_for_training(self):
+        """Block until background training, including any follow-up retraining, has finished."""
+        while True:
+            with self._lock:
+                threads = [t for t in self._training.values() if t.is_alive()]
+            if not threads:
+                return
+            for thread in threads:
+                thread.join()
+
+    def train(self, scope):
+        """Fit k-means centroids for a scope and reassign its vectors to lists.
+
+        The fit uses a random sample of at most VECTOR_INDEX_TRAINING_SAMPLE
+        vectors drawn in SQL, and the scope is reassigned a chunk at a time,
+        so memory stays bounded however large the scope is. The lock is only
+        held to read each chunk and to install the result; vectors added in
+        the meantime are reassigned when it is installed.
+        """
+        list_column, where, params = self._scope_filter(scope)
+        with self._lock:
+            count = self._conn.execute(f'SELECT COUNT(*) FROM vectors WHERE {where}', params).fetchone()[0]
+            if not count:
+                return
+            rows = self._conn.execute(
+                f'SELECT vector FROM vectors WHERE {where} ORDER BY random() LIMIT ?',
+                params + (VECTOR_INDEX_TRAINING_SAMPLE,)
+            ).fetchall()
+            self._changed[scope] = set()
+        try:
+            sample = np.stack([np.frombuffer(r[0], dtype=np.float32) for r in rows])
+            del rows
+            n_lists = int(min(VECTOR_INDEX_MAX_LISTS, len(sample), max(1, np.sqrt(count))))
+            kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=0, n_init=1, batch_size=4096)
+            kmeans.fit(sample)
+            centroids = normalize_rows(kmeans.cluster_centers_)
+            # (lead ids, list ids) per chunk, keyed through the scope in lead_id order
+            assignments = []
+            last_id = None
+            while True:
+                with self._lock:
+                    chunk = self._conn.execute(
+                        f'SELECT lead_id, vector FROM vectors WHERE {where} AND lead_id > ? '
+                        'ORDER BY lead_id LIMIT ?',
+                        params + (-1 if last_id is None else last_id, VECTOR_INDEX_TRAIN_CHUNK)
+                    ).fetchall()
+                if not chunk:
+                    break
+                matrix = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in chunk])
+                indices, _ = top_k_similarity(matrix, centroids, 1)
+                assignments.append(([r[0] for r in chunk], indices[:, 0].tolist()))
+                last_id = chunk[-1][0]
+            with self._lock:
+                changed = self._changed.pop(scope)
+                # Added or replaced after their chunk was read, and assigned against the old centroids
+                if changed:
+                    changed_ids, matrix = self.get_vectors(changed)
+                    if changed_ids:
+                        indices, _ = top_k_similarity(matrix, centroids, 1)
+                        assignments.append((changed_ids, indices[:, 0].tolist()))
+                self._conn.execute('DELETE FROM centroids WHERE scope = ?', (scope,))
+                self._conn.executemany(
+                    'INSERT INTO centroids (scope, list_id, centroid) VALUES (?, ?, ?)',
+                    [(scope, i, c.tobytes()) for i, c in enumerate(centroids)]
+                )
+                for lead_ids, list_ids in assignments:
+                    self._conn.executemany(
+                        f'UPDATE vectors SET {list_column} = ? WHERE lead_id = ?', zip(list_ids, lead_ids)
+                    )
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO scopes (scope, trained_count) VALUES (?, ?)', (scope, count)
+                )
+                self._conn.commit()
+                self._centroids[scope] = centroids
+        finally:
+            with self._lock:
+                self._changed.pop(scope, None)
+
+    def search(self, query, k, scope, exclude_ids=()):
+        """Top-k most similar leads as `(lead_id, workorder_id, score)`, best first."""
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))
+        list_column, where, params = self._scope_filter(scope)
+        with self._lock:
+            centroids = self._load_centroids(scope)
+            if centroids is not None and self.count(scope) > self.exact_threshold:
+                list_ids, _ = top_k_similarity(query, centroids, self.nprobe)
+                list_ids = list_ids[0].tolist()
+                rows = self._conn.execute(
+                    f'SELECT lead_id, workorder_id, vector FROM vectors WHERE {where} '
+                    f'AND {list_column} IN ({",".join("?" * len(list_ids))})',
+                    params + tuple(list_ids)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    f'SELECT lead_id, workorder_id, vector FROM vectors WHERE {where}', params
+                ).fetchall()
+        exclude_ids = set(exclude_ids)
+        rows = [r for r in rows if r[0] not in exclude_ids]
+        if not rows:
+            return []
+        matrix = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+        indices, scores = top_k_similarity(query, matrix, k)
+        return [(rows[i][0], rows[i][1], float(score)) for i, score in zip(indices[0].tolist(), scores[0].tolist())]
+
+
+_vector_index = None
+_vector_index_lock = threading.Lock()
+
+
+def get_vector_index():
+    global _vector_index
+    if _vector_index is None:
+        with _vector_index_lock:
+            if _vector_index is None:
+                _vector_index = VectorIndex()
+    return _vector_index
+
+
+def set_vector_index(index):
+    global _vector_index
+    with _vector_index_lock:
+        _vector_index = index
+
+
+def workorder_embedding_model(session, workorder_id):
+    """Embedding model id of a workorder (older workorders were embedded with OpenAI)."""
+    embedding_model = session.query(Workorder.embedding_model).filter(Workorder.id == workorder_id).scalar()
+    return embedding_model or LEGACY_EMBEDDING_MODEL
+
+
+def index_workorder_embeddings(session, workorder_id, index=None):
+    """Add any embedded leads of a workorder that are missing from the index; returns how many."""
+    index = index or get_vector_index()
+    embedding_model = workorder_embedding_model(session, workorder_id)
+    indexed = index.indexed_lead_ids(workorder_id)
+    rows = session.query(Lead.id).filter(
+        Lead.workorder_id == workorder_id,
+        Lead.buyer_persona_embedding.isnot(None)
+    ).all()
+    missing = [row[0] for row in rows if row[0] not in indexed]
+    for start in range(0, len(missing), 1000):
+        chunk = missing[start:start + 1000]
+        items = session.query(Lead.id, Lead.buyer_persona_embedding).filter(Lead.id.in_(chunk)).all()
+        index.add(workorder_id, items, embedding_model)
+    return len(missing)
+
+
+def backfill_workorders(session, workorder_ids, index=None):
+    """Index the embedded leads of those `workorder_ids` never backfilled; returns how many leads were added.
+
+    Each workorder is read once: after that, enrichment adds its new
+    embeddings as they are committed, so similarity requests don't re-read
+    every lead of every workorder in scope.
+    """
+    index = index or get_vector_index()
+    done = index.backfilled_workorders()
+    added = 0
+    for workorder_id in workorder_ids:
+        if workorder_id not in done:
+            added += index_workorder_embeddings(session, workorder_id, index)
+            index.mark_backfilled(workorder_id)
+    return added
+
+
+def match_converted_leads(session, workorder_id, k=20, scope=None, index=None):
+    """Unchecked leads of a workorder ranked by best similarity to converted leads in `scope`.
+
+    Returns `(lead_id, score, best_converted_lead_id)` tuples, best first.
+    `scope` defaults to the global scope of the workorder's embedding model.
+    The converted set is usually small, so this is an exact blocked search.
+    """
+    index = index or get_vector_index()
+    scope = scope or global_scope(workorder_embedding_model(session, workorder_id))
+    query = session.query(Lead.id).filter(
+        Lead.status == 'converted',
+        Lead.buyer_persona_embedding.isnot(None)
+    )
+    if is_global_scope(scope):
+        query = query.join(Workorder, Workorder.id == Lead.workorder_id).filter(
+            func.coalesce(Workorder.embedding_model, LEGACY_EMBEDDING_MODEL) == scope.split(':', 1)[1]
+        )
+    else:
+        query = query.filter(Lead.workorder_id == workorder_id)
+    converted_ids, converted = index.get_vectors([row[0] for row in query.all()])
+    if not converted_ids:
+        return []
+    entry = embedding_matrix_cache.get(session, workorder_id)
+    statuses = dict(session.query(Lead.id, Lead.status).filter(Lead.workorder_id == workorder_id).all())
+    unchecked_rows = [
+        i for i, lead_id in enumerate(entry.ids.tolist()) if (statuses.get(lead_id) or 'unchecked') == 'unchecked'
+    ]
+    if not unchecked_rows:
+        return []
+    best, scores = top_k_similarity(entry.matrix[unchecked_rows], converted, 1)
+    ranked = np.argsort(-scores[:, 0], kind='stable')[:k]
+    return [
+        (int(entry.ids[unchecked_rows[i]]), float(scores[i, 0]), converted_ids[best[i, 0]])
+        for i in ranked.tolist()
+    ]
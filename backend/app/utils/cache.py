@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+SCRAPE_CACHE_PATH = os.getenv('SCRAPE_CACHE_PATH', './scrape_cache.db')
+SCRAPE_CACHE_TTL = float(os.getenv('SCRAPE_CACHE_TTL', str(7 * 24 * 3600)))
+SCRAPE_CACHE_NEGATIVE_TTL = float(os.getenv('SCRAPE_CACHE_NEGATIVE_TTL', str(24 * 3600)))
+SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv('SCRAPE_CACHE_MAX_ENTRIES', '50000'))
+
+# Check a namespace's size cap every this many writes to it rather than on every write
+_EVICTION_CHECK_EVERY = 100
+
+TRACKING_QUERY_PARAMS = {'gclid', 'fbclid', 'msclkid', 'ref'}
+
+
+def normalize_url(url):
+    """Canonical form of a website URL so equivalent spellings share a cache entry."""
+    url = url.strip()
+    if '://' not in url:
+        url = f'https://{url}'
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    netloc = host
+    if parts.port and parts.port not in (80, 443):
+        netloc = f'{host}:{parts.port}'
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith('utm_') and k.lower() not in TRACKING_QUERY_PARAMS
+    ))
+    return urlunsplit(('https', netloc, parts.path.rstrip('/'), query, ''))
+
+
+def normalize_query(text):
+    return ' '.join(str(text).lower().split())
+
+
+class PersistentCache:
+    """SQLite-backed key/value cache with per-entry TTL, LRU eviction and negative entries.
+
+    Entries live in one table partitioned by namespace; `max_entries` caps each
+    namespace, evicting the least recently read entries first.
+    """
+
+    def __init__(self, path, max_entries=SCRAPE_CACHE_MAX_ENTRIES, ttl=SCRAPE_CACHE_TTL,
+                 negative_ttl=SCRAPE_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            ' namespace TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' value BLOB,'
+            ' negative INTEGER NOT NULL DEFAULT 0,'
+            ' expires_at REAL NOT NULL,'
+            ' last_access REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_cache_entries_lru ON cache_entries (namespace, last_access)'
+        )
+        self._conn.commit()
+        self._stats = {}
+
+    def _count(self, namespace, name):
+        counters = self._stats.setdefault(namespace, {
+            'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'writes': 0, 'evictions': 0
+        })
+        counters[name] += 1
+
+    def get(self, namespace, key):
+        """Return `(found, value)`; a negative entry is found with value None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, negative, expires_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                (namespace, key)
+            ).fetchone()
+            if row is None:
+                self._count(namespace, 'misses')
+                return False, None
+            value, negative, expires_at = row
+            if expires_at <= now:
+                self._conn.execute(
+                    'DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (namespace, key)
+                )
+                self._conn.commit()
+                self._count(namespace, 'expired')
+                self._count(namespace, 'misses')
+                return False, None
+            self._conn.execute(
+                'UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?',
+                (now, namespace, key)
+            )
+            self._conn.commit()
+            self._count(namespace, 'negative_hits' if negative else 'hits')
+            return True, None if negative else value
+
+    def set(self, namespace, key, value, ttl=None):
+        self._put(namespace, key, value, False, self.ttl if ttl is None else ttl)
+
+    def set_negative(self, namespace, key, ttl=None):
+        """Remember that `key` has no value (e.g. a dead domain) for a shorter TTL."""
+        self._put(namespace, key, None, True, self.negative_ttl if ttl is None else ttl)
+
+    def _put(self, namespace, key, value, negative, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, negative, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (namespace, key, value, int(negative), now + ttl, now)
+            )
+            self._conn.commit()
+            self._count(namespace, 'writes')
+            if self._stats[namespace]['writes'] % _EVICTION_CHECK_EVERY == 0:
+                self._evict(namespace)
+
+    def _evict(self, namespace):
+        self._conn.execute(
+            'DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?', (namespace, time.time())
+        )
+        (count,) = self._conn.execute(
+            'SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (namespace,)
+        ).fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                'DELETE FROM cache_entries WHERE rowid IN ('
+                ' SELECT rowid FROM cache_entries WHERE namespace = ? ORDER BY last_access LIMIT ?)',
+                (namespace, overflow)
+            )
+            self._stats[namespace]['evictions'] += overflow
+        self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            sizes = dict(self._conn.execute(
+                'SELECT namespace, COUNT(*) FROM cache_entries GROUP BY namespace'
+            ).fetchall())
+            result = {}
+            for namespace in set(sizes) | set(self._stats):
+                counters = dict(self._stats.get(namespace, {}))
+                lookups = counters.get('hits', 0) + counters.get('negative_hits', 0) + counters.get('misses', 0)
+                hit_total = counters.get('hits', 0) + counters.get('negative_hits', 0)
+                counters['hit_ratio'] = hit_total / lookups if lookups else 0.0
+                counters['entries'] = sizes.get(namespace, 0)
+                result[namespace] = counters
+            return result
+
+
+_scrape_cache = None
+_scrape_cache_lock = threading.Lock()
+
+
+def get_scrape_cache():
+    global _scrape_cache
+    if _scrape_cache is None:
+        with _scrape_cache_lock:
+            if _scrape_cache is None:
+                _scrape_cache = PersistentCache(SCRAPE_CACHE_PATH)
+    return _scrape_cache
+
+
+def set_scrape_cache(cache):
+    global _scrape_cache
+    with _scrape_cache_lock:
+        _scrape_cache = cache
+
+
+class SingleFlight:
+    """Collapse concurrent computations of the same key into one call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, compute):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = compute()
+            return call['result']
+        except Exception as e:
+            # Callers waiting on this computation fail the same way
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
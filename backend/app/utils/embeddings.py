@@ -0,0 +1,68 @@
+import os
+import struct
+import numpy as np
+
+# Storage format for new embedding BLOBs: float32, float16 or int8
+EMBEDDING_STORAGE = os.getenv('EMBEDDING_STORAGE', 'float32')
+
+# Quantized BLOBs start with this NaN bit pattern. Real embeddings are always
+# finite, so headerless float32 BLOBs written before quantization existed can
+# never be mistaken for a quantized one.
+QUANTIZED_MAGIC = b'\x4b\x0e\xc0\x7f'
+FORMAT_FLOAT16 = 1
+FORMAT_INT8 = 2
+_FORMAT_CODES = {'float16': FORMAT_FLOAT16, 'int8': FORMAT_INT8}
+# magic, format code, 3 bytes padding
+_HEADER = struct.Struct('<4sB3x')
+_INT8_SCALE = struct.Struct('<f')
+
+
+def encode_embedding(embedding, storage=None):
+    """Serialize an embedding vector to a BLOB in the given (default: configured) storage format.
+
+    float32 is stored as raw bytes. float16 halves the size; int8 quarters it
+    with a per-vector float32 scale (max |value| / 127).
+    """
+    if embedding is None:
+        return None
+    storage = storage or EMBEDDING_STORAGE
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    if storage == 'float32':
+        return vector.tobytes()
+    if storage == 'float16':
+        return _HEADER.pack(QUANTIZED_MAGIC, FORMAT_FLOAT16) + vector.astype(np.float16).tobytes()
+    if storage == 'int8':
+        peak = float(np.max(np.abs(vector))) if len(vector) else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return _HEADER.pack(QUANTIZED_MAGIC, FORMAT_INT8) + _INT8_SCALE.pack(scale) + quantized.tobytes()
+    raise ValueError(f'Unknown embedding storage format: {storage}')
+
+
+def decode_embedding(blob):
+    """Decode a BLOB written by `encode_embedding` (or a legacy float32 BLOB) to float32."""
+    if blob is None:
+        return None
+    if blob[:4] != QUANTIZED_MAGIC:
+        return np.frombuffer(blob, dtype=np.float32)
+    _, code = _HEADER.unpack_from(blob)
+    if code == FORMAT_FLOAT16:
+        return np.frombuffer(blob, dtype=np.float16, offset=_HEADER.size).astype(np.float32)
+    if code == FORMAT_INT8:
+        (scale,) = _INT8_SCALE.unpack_from(blob, _HEADER.size)
+        values = np.frombuffer(blob, dtype=np.int8, offset=_HEADER.size + _INT8_SCALE.size)
+        return values.astype(np.float32) * np.float32(scale)
+    raise ValueError(f'Unknown quantized embedding format code: {code}')
+
+
+def decode_embeddings(blobs):
+    """Decode a list of BLOBs into one (n, d) float32 matrix."""
+    if not blobs:
+        return np.zeros((0, 0), dtype=np.float32)
+    if not any(blob[:4] == QUANTIZED_MAGIC for blob in blobs):
+        if len({len(blob) for blob in blobs}) > 1:
+            # Reshaping would silently misalign vectors of different models
+            raise ValueError('Embeddings have different dimensions')
+        # All raw float32: decode with a single buffer instead of per-row arrays
+        return np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+    return np.stack([decode_embedding(blob) for blob in blobs])
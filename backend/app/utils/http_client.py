@@ -0,0 +1,169 @@
+import os
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import httpx
+
+# Total time budget for one request, including retries (matches the old requests timeout)
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+# Global cap on requests in flight across all hosts
+HTTP_MAX_IN_FLIGHT = int(os.getenv('HTTP_MAX_IN_FLIGHT', '200'))
+# Cap on concurrent requests to a single host
+HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', '4'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.5'))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class AsyncFetcher:
+    """Shared asyncio HTTP client running on its own event loop thread.
+
+    All callers share one pooled connection set, so keep-alive connections are
+    reused across leads, and concurrency is limited per host and globally. The
+    blocking `request` wrapper lets thread-pool workers use it directly.
+    """
+
+    def __init__(self, max_in_flight=HTTP_MAX_IN_FLIGHT, max_per_host=HTTP_MAX_PER_HOST,
+                 timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES, backoff_base=HTTP_BACKOFF_BASE):
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._global_semaphore = None
+        # host -> [semaphore, requests holding or waiting for it]; dropped when the count reaches 0
+        self._host_semaphores = {}
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='async-fetcher', daemon=True)
+            thread.start()
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            self._thread = thread
+            self._loop = loop
+
+    async def _setup(self):
+        self._global_semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            ),
+        )
+
+    def _checkout_host(self, host):
+        # Only touched from the event loop thread, so no locking needed
+        entry = self._host_semaphores.get(host)
+        if entry is None:
+            entry = self._host_semaphores[host] = [asyncio.Semaphore(self.max_per_host), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _return_host(self, host):
+        entry = self._host_semaphores[host]
+        entry[1] -= 1
+        if not entry[1]:
+            # Idle hosts are forgotten, so crawling many domains doesn't grow the map
+            del self._host_semaphores[host]
+
+    def _backoff(self, attempt):
+        return self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+
+    async def _acquire(self, semaphore, deadline, url):
+        # Waiting for a free slot counts against the request's time budget
+        try:
+            await asyncio.wait_for(semaphore.acquire(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            raise httpx.TimeoutException(f'Timed out after {self.timeout}s waiting for a connection slot: {url}')
+
+    async def _send(self, method, url, deadline, **kwargs):
+        await self._acquire(self._global_semaphore, deadline, url)
+        try:
+            host = urlsplit(url).hostname or ''
+            host_semaphore = self._checkout_host(host)
+            try:
+                await self._acquire(host_semaphore, deadline, url)
+                try:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise httpx.TimeoutException(f'Timed out after {self.timeout}s: {url}')
+                    return await self._client.request(method, url, timeout=remaining, **kwargs)
+                finally:
+                    host_semaphore.release()
+            finally:
+                self._return_host(host)
+        finally:
+            self._global_semaphore.release()
+
+    async def request_async(self, method, url, max_retries=None, **kwargs):
+        # `max_retries` overrides the fetcher's, e.g. 0 where the caller retries itself
+        max_retries = self.max_retries if max_retries is None else max_retries
+        # The budget covers queueing for the global and per-host slots as well as the request itself
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = await self._send(method, url, deadline, **kwargs)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                    return response
+            except httpx.TransportError:
+                if attempt >= max_retries:
+                    raise
+            # Back off before retrying, but never past the overall deadline
+            delay = self._backoff(attempt)
+            if time.monotonic() + delay >= deadline:
+                if response is not None:
+                    return response
+                raise httpx.TimeoutException(f'Timed out after {self.timeout}s: {url}')
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def request(self, method, url, **kwargs):
+        """Blocking request; safe to call from any thread."""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self.request_async(method, url, **kwargs), self._loop)
+        return future.result()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._host_semaphores = {}
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_http_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = AsyncFetcher()
+    return _fetcher
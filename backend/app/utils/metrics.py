@@ -0,0 +1,296 @@
+import os
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+METRICS_LATENCY_BUCKETS = [
+    float(b) for b in os.getenv(
+        'METRICS_LATENCY_BUCKETS',
+        '0.001,0.002,0.005,0.01,0.02,0.05,0.1,0.2,0.5,1,2,5,10,20,60,120'
+    ).split(',')
+]
+
+# Workorder that spans on this thread are attributed to; see `in_workorder`
+_current_workorder = contextvars.ContextVar('current_workorder', default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; quantiles are interpolated within buckets."""
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets or METRICS_LATENCY_BUCKETS
+        # One count per bucket plus the +Inf overflow bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max, "buckets": list(self.counts)}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        if len(data.get('buckets', [])) == len(histogram.counts):
+            histogram.counts = list(data['buckets'])
+            histogram.count = data.get('count', 0)
+            histogram.sum = data.get('sum', 0.0)
+            histogram.max = data.get('max', 0.0)
+        return histogram
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_seconds": round(self.sum, 4),
+            "mean_ms": round(self.sum / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 2),
+            "p95_ms": round(self.quantile(0.95) * 1000, 2),
+            "p99_ms": round(self.quantile(0.99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class _StageTimings:
+    """Histograms and error counts per stage, for the process or for one workorder."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def error(self, stage, error_class):
+        key = (stage, error_class)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def to_dict(self):
+        stages = {stage: {**h.to_dict(), "errors": {}} for stage, h in self.histograms.items()}
+        for (stage, error_class), count in self.errors.items():
+            stages.setdefault(stage, {**Histogram().to_dict(), "errors": {}})["errors"][error_class] = count
+        return stages
+
+    @classmethod
+    def from_dict(cls, data):
+        timings = cls()
+        for stage, entry in (data or {}).items():
+            if entry.get('count'):
+                timings.histograms[stage] = Histogram.from_dict(entry)
+            for error_class, count in entry.get('errors', {}).items():
+                timings.errors[(stage, error_class)] = count
+        return timings
+
+    def summary(self):
+        stages = {stage: {**h.summary(), "errors": {}} for stage, h in sorted(self.histograms.items())}
+        for (stage, error_class), count in sorted(self.errors.items()):
+            stages.setdefault(stage, {**Histogram().summary(), "errors": {}})["errors"][error_class] = count
+        return stages
+
+
+class MetricsRegistry:
+    """In-process pipeline metrics: stage latency histograms, error classes and named counters.
+
+    Everything recorded under a workorder is also kept per workorder until
+    the job persists it (see `pop_workorder`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = _StageTimings()
+        self._counters = {}
+        self._workorders = {}
+
+    def _workorder(self, workorder_id):
+        timings = self._workorders.get(workorder_id)
+        if timings is None:
+            timings = self._workorders[workorder_id] = _StageTimings()
+        return timings
+
+    def observe(self, stage, seconds, workorder_id=None):
+        with self._lock:
+            self._stages.observe(stage, seconds)
+            if workorder_id is not None:
+                self._workorder(workorder_id).observe(stage, seconds)
+
+    def error(self, stage, error, workorder_id=None):
+        error_class = error if isinstance(error, str) else type(error).__name__
+        with self._lock:
+            self._stages.error(stage, error_class)
+            if workorder_id is not None:
+                self._workorder(workorder_id).error(stage, error_class)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def load_workorder(self, workorder_id, persisted):
+        """Start a workorder's live timings from what an earlier job persisted, keeping anything newer."""
+        with self._lock:
+            loaded = _StageTimings.from_dict(persisted)
+            current = self._workorders.get(workorder_id)
+            if current is not None:
+                for stage, histogram in current.histograms.items():
+                    merged = loaded.histograms.setdefault(stage, Histogram())
+                    merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                    merged.count += histogram.count
+                    merged.sum += histogram.sum
+                    merged.max = max(merged.max, histogram.max)
+                for key, count in current.errors.items():
+                    loaded.errors[key] = loaded.errors.get(key, 0) + count
+            self._workorders[workorder_id] = loaded
+
+    def workorder_snapshot(self, workorder_id):
+        """Live timings of a workorder as a JSON-able dict, or None if none are in memory."""
+        with self._lock:
+            timings = self._workorders.get(workorder_id)
+            return timings.to_dict() if timings is not None else None
+
+    def pop_workorder(self, workorder_id):
+        """Remove and return a workorder's timings for persisting."""
+        with self._lock:
+            timings = self._workorders.pop(workorder_id, None)
+            return timings.to_dict() if timings is not None else None
+
+    def snapshot(self):
+        with self._lock:
+            return self._stages.to_dict(), dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._stages = _StageTimings()
+            self._counters = {}
+            self._workorders = {}
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    return _registry
+
+
+def current_workorder():
+    return _current_workorder.get()
+
+
+def in_workorder(workorder_id, fn):
+    """Wrap `fn` so spans inside it (e.g. on an executor thread) are attributed to `workorder_id`."""
+    def wrapper(*args, **kwargs):
+        token = _current_workorder.set(workorder_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_workorder.reset(token)
+    return wrapper
+
+
+class _Span:
+    def __init__(self, stage, workorder_id):
+        self.stage = stage
+        self.workorder_id = workorder_id
+
+
+@contextmanager
+def span(stage, workorder_id=None):
+    """Time a block as `stage`; an exception escaping it is counted by class and re-raised.
+
+    The span belongs to `workorder_id`, else to the workorder bound with
+    `in_workorder`; it can also be set on the yielded span before the block
+    ends, for work that creates its workorder.
+    """
+    current = _Span(stage, workorder_id if workorder_id is not None else _current_workorder.get())
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        _registry.error(stage, e, current.workorder_id)
+        raise
+    finally:
+        _registry.observe(stage, time.perf_counter() - start, current.workorder_id)
+
+
+def record_error(stage, error, workorder_id=None):
+    """Count a handled error of `stage` by class (or by a short name when `error` is a string)."""
+    _registry.error(stage, error, workorder_id if workorder_id is not None else _current_workorder.get())
+
+
+def increment(name, amount=1, **labels):
+    _registry.increment(name, amount, **labels)
+
+
+def summarize_timings(timings):
+    """Per-stage count, total, mean, p50/p95/p99 and max latency, plus error classes, of persisted timings."""
+    return _StageTimings.from_dict(timings).summary()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def render_prometheus(extra_gauges=()):
+    """Prometheus text exposition of all metrics.
+
+    `extra_gauges` are `(name, help, [(labels dict, value)])` tuples
+    computed at scrape time, such as cache hit ratios.
+    """
+    stages, counters = _registry.snapshot()
+    lines = [
+        '# HELP lead_stage_seconds Time spent in each lead pipeline stage.',
+        '# TYPE lead_stage_seconds histogram',
+    ]
+    for stage, entry in sorted(stages.items()):
+        cumulative = 0
+        for bound, count in zip(METRICS_LATENCY_BUCKETS + ['+Inf'], entry['buckets']):
+            cumulative += count
+            labels = _format_labels([('stage', stage), ('le', bound)])
+            lines.append(f'lead_stage_seconds_bucket{labels} {cumulative}')
+        labels = _format_labels([('stage', stage)])
+        lines.append(f'lead_stage_seconds_sum{labels} {entry["sum"]}')
+        lines.append(f'lead_stage_seconds_count{labels} {entry["count"]}')
+    lines += [
+        '# HELP lead_stage_errors_total Errors per pipeline stage and error class.',
+        '# TYPE lead_stage_errors_total counter',
+    ]
+    for stage, entry in sorted(stages.items()):
+        for error_class, count in sorted(entry['errors'].items()):
+            lines.append(f'lead_stage_errors_total{_format_labels([("stage", stage), ("error", error_class)])} {count}')
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        lines.append(f'# TYPE {name} counter')
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f'{name}{_format_labels(list(labels))} {value}')
+    for name, help_text, samples in extra_gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for labels, value in samples:
+            lines.append(f'{name}{_format_labels(sorted(labels.items()))} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,292 @@
+import os
+import datetime
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from app.utils.http_client import RETRYABLE_STATUS_CODES
+from app.utils.metrics import span, increment
+
+# Requests per second and burst size allowed per external provider; throttling lowers the rate from there
+RATE_LIMIT_OPENAI_RPS = float(os.getenv('RATE_LIMIT_OPENAI_RPS', '50'))
+RATE_LIMIT_OPENAI_BURST = int(os.getenv('RATE_LIMIT_OPENAI_BURST', '50'))
+RATE_LIMIT_TAVILY_RPS = float(os.getenv('RATE_LIMIT_TAVILY_RPS', '10'))
+RATE_LIMIT_TAVILY_BURST = int(os.getenv('RATE_LIMIT_TAVILY_BURST', '10'))
+# Floor the adaptive rate never drops below
+RATE_LIMIT_MIN_RPS = float(os.getenv('RATE_LIMIT_MIN_RPS', '0.2'))
+# Fraction the rate is cut to on a 429, and fraction of the configured rate regained per second of successes
+RATE_LIMIT_DECREASE = float(os.getenv('RATE_LIMIT_DECREASE', '0.5'))
+RATE_LIMIT_RECOVERY = float(os.getenv('RATE_LIMIT_RECOVERY', '0.05'))
+# Retries of a throttled, failing or unreachable provider call, with jittered exponential backoff
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '4'))
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv('RATE_LIMIT_BACKOFF_BASE', '0.5'))
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv('RATE_LIMIT_MAX_BACKOFF', '30'))
+# Consecutive failures that open a provider's circuit, pausing all calls to it
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', '5'))
+# Seconds the circuit stays open before one probe call is let through; doubles while probes fail
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', '5'))
+CIRCUIT_BREAKER_MAX_COOLDOWN = float(os.getenv('CIRCUIT_BREAKER_MAX_COOLDOWN', '120'))
+# Seconds a call waits for a paused provider before giving up with ProviderUnavailable
+CIRCUIT_BREAKER_MAX_WAIT = float(os.getenv('CIRCUIT_BREAKER_MAX_WAIT', '600'))
+
+PROVIDER_RATE_LIMITS = {
+    'openai': (RATE_LIMIT_OPENAI_RPS, RATE_LIMIT_OPENAI_BURST),
+    'tavily': (RATE_LIMIT_TAVILY_RPS, RATE_LIMIT_TAVILY_BURST),
+}
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class ProviderUnavailable(Exception):
+    """A provider's circuit stayed open for longer than the caller was willing to wait."""
+
+
+def parse_retry_after(headers):
+    """Seconds to wait from `retry-after-ms` or `Retry-After` (seconds or an HTTP date), else None."""
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error, transient=()):
+    """`(retryable, throttled, retry_after)` for an error raised by a provider call.
+
+    httpx and OpenAI SDK errors carry the response: 429 and 5xx are
+    retryable, and 429 is throttling. Connection errors and timeouts
+    (httpx's, or the `transient` exception classes) are retryable too.
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(response, 'status_code', None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES, status == 429, parse_retry_after(getattr(response, 'headers', None))
+    return isinstance(error, (httpx.TransportError, *transient)), False, None
+
+
+class AdaptiveRateLimiter:
+    """Token bucket plus circuit breaker shared by all calls to one external provider.
+
+    The bucket starts at `rate` requests per second. A 429 halves it (once
+    per round of requests in flight) and a Retry-After pauses every caller
+    until it has passed; successes win the rate back gradually. After
+    `failure_threshold` consecutive failures the circuit opens: callers
+    block instead of failing, so enrichment pauses rather than burning
+    leads, until a single probe call succeeds after the cooldown.
+    """
+
+    def __init__(self, name, rate, burst, min_rate=RATE_LIMIT_MIN_RPS, max_retries=RATE_LIMIT_MAX_RETRIES,
+                 backoff_base=RATE_LIMIT_BACKOFF_BASE, max_backoff=RATE_LIMIT_MAX_BACKOFF,
+                 failure_threshold=CIRCUIT_BREAKER_THRESHOLD, cooldown=CIRCUIT_BREAKER_COOLDOWN,
+                 max_cooldown=CIRCUIT_BREAKER_MAX_COOLDOWN, max_wait=CIRCUIT_BREAKER_MAX_WAIT):
+        self.name = name
+        self.max_rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min(min_rate, rate)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        now = time.monotonic()
+        self._rate = rate
+        self._tokens = float(self.burst)
+        self._updated = now
+        # When the rate was last changed, and last cut for throttling
+        self._adjusted = now
+        self._decreased = now
+        self._paused_until = 0.0
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._probing = False
+
+    def _refill(self, now):
+        # No tokens accrue while paused or open, so callers don't burst out afterwards
+        since = max(self._updated, min(now, max(self._paused_until, self._open_until)))
+        self._tokens = min(self.burst, self._tokens + max(0.0, now - since) * self._rate)
+        self._updated = now
+
+    def _wait_time(self, now):
+        if self._state == CIRCUIT_OPEN:
+            if now < self._open_until:
+                return self._open_until - now
+            self._state = CIRCUIT_HALF_OPEN
+            self._probing = False
+        if self._state == CIRCUIT_HALF_OPEN and self._probing:
+            # Woken as soon as the probe finishes
+            return self._cooldown
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self._rate
+
+    def acquire(self):
+        """Block until a call may be sent; returns `(sent_at, is_probe)` for reporting its outcome.
+
+        Raises ProviderUnavailable after waiting `max_wait` seconds.
+        """
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait <= 0:
+                    self._tokens -= 1
+                    probe = self._state == CIRCUIT_HALF_OPEN
+                    self._probing = self._probing or probe
+                    return now, probe
+                if now >= deadline:
+                    raise ProviderUnavailable(
+                        f'{self.name} unavailable: waited {self.max_wait:.0f}s with the circuit {self._state}'
+                    )
+                self._cond.wait(min(wait, deadline - now))
+
+    def _succeeded(self, probe):
+        with self._cond:
+            now = time.monotonic()
+            self._failures = 0
+            if probe:
+                self._probing = False
+                if self._state == CIRCUIT_HALF_OPEN:
+                    print(f'{self.name}: circuit closed')
+                    self._state = CIRCUIT_CLOSED
+                    self._cooldown = self.base_cooldown
+            if self._state == CIRCUIT_CLOSED:
+                self._refill(now)
+                regained = self.max_rate * RATE_LIMIT_RECOVERY * (now - self._adjusted)
+                self._rate = min(self.max_rate, self._rate + regained)
+                self._adjusted = now
+            self._cond.notify_all()
+
+    def _failed(self, sent_at, probe, throttled, retry_after):
+        with self._cond:
+            now = time.monotonic()
+            self._failures += 1
+            # Calls sent before the last cut saw the old rate; one round of 429s cuts it once
+            if throttled and sent_at >= self._decreased:
+                self._refill(now)
+                self._rate = max(self.min_rate, self._rate * RATE_LIMIT_DECREASE)
+                self._tokens = min(self._tokens, 0.0)
+                self._adjusted = self._decreased = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if probe:
+                self._probing = False
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+                self._open(now)
+            elif self._state == CIRCUIT_CLOSED and self._failures >= self.failure_threshold:
+                self._open(now)
+            self._cond.notify_all()
+
+    def _open(self, now):
+        print(f'{self.name}: circuit open for {self._cooldown:.1f}s after {self._failures} consecutive failures')
+        increment('lead_provider_circuit_trips_total', provider=self.name)
+        self._refill(now)
+        self._state = CIRCUIT_OPEN
+        self._open_until = now + self._cooldown
+        self._adjusted = now
+
+    def _backoff(self, attempt):
+        return min(self.max_backoff, self.backoff_base * (2 ** attempt)) * (0.5 + random.random())
+
+    def call(self, fn, transient=()):
+        """Call `fn()` within the limits, retrying throttled, failing and unreachable attempts.
+
+        The last error is raised once retries run out; errors that are not
+        worth retrying (e.g. 400 or 401) are raised at once. `transient` adds
+        exception classes to treat as connection errors.
+        """
+        attempt = 0
+        while True:
+            # Time spent queued for a token or an open circuit
+            with span(f'ratelimit.{self.name}'):
+                sent_at, probe = self.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                retryable, throttled, retry_after = classify_error(e, transient)
+                if not retryable:
+                    # The provider answered, so it counts as up
+                    increment('lead_provider_requests_total', provider=self.name, outcome='rejected')
+                    self._succeeded(probe)
+                    raise
+                increment('lead_provider_requests_total', provider=self.name,
+                          outcome='throttled' if throttled else 'error')
+                self._failed(sent_at, probe, throttled, retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                increment('lead_provider_retries_total', provider=self.name)
+                time.sleep(self._backoff(attempt - 1))
+                continue
+            except BaseException:
+                if probe:
+                    # Interrupted before an outcome; let another call probe
+                    with self._cond:
+                        self._probing = False
+                        self._cond.notify_all()
+                raise
+            increment('lead_provider_requests_total', provider=self.name, outcome='ok')
+            self._succeeded(probe)
+            return result
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "provider": self.name,
+                "rate": round(self._rate, 3),
+                "max_rate": self.max_rate,
+                "circuit": self._state,
+                "consecutive_failures": self._failures,
+                "paused_seconds": round(max(0.0, self._paused_until - now, self._open_until - now), 3),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider):
+    """The shared limiter of `provider` (see PROVIDER_RATE_LIMITS), created on first use."""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                rate, burst = PROVIDER_RATE_LIMITS.get(provider, (RATE_LIMIT_OPENAI_RPS, RATE_LIMIT_OPENAI_BURST))
+                limiter = _limiters[provider] = AdaptiveRateLimiter(provider, rate, burst)
+    return limiter
+
+
+def set_rate_limiter(provider, limiter):
+    with _limiters_lock:
+        _limiters[provider] = limiter
+
+
+def rate_limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
@@ -0,0 +1,180 @@
+import os
+import re
+import math
+import threading
+import time
+from lxml import etree
+from lxml import html as lxml_html
+
+# Approximate tokens of page text included in the persona prompt
+EXTRACTION_TOKEN_BUDGET = int(os.getenv('EXTRACTION_TOKEN_BUDGET', '1500'))
+
+# Elements that never hold company content
+BOILERPLATE_TAGS = ['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'nav', 'footer', 'aside',
+                    'button', 'select']
+# Usually boilerplate (search boxes, sign-up forms), but ASP.NET WebForms pages wrap the whole body in a
+# <form>, so these are only removed when they hold less than half the page, like the id/class heuristic
+BOILERPLATE_WRAPPER_TAGS = ['form']
+BOILERPLATE_ROLES = {'navigation', 'banner', 'contentinfo', 'dialog', 'alertdialog', 'menu', 'menubar', 'search'}
+# id/class words of cookie banners, menus, share bars and similar blocks
+BOILERPLATE_PATTERN = re.compile(
+    r'(?:^|[\s_-])(?:cookies?|consent|gdpr|newsletter|subscribe|popup|modal|breadcrumbs?|sidebar|navbar|nav|'
+    r'menu|footer|social|share|skip-link)(?:$|[\s_-])',
+    re.IGNORECASE
+)
+BLOCK_TAGS = ['p', 'div', 'section', 'article', 'main', 'header', 'li', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5',
+              'h6', 'br', 'tr', 'td', 'th', 'table', 'blockquote', 'pre', 'dd', 'dt', 'figcaption']
+# Never removed by the id/class heuristics, e.g. <body class="has-sidebar">
+_CONTAINER_TAGS = {'html', 'body', 'main', 'article'}
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'\w+')
+# Paragraphs shorter than this are usually menu entries or labels
+MIN_PARAGRAPH_WORDS = 4
+
+# lxml parsers must not be shared between threads
+_parsers = threading.local()
+
+
+def _html_parser():
+    parser = getattr(_parsers, 'parser', None)
+    if parser is None:
+        parser = _parsers.parser = lxml_html.HTMLParser(encoding='utf-8', remove_comments=True)
+    return parser
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English text)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _is_boilerplate_block(element, page_chars):
+    if element.tag in _CONTAINER_TAGS:
+        return False
+    if element.tag in BOILERPLATE_WRAPPER_TAGS:
+        return len(element.text_content()) < page_chars / 2
+    if element.get('role') in BOILERPLATE_ROLES or element.get('aria-modal') == 'true':
+        return True
+    marker = f"{element.get('id') or ''} {element.get('class') or ''}"
+    if not BOILERPLATE_PATTERN.search(marker):
+        return False
+    # A wrapper holding most of the page is content, whatever its class says
+    return len(element.text_content()) < page_chars / 2
+
+
+def _strip_boilerplate(root):
+    removed = len(root.xpath(' | '.join(f'//{tag}' for tag in BOILERPLATE_TAGS)))
+    etree.strip_elements(root, *BOILERPLATE_TAGS, with_tail=False)
+    page_chars = len(root.text_content())
+    wrappers = ' | '.join(f'//{tag}' for tag in BOILERPLATE_WRAPPER_TAGS)
+    for element in root.xpath(f'{wrappers} | //*[@class or @id or @role or @aria-modal]'):
+        # Skip elements whose ancestor was already dropped
+        if element.getparent() is None or element.getroottree().getroot() is not root:
+            continue
+        if _is_boilerplate_block(element, page_chars):
+            element.drop_tree()
+            removed += 1
+    return removed
+
+
+def extract_main_text(html, stats=None):
+    """Visible text of an HTML page without boilerplate, one paragraph per line.
+
+    Navigation, footers, cookie banners, forms and scripts are dropped. When
+    `stats` is a dict, the HTML size, parse time and number of removed blocks
+    are added to it.
+    """
+    start = time.perf_counter()
+    text = ''
+    try:
+        root = lxml_html.document_fromstring(html.encode('utf-8', 'replace'), parser=_html_parser())
+    except (etree.ParserError, ValueError):
+        # Empty or unparseable document
+        root = None
+    removed = 0
+    if root is not None:
+        removed = _strip_boilerplate(root)
+        for element in root.iter(*BLOCK_TAGS):
+            element.text = '\n' + (element.text or '')
+            element.tail = '\n' + (element.tail or '')
+        lines = (re.sub(r'\s+', ' ', line).strip() for line in root.text_content().split('\n'))
+        text = '\n'.join(line for line in lines if line)
+    if stats is not None:
+        stats['html_chars'] = stats.get('html_chars', 0) + len(html)
+        stats['parse_ms'] = round(stats.get('parse_ms', 0) + (time.perf_counter() - start) * 1000, 2)
+        stats['boilerplate_blocks'] = stats.get('boilerplate_blocks', 0) + removed
+    return text
+
+
+def _sentence_key(sentence):
+    return ' '.join(_WORD.findall(sentence.lower()))
+
+
+def _paragraph_score(paragraph):
+    # Distinct content words, discounted for repetitive text
+    words = [w.lower() for w in _WORD.findall(paragraph)]
+    if not words:
+        return 0.0
+    distinct = {w for w in words if len(w) > 3}
+    score = len(distinct) * len(set(words)) / len(words)
+    return score if len(words) >= MIN_PARAGRAPH_WORDS else score * 0.1
+
+
+def select_informative_text(text, token_budget=EXTRACTION_TOKEN_BUDGET, stats=None):
+    """Deduplicate sentences and keep the most informative paragraphs within `token_budget`.
+
+    Paragraphs are the lines of `text`. Selected paragraphs keep their page
+    order; a paragraph larger than the remaining budget contributes its
+    leading sentences. When `stats` is a dict, page and prompt sizes and the
+    number of dropped duplicate sentences are recorded in it.
+    """
+    if not text:
+        return text
+    seen = set()
+    duplicates = 0
+    paragraphs = []
+    for line in text.split('\n'):
+        kept = []
+        for sentence in _SENTENCE_SPLIT.split(line.strip()):
+            key = _sentence_key(sentence)
+            if not key:
+                continue
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            kept.append(sentence)
+        if kept:
+            paragraphs.append(' '.join(kept))
+
+    selected = {}
+    remaining = token_budget
+    ranked = sorted(range(len(paragraphs)), key=lambda i: _paragraph_score(paragraphs[i]), reverse=True)
+    for i in ranked:
+        if remaining <= 0:
+            break
+        tokens = estimate_tokens(paragraphs[i])
+        if tokens <= remaining:
+            selected[i] = paragraphs[i]
+            remaining -= tokens
+            continue
+        prefix = []
+        for sentence in _SENTENCE_SPLIT.split(paragraphs[i]):
+            sentence_tokens = estimate_tokens(sentence) + 1
+            if sentence_tokens > remaining:
+                break
+            prefix.append(sentence)
+            remaining -= sentence_tokens
+        if prefix:
+            selected[i] = ' '.join(prefix)
+        elif not selected:
+            # A single huge sentence: hard-truncate rather than send nothing
+            selected[i] = paragraphs[i][:remaining * 4]
+            remaining = 0
+    result = '\n'.join(selected[i] for i in sorted(selected))
+    if stats is not None:
+        stats['page_chars'] = len(text)
+        stats['page_tokens'] = estimate_tokens(text)
+        stats['duplicate_sentences'] = duplicates
+        stats['prompt_chars'] = len(result)
+        stats['prompt_tokens'] = estimate_tokens(result)
+    return result
@@ -3,38 +3,208 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+from contextlib import contextmanager
+from app.utils.cache import get_scrape_cache, normalize_url
+from app.utils.metrics import span, record_error
+from app.utils.text_extraction import extract_main_text
+import os
+import threading
 import time
 import traceback
 
+# Number of warm Chrome instances kept for the Selenium fallback
+SELENIUM_POOL_SIZE = int(os.getenv('SELENIUM_POOL_SIZE', '2'))
+# Recycle a browser after it has served this many pages
+SELENIUM_MAX_PAGES_PER_DRIVER = int(os.getenv('SELENIUM_MAX_PAGES_PER_DRIVER', '50'))
+# Hard cap on page load, in seconds
+SELENIUM_PAGE_LOAD_TIMEOUT = float(os.getenv('SELENIUM_PAGE_LOAD_TIMEOUT', '10'))
 
-def extract_text_with_selenium(url, wait_time=3):
+
+def create_chrome_driver():
     options = Options()
     options.add_argument('--headless')
     options.add_argument('--disable-gpu')
     options.add_argument('--no-sandbox')
     options.add_argument('--window-size=1920,1080')
     options.add_argument('--disable-dev-shm-usage')
-    driver = None
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(SELENIUM_PAGE_LOAD_TIMEOUT)
+    return driver
+
+
+class BrowserPool:
+    """Size-bounded pool of warm browser instances.
+
+    Drivers are checked out per URL and returned afterwards; a driver is
+    recycled once it has served `max_pages` pages or if the page raised.
+    At most `size` drivers are alive at once, idle or checked out; a
+    checkout waits for one to come back when all of them are busy.
+    `driver_factory` can be swapped for a stub driver to run offline.
+    """
+
+    def __init__(self, size=SELENIUM_POOL_SIZE, max_pages=SELENIUM_MAX_PAGES_PER_DRIVER,
+                 driver_factory=create_chrome_driver):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.driver_factory = driver_factory
+        # (driver, pages served) pairs, most recently returned last
+        self._idle = []
+        # Drivers alive or being started, idle and checked out together
+        self._live = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            traceback.print_exc()
+
+    def _create(self):
+        # The caller has already counted the driver in _live
+        try:
+            return self.driver_factory()
+        except BaseException:
+            with self._cond:
+                self._live -= 1
+                self._cond.notify()
+            raise
+
+    def warm(self, count=None):
+        """Start browsers ahead of time so the first pages don't pay the launch cost."""
+        target = min(count or self.size, self.size)
+        while True:
+            with self._cond:
+                if self._closed or self._live >= target:
+                    return
+                self._live += 1
+            driver = self._create()
+            self._release(driver, 0)
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._live >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._live += 1
+        return self._create(), 0
+
+    def _release(self, driver, pages, healthy=True):
+        with self._cond:
+            keep = healthy and pages < self.max_pages and not self._closed
+            if keep:
+                self._idle.append((driver, pages))
+            else:
+                self._live -= 1
+            self._cond.notify()
+        if not keep:
+            self._quit(driver)
+
+    @contextmanager
+    def driver(self):
+        driver, pages = self._checkout()
+        healthy = False
+        try:
+            yield driver
+            healthy = True
+        finally:
+            self._release(driver, pages + 1, healthy)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._live -= len(idle)
+            self._cond.notify_all()
+        for driver, _ in idle:
+            self._quit(driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = BrowserPool()
+    return _pool
+
+
+def set_browser_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool is not pool:
+            _pool.close()
+        _pool = pool
+
+
+def _wait_for_document_ready(driver, max_wait):
+    try:
+        WebDriverWait(driver, max_wait, poll_frequency=0.1).until(
+            lambda d: d.execute_script('return document.readyState') == 'complete'
+        )
+    except TimeoutException:
+        pass
+
+
+def _wait_for_text_to_settle(driver, max_wait, poll_interval=0.25):
+    # Return as soon as the body text stops growing, or after max_wait seconds
+    deadline = time.monotonic() + max_wait
+    text = driver.find_element(By.TAG_NAME, 'body').text
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        current = driver.find_element(By.TAG_NAME, 'body').text
+        if current and len(current) == len(text):
+            return current
+        text = current
+    return text
+
+
+def extract_text_with_selenium(url, wait_time=3, stats=None):
+    """Render `url` in a pooled headless browser and return its main text.
+
+    `wait_time` caps each readiness wait (document load, then content
+    settling after scrolling) instead of being slept unconditionally. The
+    rendered DOM goes through the same boilerplate stripping as fetched
+    pages; `stats` is passed to extract_main_text.
+    """
+    cache = get_scrape_cache()
     try:
-        driver = webdriver.Chrome(options=options)
-        if not url.startswith('http'):
-            url = f'https://{url}'
-        driver.get(url)
-        # Wait for page to load
-        time.sleep(wait_time)
-        # Scroll down once
-        driver.find_element(By.TAG_NAME, 'body').send_keys(Keys.PAGE_DOWN)
-        time.sleep(wait_time)
-        # Optionally, wait for some content to appear
-        # WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
-        # Get all visible text
-        text = driver.find_element(By.TAG_NAME, 'body').text
-        return text
-    except Exception as e:
-        print(e)
-        traceback.print_exc()
+        cache_key = normalize_url(url)
+    except ValueError as e:
+        # Not fetchable either; the caller falls back to searching by name
+        print(f'Unparseable website {url!r}: {e}')
+        record_error('scrape.selenium', e)
         return None
-    finally:
-        if driver:
-            driver.quit() 
\ No newline at end of file
+    found, cached_text = cache.get('page_selenium', cache_key)
+    if found:
+        return cached_text
+    with span('scrape.selenium'):
+        try:
+            if not url.startswith('http'):
+                url = f'https://{url}'
+            with get_browser_pool().driver() as driver:
+                try:
+                    driver.get(url)
+                except TimeoutException:
+                    # Page load hit the hard cap; use whatever has rendered so far
+                    pass
+                _wait_for_document_ready(driver, wait_time)
+                # Scroll down once to trigger lazy-loaded content
+                driver.find_element(By.TAG_NAME, 'body').send_keys(Keys.PAGE_DOWN)
+                text = _wait_for_text_to_settle(driver, wait_time)
+                text = extract_main_text(driver.page_source, stats) or text
+            if text:
+                cache.set('page_selenium', cache_key, text)
+            return text
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+            record_error('scrape.selenium', e)
+            return None
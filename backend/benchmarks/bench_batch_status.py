@@ -0,0 +1,67 @@
+"""Set-based batch status update versus the original per-entry reload loop.
+
+Run from the backend directory: python -m benchmarks.bench_batch_status
+"""
+import os
+import time
+import numpy as np
+from models import Lead
+from app.services.lead_status import apply_status_updates, LEAD_STATUSES
+from app.services.ranking import rerank_workorder
+from benchmarks.synthetic import make_session_factory, create_workorder
+
+LEAD_COUNT = 20000
+BATCH_SIZES = [100, 1000, 5000, 20000]
+# The per-entry loop reloads every lead each time; beyond this it takes minutes
+LEGACY_MAX_BATCH = 100
+
+
+def legacy_update(session, workorder_id, status_updates):
+    """The original endpoint body: the full lead list is loaded once per entry."""
+    for lead_index, status in status_updates.items():
+        leads = session.query(Lead).filter(Lead.workorder_id == workorder_id).order_by(Lead.id).all()
+        lead_idx = int(lead_index)
+        if 0 <= lead_idx < len(leads):
+            leads[lead_idx].status = status
+
+
+def random_updates(rng, size):
+    indices = rng.choice(LEAD_COUNT, size=size, replace=False)
+    return {str(i): LEAD_STATUSES[int(rng.integers(len(LEAD_STATUSES)))] for i in indices}
+
+
+def main():
+    session_factory, path = make_session_factory()
+    rng = np.random.default_rng(0)
+    try:
+        session = session_factory()
+        workorder_id = create_workorder(session, LEAD_COUNT, with_text=False, dimensions=256)
+        session.close()
+        for size in BATCH_SIZES:
+            updates = random_updates(rng, size)
+            session = session_factory()
+            start = time.perf_counter()
+            apply_status_updates(session, workorder_id, updates)
+            session.commit()
+            batch = time.perf_counter() - start
+            start = time.perf_counter()
+            apply_status_updates(session, workorder_id, updates)
+            rerank_workorder(session, workorder_id)
+            session.commit()
+            with_rerank = time.perf_counter() - start
+            line = (f'{size:>6} updates: set-based {batch * 1000:8.1f}ms '
+                    f'({batch / size * 1e6:6.1f}us/update), with rerank {with_rerank * 1000:8.1f}ms')
+            if size <= LEGACY_MAX_BATCH:
+                start = time.perf_counter()
+                legacy_update(session, workorder_id, updates)
+                session.commit()
+                legacy = time.perf_counter() - start
+                line += f', legacy {legacy * 1000:10.1f}ms'
+            print(line)
+            session.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Compare the pooled Selenium fallback against launching a browser per URL.
+
+Run from the backend directory: python -m benchmarks.bench_browser_pool
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.web_scraper import BrowserPool, set_browser_pool, extract_text_with_selenium
+from app.utils.cache import PersistentCache, set_scrape_cache
+from benchmarks.fakes import StubDriver
+
+LAUNCH_DELAY = 0.5
+LOAD_DELAY = 0.05
+URL_COUNT = 40
+
+
+def run(pool, workers=4):
+    # Fresh in-memory scrape cache so every URL goes through the browser
+    set_scrape_cache(PersistentCache(':memory:'))
+    set_browser_pool(pool)
+    StubDriver.instances = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        texts = list(executor.map(extract_text_with_selenium, [f'https://site{i}.example' for i in range(URL_COUNT)]))
+    elapsed = time.perf_counter() - start
+    assert all(texts)
+    return elapsed, StubDriver.instances
+
+
+def main():
+    factory = lambda: StubDriver(launch_delay=LAUNCH_DELAY, load_delay=LOAD_DELAY)
+    # max_pages=1 recycles after every page, i.e. the old launch-per-URL behaviour
+    fresh = run(BrowserPool(size=4, max_pages=1, driver_factory=factory))
+    pooled = run(BrowserPool(size=4, max_pages=50, driver_factory=factory))
+    print(f'launch per URL: {fresh[0]:.2f}s, {fresh[1]} browsers started')
+    print(f'warm pool:      {pooled[0]:.2f}s, {pooled[1]} browsers started')
+
+
+if __name__ == '__main__':
+    main()
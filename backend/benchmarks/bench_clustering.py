@@ -0,0 +1,32 @@
+"""Full SVD + HDBSCAN fit versus incremental assignment of new leads.
+
+Run from the backend directory: python -m benchmarks.bench_clustering
+"""
+import time
+from app.services.clustering import fit_cluster_model, predict_clusters
+from benchmarks.synthetic import synthetic_embeddings
+
+SIZES = [1000, 10000, 50000]
+# Leads arriving after the initial fit, as a fraction of the workorder
+NEW_LEAD_RATIO = 0.05
+
+
+def main():
+    for size in SIZES:
+        embeddings = synthetic_embeddings(size, clusters=max(20, size // 200), seed=size)
+        new_count = max(1, int(size * NEW_LEAD_RATIO))
+        start = time.perf_counter()
+        model, labels = fit_cluster_model(embeddings[:-new_count])
+        fit = time.perf_counter() - start
+        start = time.perf_counter()
+        predict_clusters(model, embeddings[-new_count:])
+        incremental = time.perf_counter() - start
+        start = time.perf_counter()
+        fit_cluster_model(embeddings)
+        refit = time.perf_counter() - start
+        print(f'{size:>6} leads: initial fit {fit:7.2f}s, assign {new_count} new leads '
+              f'{incremental * 1000:8.1f}ms vs full refit {refit:7.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Local hashing embeddings versus the (fake) OpenAI embeddings API: throughput and neighbour quality.
+
+Run from the backend directory: python -m benchmarks.bench_embedding_providers
+"""
+import json
+import random
+import time
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+from app.services import lead_processing
+from app.services.embedding_providers import HashingEmbeddingProvider
+from app.services.ranking import top_k_similarity
+from app.utils.cache import PersistentCache
+from benchmarks.fakes import FakeOpenAIClient
+
+LEAD_COUNT = 5000
+SEGMENTS = 20
+K = 10
+
+
+def make_personas(count, segments, seed=7):
+    """Persona JSON whose wording is drawn mostly from one of `segments` vocabularies."""
+    rng = random.Random(seed)
+    vocabularies = [[f'seg{s}term{j}' for j in range(30)] for s in range(segments)]
+    shared = [f'common{j}' for j in range(200)]
+    personas, labels = [], []
+    for i in range(count):
+        segment = rng.randrange(segments)
+        words = rng.sample(vocabularies[segment], 12) + rng.sample(shared, 8)
+        rng.shuffle(words)
+        personas.append(json.dumps({
+            "industry": f'Industry {" ".join(words[:3])}',
+            "pain_points": [" ".join(words[3:10]), " ".join(words[10:15])],
+            "summary": f'Company {i} ' + " ".join(words[15:]),
+        }))
+        labels.append(segment)
+    return personas, np.array(labels)
+
+
+def neighbour_purity(vectors, labels):
+    """Fraction of each vector's top-K neighbours that share its segment."""
+    indices, _ = top_k_similarity(vectors, vectors, K + 1)
+    return float((labels[indices[:, 1:]] == labels[:, None]).mean())
+
+
+def run(label, provider, personas, labels):
+    start = time.perf_counter()
+    vectors = np.stack(lead_processing.generate_buyer_persona_embeddings(personas, provider))
+    elapsed = time.perf_counter() - start
+    clusters = lead_processing.cluster_lead_embeddings([lead_processing.embedding_to_bytes(v) for v in vectors])
+    print(f'{label:<32} {elapsed:6.2f}s  {len(personas) / elapsed:8.0f} personas/s  {vectors.shape[1]:5d} dims  '
+          f'purity@{K} {neighbour_purity(vectors, labels):.3f}  cluster ARI {adjusted_rand_score(labels, clusters):.3f}')
+
+
+def main():
+    personas, labels = make_personas(LEAD_COUNT, SEGMENTS)
+    print(f'{LEAD_COUNT} personas in {SEGMENTS} segments (chance purity {1 / SEGMENTS:.3f})')
+    client = FakeOpenAIClient()
+    lead_processing.set_openai_client(client)
+    lead_processing.set_llm_cache(PersistentCache(':memory:'))
+    # The fake API returns random vectors, so only its timing is meaningful
+    run('openai (fake API, 50ms/request)', lead_processing.OpenAIEmbeddingProvider(), personas, labels)
+    for dimensions in (256, 1024):
+        run(f'hashing/tf-{dimensions}, 1 thread', HashingEmbeddingProvider(f'tf-{dimensions}', workers=1),
+            personas, labels)
+        run(f'hashing/tf-{dimensions}, 4 threads', HashingEmbeddingProvider(f'tf-{dimensions}', workers=4),
+            personas, labels)
+
+
+if __name__ == '__main__':
+    main()
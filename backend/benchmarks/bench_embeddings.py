@@ -0,0 +1,41 @@
+"""Per-lead versus batched, memoized persona embedding against a fake OpenAI client.
+
+Run from the backend directory: python -m benchmarks.bench_embeddings
+"""
+import random
+import time
+from app.services import lead_processing
+from app.utils.cache import PersistentCache
+from benchmarks.fakes import FakeOpenAIClient
+
+LEAD_COUNT = 500
+DUPLICATE_RATIO = 0.2
+
+
+def make_personas(count, duplicate_ratio, seed=7):
+    rng = random.Random(seed)
+    personas = [f'{{"industry": "Industry {i}", "size": "{rng.randint(1, 5000)}"}}' for i in range(count)]
+    for i in range(int(count * duplicate_ratio)):
+        personas[rng.randrange(count)] = personas[rng.randrange(count)]
+    return personas
+
+
+def run(label, embed, personas):
+    client = FakeOpenAIClient()
+    lead_processing.set_openai_client(client)
+    lead_processing.set_llm_cache(PersistentCache(':memory:'))
+    start = time.perf_counter()
+    embed(personas)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<22} {elapsed:7.2f}s  {len(personas) / elapsed:9.0f} leads/s  '
+          f'{client.embedding_requests:5d} requests  {client.embedded_items:5d} texts sent')
+
+
+def main():
+    personas = make_personas(LEAD_COUNT, DUPLICATE_RATIO)
+    run('one request per lead', lambda ps: [lead_processing.generate_buyer_persona_embedding(p) for p in ps], personas)
+    run('batched + memoized', lead_processing.generate_buyer_persona_embeddings, personas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""End-to-end benchmark suite: the enrichment pipeline against fake websites, OpenAI and Tavily,
+and the API endpoints over synthetic workorders.
+
+Reports calls, throughput, p50/p99 latency and peak memory (RSS growth) per
+pipeline stage and per endpoint. Stages run concurrently on the enrichment
+job's worker threads, so their throughput is per worker (items per second
+of stage time) and their memory is included in the pipeline row. Save a run
+and compare later runs against it to catch regressions before deploying:
+
+    python -m benchmarks.bench_pipeline --save baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json
+
+Run from the backend directory. Everything is written to a temporary
+directory; no network access or API keys are needed.
+"""
+import argparse
+import importlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import openai
+from benchmarks.fake_services import FakeSiteFarm, FakeAPIServer, FarmDriver
+from benchmarks.harness import Suite
+from benchmarks.synthetic import create_workorder, write_lead_file
+
+# Statuses cycled through by the batch status benchmark
+STATUS_CYCLE = ['in-progress', 'failed', 'converted', 'unchecked']
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pipeline-sizes', type=_sizes, default=[100, 1000],
+                        help='leads per uploaded file for the end-to-end enrichment runs')
+    parser.add_argument('--data-sizes', type=_sizes, default=[100, 1000, 10000, 100000],
+                        help='leads per synthetic workorder for the endpoint benchmarks')
+    parser.add_argument('--cluster-max', type=int, default=20000,
+                        help='largest workorder to run a full cluster fit on')
+    parser.add_argument('--repeat', type=int, default=20, help='calls per endpoint measurement')
+    parser.add_argument('--site-latency', type=float, default=0.05, help='seconds per fake website response')
+    parser.add_argument('--chat-latency', type=float, default=0.3, help='seconds per fake persona completion')
+    parser.add_argument('--embedding-latency', type=float, default=0.1, help='seconds per fake embeddings request')
+    parser.add_argument('--search-latency', type=float, default=0.2, help='seconds per fake search request')
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help='uploaded lead file format')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='flag results more than --tolerance slower than this saved run')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def load_app(workdir):
+    """Import the API with its database, caches and model files inside `workdir`."""
+    os.chdir(workdir)
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "workorders.db")}',
+        'VECTOR_INDEX_PATH': os.path.join(workdir, 'vector_index.db'),
+        'EMBEDDING_MATRIX_DIR': os.path.join(workdir, 'embedding_matrices'),
+        'CLUSTER_MODEL_DIR': os.path.join(workdir, 'cluster_models'),
+        'LLM_CACHE_PATH': os.path.join(workdir, 'llm_cache.db'),
+        'SCRAPE_CACHE_PATH': os.path.join(workdir, 'scrape_cache.db'),
+    })
+    return importlib.import_module('main')
+
+
+def timed(fn, result, count=None):
+    """Wrap `fn` so every call's latency (and `count(args)` items) is added to `result`."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            result.add(time.perf_counter() - start, count(args) if count else None)
+    return wrapper
+
+
+def wait_for_job(client, workorder_id, interval=0.05):
+    """Poll a workorder's progress until its background job has finished; returns the last progress."""
+    while True:
+        progress = client.get(f'/workorders/{workorder_id}/progress').json()
+        if not progress['running'] and progress['status'] in ('done', 'failed'):
+            return progress
+        time.sleep(interval)
+
+
+def fresh_caches(workdir, name):
+    # A new, empty cache per run, so no run is served from an earlier one
+    from app.services import lead_processing
+    from app.utils.cache import PersistentCache, set_scrape_cache
+    set_scrape_cache(PersistentCache(os.path.join(workdir, f'scrape_cache_{name}.db')))
+    lead_processing.set_llm_cache(PersistentCache(os.path.join(workdir, f'llm_cache_{name}.db')))
+
+
+def bench_pipeline(suite, client, workdir, sizes, file_format, farm):
+    """Upload lead files and run the background enrichment job to completion."""
+    from app.services import enrichment, lead_processing
+    # Each run gets companies of its own, so none is reused from an earlier run's workorder
+    first = 0
+    for size in sizes:
+        fresh_caches(workdir, f'pipeline_{size}')
+        path = write_lead_file(os.path.join(workdir, f'leads_{size}.{file_format}'), size, farm.url, seed=size,
+                               first=first)
+        first += size
+        patched = {
+            (enrichment, 'scrape_lead'): suite.result('stage', 'scrape (website + search)', size),
+            (lead_processing, 'search_company_website'): suite.result('stage', 'search (Tavily)', size),
+            (enrichment, 'generate_lead_persona'): suite.result('stage', 'persona', size),
+            (enrichment, 'generate_buyer_persona_embeddings'): suite.result('stage', 'embedding batch', size),
+            (enrichment, 'cluster_workorder'): suite.result('stage', 'cluster', size, items=size),
+        }
+        originals = {key: getattr(*key) for key in patched}
+        for (module, name), result in patched.items():
+            # Embedding throughput counts personas, not batches
+            count = (lambda args: len(args[0])) if name == 'generate_buyer_persona_embeddings' else None
+            setattr(module, name, timed(originals[(module, name)], result, count))
+        try:
+            upload = suite.result('pipeline', f'upload + enrich ({file_format})', size, items=size)
+            with suite.track(upload):
+                start = time.perf_counter()
+                with open(path, 'rb') as f:
+                    response = client.post('/workorders/upload', files={'file': (os.path.basename(path), f)})
+                workorder_id = response.json()['id']
+                progress = wait_for_job(client, workorder_id)
+                upload.add(time.perf_counter() - start)
+            print(f'pipeline {size}: {progress["status"]}, {progress["done"]} done, {progress["failed"]} failed, '
+                  f'{farm.requests} site requests so far')
+            timings = client.get(f'/workorders/{workorder_id}/timings').json()['stages']
+            print('  stage p95 ms: ' + ', '.join(f'{stage} {row["p95_ms"]:.0f}' for stage, row in timings.items()))
+        finally:
+            for (module, name), fn in originals.items():
+                setattr(module, name, fn)
+        # The serial per-lead path, on fresh caches
+        fresh_caches(workdir, f'process_lead_{size}')
+        sample = min(size, 50)
+        leads = [{'Name': f'Company {i}', 'Website': farm.url(i)} for i in range(sample)]
+        result = suite.result('stage', 'process_lead (serial)', size)
+        with suite.track(result):
+            for lead in leads:
+                start = time.perf_counter()
+                lead_processing.process_lead(lead)
+                result.add(time.perf_counter() - start)
+
+
+def bench_endpoints(suite, client, session_factory, workdir, sizes, repeat, cluster_max, file_format):
+    """Ingestion, listing, status updates, rerank, similarity, export and clustering over synthetic workorders."""
+    from app.services.ingestion import ingest_leads
+    from app.services.lead_processing import cluster_lead_embeddings
+    from models import Lead, Workorder
+    for size in sizes:
+        session = session_factory()
+        try:
+            path = write_lead_file(os.path.join(workdir, f'ingest_{size}.{file_format}'), size,
+                                   lambda i: f'https://company{i}.example', seed=size)
+            ingest_target = Workorder(filename=os.path.basename(path), original_file_path=path, status='done')
+            session.add(ingest_target)
+            session.commit()
+            suite.measure('data', f'ingest_leads ({file_format})', size,
+                          lambda: ingest_leads(session, ingest_target.id, path), items=size)
+
+            workorder_id = create_workorder(session, size, with_text=False, seed=size)
+            lead_ids = [row[0] for row in session.query(Lead.id).filter(Lead.workorder_id == workorder_id)
+                        .order_by(Lead.id).all()]
+            base = f'/workorders/{workorder_id}'
+
+            suite.measure('endpoint', 'GET /workorders/{id} first page', size,
+                          lambda: client.get(base).raise_for_status(), repeat)
+
+            def walk():
+                cursor = None
+                while True:
+                    params = {'limit': 5000, **({'cursor': cursor} if cursor else {})}
+                    cursor = client.get(base, params=params).raise_for_status().json()['next_cursor']
+                    if cursor is None:
+                        return
+            suite.measure('endpoint', 'GET /workorders/{id} all pages', size, walk, max(1, repeat // 10), items=size)
+            suite.measure('endpoint', 'GET /workorders/{id}/progress', size,
+                          lambda: client.get(f'{base}/progress').raise_for_status(), repeat)
+
+            updates = min(size, 1000)
+            calls = iter(range(10 ** 9))
+
+            def batch_status():
+                status = STATUS_CYCLE[next(calls) % len(STATUS_CYCLE)]
+                body = {str(lead_id): status for lead_id in lead_ids[:updates]}
+                client.post(f'{base}/leads/status/batch', params={'key': 'id'}, json=body).raise_for_status()
+            suite.measure('endpoint', f'POST status/batch ({updates} leads)', size, batch_status,
+                          max(1, repeat // 4), items=updates)
+            suite.measure('endpoint', 'POST /workorders/{id}/rerank', size,
+                          lambda: client.post(f'{base}/rerank', json=[]).raise_for_status(),
+                          max(1, repeat // 4), items=size)
+
+            suite.measure('endpoint', 'vector index build (first similar)', size,
+                          lambda: client.get(f'{base}/leads/{lead_ids[0]}/similar').raise_for_status(), items=size)
+            suite.measure('endpoint', 'GET similar (k=10, workorder)', size,
+                          lambda: client.get(f'{base}/leads/{lead_ids[1]}/similar').raise_for_status(), repeat)
+            suite.measure('endpoint', 'GET converted-matches (workorder)', size,
+                          lambda: client.get(f'{base}/converted-matches', params={'scope': 'workorder'})
+                          .raise_for_status(), repeat)
+            for export_format in ('csv', 'xlsx'):
+                suite.measure('endpoint', f'GET /workorders/{{id}}/export ({export_format})', size,
+                              lambda: client.get(f'{base}/export', params={'format': export_format})
+                              .raise_for_status(), max(1, repeat // 10), items=size)
+
+            if size <= cluster_max:
+                blobs = [row[0] for row in session.query(Lead.buyer_persona_embedding)
+                         .filter(Lead.workorder_id == workorder_id).all()]
+                suite.measure('stage', 'cluster_lead_embeddings', size, lambda: cluster_lead_embeddings(blobs),
+                              items=size)
+        finally:
+            session.close()
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    baseline = Suite.load(args.baseline) if args.baseline else None
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    cwd = os.getcwd()
+    suite = Suite()
+    try:
+        app_module = load_app(workdir)
+        from fastapi.testclient import TestClient
+        from app.services import lead_processing
+        from app.utils.web_scraper import BrowserPool, set_browser_pool
+
+        with FakeSiteFarm(latency=args.site_latency) as farm, FakeAPIServer(
+            chat_latency=args.chat_latency, embedding_latency=args.embedding_latency,
+            search_latency=args.search_latency,
+            search_url=lambda query: farm.url(int(re.search(r'\d+', query).group())) if re.search(r'\d+', query) else None,
+        ) as api:
+            lead_processing.set_openai_client(openai.OpenAI(base_url=api.openai_base_url, api_key='bench', max_retries=0))
+            lead_processing.TAVILY_API_KEY = 'bench'
+            lead_processing.TAVILY_API_URL = api.search_url_endpoint
+            set_browser_pool(BrowserPool(driver_factory=FarmDriver))
+            client = TestClient(app_module.app)
+            bench_pipeline(suite, client, workdir, args.pipeline_sizes, args.format, farm)
+            bench_endpoints(suite, client, app_module.SessionLocal, workdir, args.data_sizes, args.repeat,
+                            args.cluster_max, args.format)
+        print()
+        regressions = suite.report(baseline, args.tolerance)
+        if args.save:
+            suite.save(os.path.join(cwd, args.save))
+        return 1 if regressions else 0
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Embedding storage formats: size, load time and rerank agreement with float32.
+
+Run from the backend directory: python -m benchmarks.bench_quantization
+"""
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from scipy.stats import spearmanr
+from sqlalchemy import update
+from models import Lead
+from app.services import embedding_store
+from app.services.ranking import rerank_workorder, embedding_matrix_cache, normalize_rows, WorkorderEmbeddings
+from app.utils.embeddings import encode_embedding, decode_embeddings
+from benchmarks.synthetic import make_session_factory, create_workorder
+
+LEAD_COUNT = 20000
+STORAGES = ['float32', 'float16', 'int8']
+TOP_K = [10, 100, 1000]
+
+
+def reencode(session, workorder_id, storage):
+    rows = session.query(Lead.id, Lead.buyer_persona_embedding).filter(Lead.workorder_id == workorder_id).all()
+    matrix = decode_embeddings([row[1] for row in rows])
+    session.execute(update(Lead), [
+        {"id": row[0], "buyer_persona_embedding": encode_embedding(vector, storage)}
+        for row, vector in zip(rows, matrix)
+    ])
+    session.commit()
+
+
+def unchecked_scores(session, workorder_id):
+    """Lead ids of unchecked leads and their best similarity to a converted lead."""
+    rows = session.query(Lead.id, Lead.status, Lead.buyer_persona_embedding).filter(
+        Lead.workorder_id == workorder_id
+    ).order_by(Lead.id).all()
+    entry = WorkorderEmbeddings(
+        np.array([row[0] for row in rows]), normalize_rows(decode_embeddings([row[2] for row in rows]))
+    )
+    statuses = np.array([row[1] for row in rows], dtype=object)
+    scores = entry.converted_similarity(np.flatnonzero(statuses == 'converted'))
+    unchecked = np.flatnonzero(statuses == 'unchecked')
+    return entry.ids[unchecked], scores[unchecked]
+
+
+def main():
+    session_factory, path = make_session_factory()
+    embedding_store.EMBEDDING_MATRIX_DIR = tempfile.mkdtemp(prefix='bench_matrices_')
+    try:
+        session = session_factory()
+        workorders = {}
+        for storage in STORAGES:
+            # Same seed, so every workorder holds the same vectors in a different format
+            workorders[storage] = create_workorder(session, LEAD_COUNT, with_text=False, seed=7)
+            if storage != 'float32':
+                reencode(session, workorders[storage], storage)
+        # Compare by position: lead ids differ between the workorders
+        _, reference_scores = unchecked_scores(session, workorders['float32'])
+        reference_order = np.argsort(-reference_scores, kind='stable')
+        for storage, workorder_id in workorders.items():
+            blob = session.query(Lead.buyer_persona_embedding).filter(Lead.workorder_id == workorder_id).first()[0]
+            _, scores = unchecked_scores(session, workorder_id)
+            order = np.argsort(-scores, kind='stable')
+            recall = ', '.join(
+                f'recall@{k} {len(np.intersect1d(order[:k], reference_order[:k])) / k:.3f}' for k in TOP_K
+            )
+            rho = spearmanr(scores, reference_scores).statistic
+            print(f'{storage:>7}: {len(blob):5d} bytes/vector, {recall}, spearman {rho:.5f}, '
+                  f'max score error {np.abs(scores - reference_scores).max():.5f}')
+
+            embedding_matrix_cache.invalidate(workorder_id)
+            start = time.perf_counter()
+            embedding_store.load_workorder_embeddings(session, workorder_id)
+            load_db = time.perf_counter() - start
+            start = time.perf_counter()
+            _, matrix = embedding_store.load_workorder_embeddings(session, workorder_id)
+            float(matrix.sum())
+            load_side_file = time.perf_counter() - start
+            print(f'         load matrix: decode BLOBs {load_db * 1000:8.1f}ms, '
+                  f'memory-mapped side file {load_side_file * 1000:8.1f}ms')
+
+            embedding_matrix_cache.invalidate(workorder_id)
+            start = time.perf_counter()
+            rerank_workorder(session, workorder_id)
+            from_db = time.perf_counter() - start
+            session.commit()
+            # Drop only the in-memory entry; the side file written above stays
+            embedding_matrix_cache._entries.pop(workorder_id, None)
+            start = time.perf_counter()
+            rerank_workorder(session, workorder_id)
+            from_side_file = time.perf_counter() - start
+            session.commit()
+            print(f'         rerank with cold cache: decode BLOBs {from_db * 1000:8.1f}ms, '
+                  f'memory-mapped side file {from_side_file * 1000:8.1f}ms')
+        session.close()
+    finally:
+        os.remove(path)
+        shutil.rmtree(embedding_store.EMBEDDING_MATRIX_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
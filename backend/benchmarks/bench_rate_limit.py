@@ -0,0 +1,84 @@
+"""Persona generation against a fake OpenAI server that throttles and fails, with and without the rate limiter.
+
+The server answers at most --max-rps completions per second and 429s the
+rest with a Retry-After; the outage scenario answers everything with 503
+for a few seconds. Without the limiter those leads end up with no
+persona; with it they are slowed down, paused and retried instead.
+
+Run from the backend directory: python -m benchmarks.bench_rate_limit
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import openai
+from app.services import lead_processing
+from app.utils.cache import PersistentCache
+from app.utils.metrics import get_metrics
+from app.utils.rate_limit import AdaptiveRateLimiter, set_rate_limiter
+from benchmarks.fake_services import FakeAPIServer
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--leads', type=int, default=200, help='personas generated per scenario')
+    parser.add_argument('--concurrency', type=int, default=32, help='worker threads, like ENRICHMENT_CONCURRENCY')
+    parser.add_argument('--max-rps', type=int, default=20, help='completions per second the fake server allows')
+    parser.add_argument('--rate', type=float, default=50, help='configured limiter rate, above the server limit')
+    parser.add_argument('--outage', type=float, default=3, help='seconds of 503s in the outage scenario')
+    parser.add_argument('--chat-latency', type=float, default=0.05)
+    return parser.parse_args(argv)
+
+
+def lead_text(i):
+    return '\n'.join(
+        f'Company {i} helps logistics teams reduce fintech costs by {i % 50 + 5} percent with connected '
+        f'platform data for {i * 7 % 5000} customers across {paragraph + 2} regions.'
+        for paragraph in range(3)
+    )
+
+
+def run(label, args, limiter, outage=0.0):
+    get_metrics().reset()
+    with FakeAPIServer(chat_latency=args.chat_latency, max_rps=None if outage else args.max_rps) as api:
+        lead_processing.set_openai_client(openai.OpenAI(base_url=api.openai_base_url, api_key='bench', max_retries=0))
+        lead_processing.set_llm_cache(PersistentCache(':memory:'))
+        set_rate_limiter('openai', limiter)
+        if outage:
+            api.outage(outage)
+
+        def persona(i):
+            try:
+                return lead_processing.generate_buyer_persona_from_text(lead_text(i), {'Name': f'Company {i}'})
+            except Exception:
+                return None
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            personas = list(pool.map(persona, range(args.leads)))
+        elapsed = time.perf_counter() - start
+    _, counters = get_metrics().snapshot()
+    trips = sum(value for (name, _), value in counters.items() if name == 'lead_provider_circuit_trips_total')
+    lost = sum(1 for p in personas if not p)
+    print(f'{label:<24} {elapsed:7.2f}s {args.leads / elapsed:8.1f}/s {lost:6d} {api.throttled:6d} {api.failed:6d} '
+          f'{api.requests:8d} {trips:6d} {limiter.stats()["rate"]:9.1f}')
+    return lost
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    print(f'{args.leads} personas, {args.concurrency} threads, server limit {args.max_rps}/s')
+    print(f'{"scenario":<24} {"time":>8} {"leads":>10} {"lost":>6} {"429s":>6} {"503s":>6} '
+          f'{"requests":>8} {"trips":>6} {"end rate":>9}')
+    # No pacing, no retries and a circuit that never opens: every 429 or 503 loses its lead
+    unlimited = dict(rate=10 ** 6, burst=10 ** 6, max_retries=0, failure_threshold=10 ** 9)
+    run('no limiter (429s)', args, AdaptiveRateLimiter('openai', **unlimited))
+    lost = run('adaptive limiter (429s)', args, AdaptiveRateLimiter('openai', args.rate, int(args.rate)))
+    run('no limiter (outage)', args, AdaptiveRateLimiter('openai', **unlimited), outage=args.outage)
+    lost += run('circuit breaker (outage)', args,
+                AdaptiveRateLimiter('openai', args.rate, int(args.rate), cooldown=1), outage=args.outage)
+    return 1 if lost else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
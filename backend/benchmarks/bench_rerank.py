@@ -0,0 +1,88 @@
+"""Vectorized rerank versus the original nested-loop implementation.
+
+Run from the backend directory: python -m benchmarks.bench_rerank
+"""
+import os
+import time
+import numpy as np
+from models import Lead
+from app.services.ranking import rerank_workorder, embedding_matrix_cache
+from benchmarks.synthetic import make_session_factory, create_workorder
+
+SIZES = [1000, 10000, 50000]
+# The nested loop is only timed up to this size; beyond it takes minutes
+LEGACY_MAX_SIZE = 10000
+
+
+def legacy_unchecked_order(session, workorder_id):
+    """The pre-vectorization scoring loop, kept here as the reference ordering."""
+    leads = session.query(Lead).filter(Lead.workorder_id == workorder_id).order_by(Lead.id).all()
+    converted = [np.frombuffer(l.buyer_persona_embedding, dtype=np.float32) for l in leads
+                 if l.status == 'converted' and l.buyer_persona_embedding is not None]
+    unchecked = [l for l in leads if (l.status == 'unchecked' or not l.status) and l.buyer_persona_embedding is not None]
+
+    def cosine_similarity(a, b):
+        if np.linalg.norm(a) == 0 or np.linalg.norm(b) == 0:
+            return 0.0
+        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+    scored = []
+    for lead in unchecked:
+        emb = np.frombuffer(lead.buyer_persona_embedding, dtype=np.float32)
+        score = max([cosine_similarity(emb, c) for c in converted]) if converted else 0.0
+        scored.append((lead.id, score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored
+
+
+def orders_agree(got_ids, expected, tolerance=1e-6):
+    """Same order, except swaps between leads whose legacy scores differ only by float32 rounding."""
+    if len(got_ids) != len(expected):
+        return False
+    score_of = dict(expected)
+    for got_id, (expected_id, expected_score) in zip(got_ids, expected):
+        if got_id != expected_id and abs(score_of[got_id] - expected_score) > tolerance:
+            return False
+    return True
+
+
+def main():
+    session_factory, path = make_session_factory()
+    try:
+        for size in SIZES:
+            session = session_factory()
+            workorder_id = create_workorder(session, size, with_text=False, seed=size)
+            embedding_matrix_cache.invalidate(workorder_id)
+            start = time.perf_counter()
+            order = rerank_workorder(session, workorder_id)
+            cold = time.perf_counter() - start
+            session.commit()
+            # Warm: cached matrix, display orders already settled
+            start = time.perf_counter()
+            rerank_workorder(session, workorder_id)
+            warm = time.perf_counter() - start
+            session.commit()
+            # One status click: an unchecked lead becomes converted
+            lead_id = next(lead_id for lead_id, status, _ in order if status == 'unchecked')
+            session.query(Lead).filter(Lead.id == lead_id).update({Lead.status: 'converted'})
+            session.commit()
+            start = time.perf_counter()
+            order = rerank_workorder(session, workorder_id)
+            click = time.perf_counter() - start
+            session.commit()
+            line = (f'{size:>6} leads: vectorized cold {cold * 1000:8.1f}ms, warm {warm * 1000:8.1f}ms, '
+                    f'after one status change {click * 1000:8.1f}ms')
+            if size <= LEGACY_MAX_SIZE:
+                start = time.perf_counter()
+                expected = legacy_unchecked_order(session, workorder_id)
+                legacy = time.perf_counter() - start
+                got = [lead_id for lead_id, status, _ in order if (status or 'unchecked') == 'unchecked']
+                line += f', legacy {legacy * 1000:9.1f}ms, same order: {orders_agree(got, expected)}'
+            print(line)
+            session.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
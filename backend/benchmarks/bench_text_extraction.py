@@ -0,0 +1,74 @@
+"""Boilerplate-stripping extraction and token-budgeted selection versus the original full-page text.
+
+Run from the backend directory: python -m benchmarks.bench_text_extraction
+"""
+import time
+import numpy as np
+from bs4 import BeautifulSoup
+from app.utils.text_extraction import extract_main_text, select_informative_text, estimate_tokens
+
+PAGE_COUNT = 200
+# Paragraphs of real content per page, as (min, max)
+CONTENT_PARAGRAPHS = (5, 60)
+
+
+def legacy_text(html):
+    """The original extract_text_with_bs4 parse."""
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(['script', 'style']):
+        tag.decompose()
+    return soup.get_text(separator=' ', strip=True)
+
+
+def synthetic_page(rng, i):
+    nav = ''.join(f'<li><a href="/p{j}">Menu item {j}</a></li>' for j in range(60))
+    paragraphs = ''.join(
+        f'<p>Company {i} helps logistics team {j} cut freight costs by {rng.integers(5, 50)} percent. '
+        f'Its platform integrates carrier {j} data with warehouse system {j * 7}. '
+        'Book a demo today to see how it works.</p>'
+        for j in range(rng.integers(*CONTENT_PARAGRAPHS))
+    )
+    footer = ''.join(f'<a href="/f{j}">Footer link {j}</a>' for j in range(40))
+    return (
+        '<html><head><style>body { color: #333 }</style><script>var tracking = 1;</script></head><body>'
+        f'<header><nav><ul>{nav}</ul></nav></header>'
+        '<div class="cookie-banner">We use cookies to improve your experience. Accept all cookies.</div>'
+        f'<main><h1>Company {i}</h1>{paragraphs}</main>'
+        '<div class="newsletter-signup">Subscribe to our newsletter for the latest updates.</div>'
+        f'<footer>{footer}<p>Copyright Company {i}. All rights reserved.</p></footer>'
+        '</body></html>'
+    )
+
+
+def main():
+    rng = np.random.default_rng(0)
+    pages = [synthetic_page(rng, i) for i in range(PAGE_COUNT)]
+
+    start = time.perf_counter()
+    legacy_tokens = [estimate_tokens(legacy_text(html)) for html in pages]
+    legacy_seconds = time.perf_counter() - start
+
+    stats = [{} for _ in pages]
+    start = time.perf_counter()
+    texts = [extract_main_text(html, s) for html, s in zip(pages, stats)]
+    extract_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for text, s in zip(texts, stats):
+        select_informative_text(text, stats=s)
+    select_seconds = time.perf_counter() - start
+
+    prompt_tokens = np.array([s['prompt_tokens'] for s in stats])
+    legacy_tokens = np.array(legacy_tokens)
+    print(f'{PAGE_COUNT} pages')
+    print(f'legacy:  {legacy_seconds / PAGE_COUNT * 1000:6.2f}ms/page, prompt tokens '
+          f'mean {legacy_tokens.mean():7.0f}, p99 {np.percentile(legacy_tokens, 99):7.0f}')
+    print(f'new:     {(extract_seconds + select_seconds) / PAGE_COUNT * 1000:6.2f}ms/page '
+          f'(extract {extract_seconds / PAGE_COUNT * 1000:.2f}, select {select_seconds / PAGE_COUNT * 1000:.2f}), '
+          f'prompt tokens mean {prompt_tokens.mean():7.0f}, p99 {np.percentile(prompt_tokens, 99):7.0f}')
+    print(f'boilerplate blocks removed per page {np.mean([s["boilerplate_blocks"] for s in stats]):.1f}, '
+          f'duplicate sentences dropped per page {np.mean([s["duplicate_sentences"] for s in stats]):.1f}, '
+          f'prompt tokens cut {1 - prompt_tokens.sum() / legacy_tokens.sum():.1%}')
+
+
+if __name__ == '__main__':
+    main()
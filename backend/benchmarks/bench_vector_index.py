@@ -0,0 +1,50 @@
+"""Recall and latency of the IVF vector index against exact search.
+
+Run from the backend directory: python -m benchmarks.bench_vector_index
+"""
+import os
+import tempfile
+import time
+import numpy as np
+from app.services.vector_index import VectorIndex, global_scope
+from benchmarks.synthetic import synthetic_embeddings
+
+SIZES = [5000, 20000, 50000]
+MODEL = 'openai/text-embedding-3-small'
+SCOPE = global_scope(MODEL)
+QUERIES = 50
+K = 10
+
+
+def main():
+    for size in SIZES:
+        fd, path = tempfile.mkstemp(suffix='.db', prefix='bench_index_')
+        os.close(fd)
+        try:
+            vectors = synthetic_embeddings(size, clusters=200, seed=size)
+            index = VectorIndex(path, exact_threshold=1000)
+            start = time.perf_counter()
+            for batch_start in range(0, size, 2000):
+                index.add(1, [(i + 1, vectors[i]) for i in range(batch_start, min(batch_start + 2000, size))], MODEL)
+            # Retraining runs in the background; include it in the build time
+            index.wait_for_training()
+            build = time.perf_counter() - start
+            exact = VectorIndex(path, exact_threshold=size + 1)
+            queries = vectors[np.random.default_rng(1).choice(size, QUERIES, replace=False)]
+            recall, ann_time, exact_time = 0.0, 0.0, 0.0
+            for q in queries:
+                start = time.perf_counter()
+                got = {r[0] for r in index.search(q, K, SCOPE)}
+                ann_time += time.perf_counter() - start
+                start = time.perf_counter()
+                expected = {r[0] for r in exact.search(q, K, SCOPE)}
+                exact_time += time.perf_counter() - start
+                recall += len(got & expected) / K
+            print(f'{size:>6} vectors: build {build:6.1f}s, ANN {ann_time / QUERIES * 1000:7.1f}ms/query, '
+                  f'exact {exact_time / QUERIES * 1000:7.1f}ms/query, recall@{K} {recall / QUERIES:.3f}')
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
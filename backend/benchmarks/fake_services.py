@@ -0,0 +1,281 @@
+"""Local HTTP servers standing in for company websites, OpenAI and Tavily.
+
+Unlike the in-process fakes in `fakes.py`, these go through real sockets,
+so the shared HTTP client, the OpenAI SDK and their connection pools are
+part of what gets measured.
+"""
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import httpx
+import orjson
+from benchmarks.fakes import StubDriver, fake_embedding
+
+# Vocabulary per industry segment, so personas and embeddings have cluster structure
+SEGMENTS = ['logistics', 'fintech', 'healthcare', 'retail', 'manufacturing', 'security', 'education', 'energy']
+_SEGMENT_WORDS = {
+    segment: [f'{segment}{word}' for word in ('platform', 'operations', 'compliance', 'analytics', 'suppliers',
+                                              'customers', 'automation', 'billing', 'onboarding', 'reporting')]
+    for segment in SEGMENTS
+}
+_COMPANY = re.compile(r'Company (\d+)')
+
+
+def company_segment(i):
+    return SEGMENTS[i % len(SEGMENTS)]
+
+
+def company_page(i, paragraphs=12, seed=0):
+    """HTML of company `i`: content paragraphs wrapped in navigation, cookie banner and footer."""
+    rng = random.Random(seed * 1_000_003 + i)
+    words = _SEGMENT_WORDS[company_segment(i)]
+    nav = ''.join(f'<li><a href="/p{j}">Menu item {j}</a></li>' for j in range(40))
+    content = ''.join(
+        f'<p>Company {i} helps {rng.choice(words)} teams reduce {rng.choice(words)} costs by '
+        f'{rng.randint(5, 60)} percent. Its {rng.choice(words)} product connects {rng.choice(words)} '
+        f'data with existing {rng.choice(words)} systems for {rng.randint(10, 5000)} customers.</p>'
+        for _ in range(paragraphs)
+    )
+    return (
+        '<html><head><script>var tracking = 1;</script></head><body>'
+        f'<nav><ul>{nav}</ul></nav>'
+        '<div class="cookie-banner">We use cookies to improve your experience.</div>'
+        f'<main><h1>Company {i}</h1>{content}</main>'
+        f'<footer>Copyright Company {i}. All rights reserved.</footer>'
+        '</body></html>'
+    )
+
+
+class _Server:
+    """ThreadingHTTPServer on a background thread; usable as a context manager."""
+
+    def __init__(self, handler, host='127.0.0.1'):
+        self._httpd = ThreadingHTTPServer((host, 0), handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self.port = self._httpd.server_address[1]
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def _delay(self, latency, jitter):
+        if latency > 0:
+            time.sleep(latency * (1 + jitter * (2 * random.random() - 1)))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _SiteHandler(_Handler):
+    def do_GET(self):
+        farm = self.server.owner
+        farm._count()
+        farm._delay(farm.latency, farm.jitter)
+        match = re.match(r'/company/(\d+)', self.path)
+        if not match or farm.is_dead(int(match.group(1))):
+            self._send(404, b'not found', 'text/plain')
+            return
+        page = company_page(int(match.group(1)), farm.paragraphs, farm.seed)
+        self._send(200, page.encode('utf-8'), 'text/html; charset=utf-8')
+
+
+class FakeSiteFarm(_Server):
+    """Company websites, one distinct host per company.
+
+    Sites are served on 127.x.y.z loopback addresses so the scraper's
+    per-host concurrency limit sees separate hosts. Every response waits
+    `latency` seconds (+/- `jitter` as a fraction); `dead_ratio` of the
+    companies answer 404.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.5, dead_ratio=0.02, paragraphs=12, seed=0):
+        # Listen on every loopback address
+        super().__init__(_SiteHandler, host='0.0.0.0')
+        self.latency = latency
+        self.jitter = jitter
+        self.paragraphs = paragraphs
+        self.dead_ratio = dead_ratio
+        self.seed = seed
+
+    def is_dead(self, i):
+        return random.Random(self.seed * 1_000_003 + i).random() < self.dead_ratio
+
+    def url(self, i):
+        n = i + 1
+        return f'http://127.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}:{self.port}/company/{i}'
+
+
+class FarmDriver(StubDriver):
+    """Stub WebDriver that "renders" pages by fetching them from the site farm."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._html = ''
+
+    def get(self, url):
+        super().get(url)
+        response = httpx.get(url, timeout=10)
+        self._html = response.text
+        self.page_text = re.sub(r'<[^>]+>', ' ', response.text)
+
+    @property
+    def page_source(self):
+        return self._html
+
+
+class _APIHandler(_Handler):
+    def do_POST(self):
+        api = self.server.owner
+        api._count()
+        body = orjson.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        failure = api.injected_failure(self.path.rsplit('/', 1)[-1])
+        if failure:
+            status, headers = failure
+            error = {"error": {"message": f"Injected {status}", "type": "fake", "code": str(status)}}
+            self._send(status, orjson.dumps(error), 'application/json', headers)
+            return
+        if self.path.endswith('/chat/completions'):
+            api._delay(api.chat_latency, api.jitter)
+            payload = api.chat_response(body)
+        elif self.path.endswith('/embeddings'):
+            inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+            api._delay(api.embedding_latency + api.per_item_latency * len(inputs), api.jitter)
+            payload = {
+                "object": "list",
+                "model": body.get('model'),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(text, api.dimensions).tolist()}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        elif self.path.endswith('/search'):
+            api._delay(api.search_latency, api.jitter)
+            url = api.search_url(body.get('query', ''))
+            payload = {"results": [{"url": url}] if url else []}
+        else:
+            self._send(404, b'{}', 'application/json')
+            return
+        self._send(200, orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), 'application/json')
+
+
+class FakeAPIServer(_Server):
+    """OpenAI-compatible chat completions and embeddings plus a Tavily-style search endpoint.
+
+    Point the OpenAI SDK at `openai_base_url` and Tavily requests at
+    `search_url_endpoint`. Personas echo the company number and industry
+    words found in the prompt; `search_url(query)` maps a search query to
+    the website URL to return.
+
+    Throttling can be injected: each endpoint answers at most `max_rps`
+    requests per second and 429s the rest (with `Retry-After: retry_after`
+    unless it is None), `error_ratio` of requests get a 503, and `outage()`
+    makes every request fail with 503 for a while.
+    """
+
+    def __init__(self, chat_latency=0.3, embedding_latency=0.1, per_item_latency=0.0002, search_latency=0.2,
+                 jitter=0.5, dimensions=1536, search_url=None, max_rps=None, retry_after=1, error_ratio=0.0):
+        super().__init__(_APIHandler)
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self.error_ratio = error_ratio
+        self.throttled = 0
+        self.failed = 0
+        self._outage_until = 0.0
+        # Requests answered per endpoint in the current one-second window
+        self._windows = {}
+        self.chat_latency = chat_latency
+        self.embedding_latency = embedding_latency
+        self.per_item_latency = per_item_latency
+        self.search_latency = search_latency
+        self.jitter = jitter
+        self.dimensions = dimensions
+        self.search_url = search_url or (lambda query: None)
+
+    def outage(self, seconds):
+        """Answer every request with 503 for the next `seconds`."""
+        self._outage_until = time.monotonic() + seconds
+
+    def injected_failure(self, endpoint):
+        """`(status, headers)` to fail this request with, or None to serve it."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._outage_until or (self.error_ratio and random.random() < self.error_ratio):
+                self.failed += 1
+                return 503, {}
+            if self.max_rps is None:
+                return None
+            second, served = self._windows.get(endpoint, (int(now), 0))
+            if second != int(now):
+                second, served = int(now), 0
+            if served >= self.max_rps:
+                self.throttled += 1
+                return 429, {'Retry-After': str(self.retry_after)} if self.retry_after is not None else {}
+            self._windows[endpoint] = (second, served + 1)
+            return None
+
+    @property
+    def openai_base_url(self):
+        return f'http://127.0.0.1:{self.port}/v1/'
+
+    @property
+    def search_url_endpoint(self):
+        return f'http://127.0.0.1:{self.port}/search'
+
+    def chat_response(self, body):
+        prompt = body['messages'][-1]['content']
+        match = _COMPANY.search(prompt)
+        company = int(match.group(1)) if match else 0
+        words = sorted({w for w in re.findall(r'[a-z]+', prompt) if any(w.startswith(s) for s in SEGMENTS)})
+        persona = {
+            "company": f"Company {company}",
+            "industry": company_segment(company),
+            "focus_areas": words[:6],
+            "quotes": [f"Company {company} helps teams reduce costs."],
+        }
+        return {
+            "id": f"chatcmpl-{company}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": orjson.dumps(persona).decode('utf-8')},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 60, "total_tokens": len(prompt) // 4 + 60},
+        }
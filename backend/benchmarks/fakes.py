@@ -0,0 +1,107 @@
+"""Offline stand-ins for the external services the lead pipeline talks to."""
+import time
+
+
+class _StubElement:
+    def __init__(self, driver):
+        self._driver = driver
+
+    @property
+    def text(self):
+        return self._driver.page_text
+
+    def send_keys(self, *keys):
+        pass
+
+
+class StubDriver:
+    """Minimal Selenium WebDriver replacement for exercising BrowserPool offline.
+
+    `launch_delay` simulates Chrome start-up cost, `load_delay` the page load,
+    and any URL in `crash_urls` raises like a crashed browser tab.
+    """
+
+    instances = 0
+
+    def __init__(self, launch_delay=0.0, load_delay=0.0, crash_urls=(), words_per_page=50):
+        time.sleep(launch_delay)
+        StubDriver.instances += 1
+        self.load_delay = load_delay
+        self.crash_urls = set(crash_urls)
+        self.words_per_page = words_per_page
+        self.page_text = ''
+        self.pages_loaded = 0
+        self.quit_called = False
+
+    def get(self, url):
+        if url in self.crash_urls:
+            raise RuntimeError(f'tab crashed loading {url}')
+        time.sleep(self.load_delay)
+        self.pages_loaded += 1
+        self.page_text = ' '.join([url] * self.words_per_page)
+
+    @property
+    def page_source(self):
+        return f'<html><body><p>{self.page_text}</p></body></html>'
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def execute_script(self, script, *args):
+        return 'complete'
+
+    def find_element(self, by, value):
+        return _StubElement(self)
+
+    def quit(self):
+        self.quit_called = True
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def fake_embedding(text, dimensions=1536):
+    """Deterministic unit vector derived from the text, so duplicates embed identically."""
+    import hashlib
+    import numpy as np
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOpenAIClient:
+    """In-process stand-in for the `openai` client used by lead_processing.
+
+    Each request sleeps `request_latency` plus `per_item_latency` per input,
+    and request counts are recorded so batching can be measured.
+    """
+
+    def __init__(self, request_latency=0.05, per_item_latency=0.0005, dimensions=1536):
+        import threading
+        self.request_latency = request_latency
+        self.per_item_latency = per_item_latency
+        self.dimensions = dimensions
+        self.chat_requests = 0
+        self.embedding_requests = 0
+        self.embedded_items = 0
+        self._lock = threading.Lock()
+        self.chat = _Obj(completions=_Obj(create=self._chat_create))
+        self.embeddings = _Obj(create=self._embeddings_create)
+
+    def _chat_create(self, model, messages, **kwargs):
+        with self._lock:
+            self.chat_requests += 1
+        time.sleep(self.request_latency)
+        content = '{"industry": "Software", "summary": "%s"}' % messages[-1]['content'][-40:].replace('"', "'")
+        return _Obj(choices=[_Obj(message=_Obj(content=content))])
+
+    def _embeddings_create(self, model, input, **kwargs):
+        inputs = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            self.embedding_requests += 1
+            self.embedded_items += len(inputs)
+        time.sleep(self.request_latency + self.per_item_latency * len(inputs))
+        data = [_Obj(index=i, embedding=fake_embedding(text, self.dimensions).tolist()) for i, text in enumerate(inputs)]
+        return _Obj(data=data)
@@ -0,0 +1,156 @@
+"""Latency, throughput and peak-memory measurement for the benchmark suite."""
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import orjson
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+
+
+class PeakMemory:
+    """Samples RSS on a background thread; `peak` is the growth over the starting RSS in bytes.
+
+    Covers numpy buffers and native allocations that tracemalloc would miss,
+    at the cost of missing spikes shorter than `interval`.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss() - self.start_rss)
+
+    def __enter__(self):
+        self.start_rss = current_rss()
+        self._thread = threading.Thread(target=self._sample, name='peak-memory', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss() - self.start_rss)
+
+
+class Result:
+    """Latencies of one benchmarked operation; `items` is the work done per call (rows, leads, ...)."""
+
+    def __init__(self, section, name, size, items=1):
+        self.section = section
+        self.name = name
+        self.size = size
+        self.items = items
+        self.latencies = []
+        self.total_items = 0
+        self.wall = 0.0
+        self.peak_memory = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds, items=None):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.total_items += self.items if items is None else items
+
+    def summary(self):
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        # Results filled in from worker threads have no wall time: report per-worker throughput
+        wall = self.wall or float(latencies.sum())
+        return {
+            "section": self.section,
+            "name": self.name,
+            "size": self.size,
+            "calls": len(self.latencies),
+            "throughput": self.total_items / wall if wall > 0 else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+            "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+            "peak_mb": self.peak_memory / 2 ** 20 if self.peak_memory is not None else None,
+        }
+
+
+class Suite:
+    """Collects results, prints them as a table and compares them with a saved baseline."""
+
+    def __init__(self):
+        self.results = []
+
+    def result(self, section, name, size, items=1):
+        result = Result(section, name, size, items)
+        self.results.append(result)
+        return result
+
+    def measure(self, section, name, size, fn, repeat=1, items=1):
+        """Call `fn()` `repeat` times, recording each call's latency and the peak memory of all calls."""
+        result = self.result(section, name, size, items)
+        with self.track(result):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                result.add(time.perf_counter() - start)
+        return result
+
+    @contextmanager
+    def track(self, result):
+        """Record wall time and peak memory of a block; latencies are added by the caller."""
+        start = time.perf_counter()
+        with PeakMemory() as memory:
+            yield result
+        result.wall = time.perf_counter() - start
+        result.peak_memory = memory.peak
+
+    @staticmethod
+    def _key(row):
+        return row['section'], row['name'], row['size']
+
+    def report(self, baseline=None, tolerance=0.2):
+        """Print every result; with a baseline, flag p50/p99 latencies more than `tolerance` slower.
+
+        Returns the number of regressions.
+        """
+        previous = {self._key(row): row for row in baseline or []}
+        regressions = 0
+        print(f'{"section":<10} {"name":<34} {"size":>7} {"calls":>6} {"items/s":>10} '
+              f'{"p50 ms":>9} {"p99 ms":>9} {"peak MB":>8}')
+        for result in self.results:
+            row = result.summary()
+            peak = f'{row["peak_mb"]:>8.1f}' if row['peak_mb'] is not None else f'{"-":>8}'
+            line = (f'{row["section"]:<10} {row["name"]:<34} {row["size"]:>7} {row["calls"]:>6} '
+                    f'{row["throughput"]:>10.1f} {row["p50_ms"]:>9.2f} {row["p99_ms"]:>9.2f} {peak}')
+            old = previous.get(self._key(row))
+            if old is not None:
+                slower = [
+                    f'{metric} {row[metric] / old[metric] - 1:+.0%}' for metric in ('p50_ms', 'p99_ms')
+                    if old[metric] > 0 and row[metric] > old[metric] * (1 + tolerance)
+                ]
+                if slower:
+                    regressions += 1
+                    line += '  REGRESSION ' + ', '.join(slower)
+            print(line)
+        return regressions
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps([result.summary() for result in self.results], option=orjson.OPT_INDENT_2))
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
@@ -0,0 +1,93 @@
+"""Synthetic lead files, workorders and embeddings for offline benchmarks."""
+import csv
+import os
+import tempfile
+import numpy as np
+import openpyxl
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+from models import Workorder, Lead
+from database import create_db_engine, init_db
+
+STATUSES = ['unchecked', 'converted', 'failed', 'in-progress']
+
+
+def synthetic_embeddings(count, dimensions=1536, clusters=20, seed=0):
+    """Unit vectors scattered around `clusters` random centres, like persona embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centres[labels] + 0.6 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_session_factory(path=None):
+    """Fresh SQLite database with the app schema; returns (session_factory, path)."""
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(fd)
+    engine = create_db_engine(f'sqlite:///{path}')
+    init_db(engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine), path
+
+
+def create_workorder(session, lead_count, converted_ratio=0.05, dimensions=1536, seed=0,
+                     with_text=True, batch_size=2000, embedding_model='openai/text-embedding-3-small'):
+    """Insert a workorder whose leads have embeddings, personas and random statuses."""
+    rng = np.random.default_rng(seed)
+    workorder = Workorder(filename=f'synthetic_{lead_count}.csv', original_file_path='synthetic', status='done',
+                          embedding_model=embedding_model, embedding_dim=dimensions)
+    session.add(workorder)
+    session.commit()
+    embeddings = synthetic_embeddings(lead_count, dimensions, seed=seed)
+    status_weights = [1 - converted_ratio - 0.1, converted_ratio, 0.05, 0.05]
+    statuses = rng.choice(STATUSES, size=lead_count, p=status_weights)
+    for start in range(0, lead_count, batch_size):
+        rows = []
+        for i in range(start, min(start + batch_size, lead_count)):
+            rows.append({
+                "workorder_id": workorder.id,
+                "data": {"Company": f"Company {i}", "Website": f"company{i}.example", "Employees": int(rng.integers(1, 5000))},
+                "raw_webpage_text": ("Company %d builds software for logistics teams. " % i) * 40 if with_text else None,
+                "buyer_persona": '{"industry": "Logistics", "company": "Company %d"}' % i if with_text else None,
+                "buyer_persona_embedding": embeddings[i].tobytes(),
+                "company_name": f"Company {i}",
+                "status": str(statuses[i]),
+                "enrichment_status": "done",
+                "cluster_id": int(i % 20),
+            })
+        session.execute(insert(Lead), rows)
+        session.commit()
+    return workorder.id
+
+
+def write_lead_file(path, count, website_url, missing_website_ratio=0.1, seed=0, first=0):
+    """Write `count` leads to a CSV or XLSX file (by extension) like a user upload.
+
+    Row `i` is "Company i" with website `website_url(i)`, for `i` from
+    `first`, except for `missing_website_ratio` of the rows, which only have
+    a name and must be found by search.
+    """
+    rng = np.random.default_rng(seed)
+    header = ['Name', 'Website', 'Employees', 'Country']
+    missing = rng.random(count) < missing_website_ratio
+    employees = rng.integers(1, 5000, size=count)
+
+    def rows():
+        for i in range(count):
+            yield [f'Company {first + i}', '' if missing[i] else website_url(first + i), int(employees[i]), 'US']
+
+    if path.lower().endswith('.xlsx'):
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        for row in rows():
+            sheet.append(row)
+        workbook.save(path)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows())
+    return path
@@ -0,0 +1,109 @@
+import os
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
+from models import Base
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./workorders.db')
+# How long a SQLite writer waits for a lock before raising "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '30000'))
+# Connection pool sizing for server databases such as Postgres
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+# Columns added after the initial schema, in the order of
+# database_schema_mods.sql: (table, column, server default, statements to run once added)
+COLUMN_MIGRATIONS = [
+    ('leads', 'raw_webpage_text', None, []),
+    ('leads', 'buyer_persona', None, []),
+    ('leads', 'buyer_persona_embedding', None, []),
+    ('leads', 'cluster_id', None, []),
+    ('leads', 'company_name', None, []),
+    ('leads', 'display_order', None, []),
+    ('leads', 'status', "'unchecked'", []),
+    ('leads', 'enrichment_status', "'pending'", [
+        "UPDATE leads SET enrichment_status = 'done' WHERE buyer_persona IS NOT NULL OR raw_webpage_text IS NOT NULL",
+    ]),
+    ('leads', 'extraction_stats', None, []),
+    ('leads', 'enrichment_stage', None, []),
+    ('leads', 'failed_stage', None, []),
+    ('leads', 'enrichment_error', None, []),
+    # Everything embedded before providers were pluggable came from OpenAI
+    ('workorders', 'embedding_model', None, [
+        "UPDATE workorders SET embedding_model = 'openai/text-embedding-3-small'",
+    ]),
+    ('workorders', 'embedding_dim', None, [
+        "UPDATE workorders SET embedding_dim = 1536 WHERE embedding_model = 'openai/text-embedding-3-small'",
+    ]),
+    ('workorders', 'stage_timings', None, []),
+    # Leads enriched before this have no key and are never reused
+    ('leads', 'enrichment_key', None, []),
+    ('leads', 'source_text_hash', None, []),
+    ('leads', 'enriched_at', None, []),
+    ('leads', 'rerank_score', None, []),
+]
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets the API read while the enrichment job writes
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-65536')
+    cursor.close()
+
+
+def create_db_engine(url=DATABASE_URL):
+    """Engine for `url`: SQLite in WAL mode with a busy timeout, otherwise a sized connection pool."""
+    if url.startswith('sqlite'):
+        engine = create_engine(url, connect_args={
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        })
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+        return engine
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+
+def run_migrations(engine):
+    """Bring an existing database up to the current models.
+
+    Adds any columns missing from databases created by older
+    versions, then creates the indexes declared on the models.
+    """
+    inspector = inspect(engine)
+    existing = {
+        table: {column['name'] for column in inspector.get_columns(table)}
+        for table in {migration[0] for migration in COLUMN_MIGRATIONS}
+    }
+    with engine.begin() as connection:
+        for table, name, default, follow_up in COLUMN_MIGRATIONS:
+            if name in existing[table]:
+                continue
+            column_type = Base.metadata.tables[table].c[name].type.compile(dialect=engine.dialect)
+            ddl = f'ALTER TABLE {table} ADD COLUMN {name} {column_type}'
+            if default is not None:
+                ddl += f' DEFAULT {default}'
+            connection.execute(text(ddl))
+            for statement in follow_up:
+                connection.execute(text(statement))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def init_db(engine):
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+
+engine = create_db_engine()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -1,30 +1,69 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import Base, Workorder, Lead
+from sqlalchemy import func
+from models import Workorder, Lead
+from database import engine, SessionLocal, init_db
 import os
 import shutil
-import pandas as pd
+import threading
+import traceback
+from contextlib import asynccontextmanager
+import uuid
 import array
 from sqlalchemy.exc import SQLAlchemyError
-from fastapi.responses import JSONResponse
-from typing import List
-from app.services.lead_processing import process_lead, cluster_lead_embeddings
-import math
-import numpy as np
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import List, Optional
+from app.services.enrichment import (
+    run_workorder_job, resume_workorder_job, submit_workorder_job, reset_failed_leads, get_enrichment_progress,
+    is_job_active, recluster_workorder_job,
+    WORKORDER_QUEUED, ENRICHMENT_STAGES
+)
+from app.services.ingestion import iter_lead_rows
+from app.utils.cache import get_scrape_cache
+from app.utils.http_client import get_http_fetcher
+from app.utils.web_scraper import get_browser_pool
+from app.services.lead_processing import get_llm_cache
+from app.utils.metrics import span, get_metrics, render_prometheus, summarize_timings
+from app.utils.rate_limit import rate_limiter_stats, CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN
+from app.services.ranking import rerank_workorder, display_order_page
+from app.services.export import stream_csv, stream_xlsx, EXPORT_FORMATS
+from app.services.lead_status import apply_status_updates
+from app.services.vector_index import (
+    get_vector_index, backfill_workorders, match_converted_leads, workorder_scope, global_scope,
+    is_global_scope, workorder_embedding_model
+)
+import base64
+from app.utils.embeddings import decode_embedding
+from app.services.embedding_providers import get_embedding_provider, LEGACY_EMBEDDING_MODEL
+import orjson
 
-DATABASE_URL = 'sqlite:///./workorders.db'
 UPLOAD_DIR = './uploaded_files'
 
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
+init_db(engine)
+
+
+def _warm_browser_pool():
+    try:
+        get_browser_pool().warm()
+    except Exception as e:
+        # No usable Chrome here; the Selenium fallback will report it per page
+        print(e)
+        traceback.print_exc()
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Browsers start in the background so the API is up without waiting for Chrome
+    threading.Thread(target=_warm_browser_pool, name='browser-pool-warmup', daemon=True).start()
+    yield
+    get_browser_pool().close()
+    get_http_fetcher().close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,6 +82,33 @@ def root():
 def health_check():
     return {"status": "healthy", "message": "API is running properly"}
 
+@app.get("/cache/stats")
+def scrape_cache_stats():
+    return get_scrape_cache().stats()
+
+@app.get("/metrics")
+def metrics():
+    """Stage latency histograms, error and scrape fallback counters, cache hit ratios and provider rate limits,
+    in Prometheus text format."""
+    gauges = {"hit_ratio": [], "entries": [], "rate": [], "circuit": []}
+    for cache_name, cache in (("scrape", get_scrape_cache()), ("llm", get_llm_cache())):
+        for namespace, stats in cache.stats().items():
+            labels = {"cache": cache_name, "namespace": namespace}
+            gauges["hit_ratio"].append((labels, stats["hit_ratio"]))
+            gauges["entries"].append((labels, stats["entries"]))
+    circuit_values = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1}
+    for stats in rate_limiter_stats():
+        labels = {"provider": stats["provider"]}
+        gauges["rate"].append((labels, stats["rate"]))
+        gauges["circuit"].append((labels, circuit_values.get(stats["circuit"], 2)))
+    text = render_prometheus([
+        ("lead_cache_hit_ratio", "Share of cache lookups answered from the cache since startup.", gauges["hit_ratio"]),
+        ("lead_cache_entries", "Entries stored per cache namespace.", gauges["entries"]),
+        ("lead_provider_rate_limit", "Requests per second currently allowed per external provider.", gauges["rate"]),
+        ("lead_provider_circuit_state", "Provider circuit breaker: 0 closed, 1 half-open, 2 open.", gauges["circuit"]),
+    ])
+    return Response(content=text, media_type="text/plain; version=0.0.4")
+
 @app.options("/workorders/upload")
 def upload_options():
     return {"message": "OK"}
@@ -72,95 +138,247 @@ def list_workorders():
 @app.post("/workorders/upload")
 def upload_workorder(file: UploadFile = File(...)):
     session = SessionLocal()
-    try:
-        # Save file
-        file_location = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    with span('upload') as upload_span:
+        try:
+            # Save file under a name of its own: the background job (and any later resume)
+            # reads it after this request returns, so another upload must not overwrite it
+            file_location = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}")
+            with open(file_location, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
         
-        # Parse file
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file_location)
-        else:
-            df = pd.read_excel(file_location)
-        # Create workorder
-        workorder = Workorder(
-            filename=file.filename,
-            original_file_path=file_location,
-            status='uploaded'
-        )
-        session.add(workorder)
-        session.commit()
-        # Add leads
-        leads = []
-        for _, row in df.iterrows():
-            lead_data = row.to_dict()
-            raw_text, buyer_persona, buyer_persona_embedding = process_lead(lead_data)
-            company_name = extract_company_name(lead_data)
-            lead = Lead(
-                workorder_id=workorder.id,
-                data=lead_data,
-                raw_webpage_text=raw_text,
-                buyer_persona=buyer_persona,
-                buyer_persona_embedding=buyer_persona_embedding,
-                company_name=company_name
+            # Read the first row so unparseable files are rejected before queueing
+            next(iter_lead_rows(file_location), None)
+            # Create workorder; rows are streamed in and enriched by a background job
+            # with the embedding provider recorded here
+            provider = get_embedding_provider()
+            workorder = Workorder(
+                filename=file.filename,
+                original_file_path=file_location,
+                status=WORKORDER_QUEUED,
+                embedding_model=provider.model_id,
+                embedding_dim=provider.dimensions
             )
-            session.add(lead)
-            leads.append(lead)
-        session.commit()
-        # Run clustering and save cluster ids
-        embeddings = [lead.buyer_persona_embedding for lead in leads]
-        labels = cluster_lead_embeddings(embeddings)
-        for lead, label in zip(leads, labels):
-            lead.cluster_id = int(label)
+            session.add(workorder)
+            session.commit()
+            upload_span.workorder_id = workorder.id
+            submit_workorder_job(run_workorder_job, workorder.id, file_location, SessionLocal)
+            return {
+                "id": workorder.id,
+                "filename": workorder.filename,
+                "status": workorder.status,
+                "embedding_model": workorder.embedding_model,
+                "embedding_dim": workorder.embedding_dim,
+            }
+        except Exception as e:
+            session.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            session.close()
+
+@app.get("/workorders/{workorder_id}/progress")
+def get_workorder_progress(workorder_id: int):
+    session = SessionLocal()
+    try:
+        workorder = session.query(Workorder).filter(Workorder.id == workorder_id).first()
+        if not workorder:
+            raise HTTPException(status_code=404, detail="Workorder not found")
+        progress = get_enrichment_progress(session, workorder_id)
+        return {
+            "id": workorder.id,
+            "status": workorder.status,
+            "embedding_model": workorder.embedding_model,
+            "embedding_dim": workorder.embedding_dim,
+            **progress
+        }
+    finally:
+        session.close()
+
+@app.get("/workorders/{workorder_id}/timings")
+def get_workorder_timings(workorder_id: int):
+    """Latency percentiles and error counts per pipeline stage of a workorder.
+
+    Live figures while a job runs, otherwise those saved when the last job ended.
+    """
+    session = SessionLocal()
+    try:
+        workorder = session.query(Workorder.id, Workorder.stage_timings).filter(Workorder.id == workorder_id).first()
+        if not workorder:
+            raise HTTPException(status_code=404, detail="Workorder not found")
+        live = get_metrics().workorder_snapshot(workorder_id) if is_job_active(workorder_id) else None
+        return {"id": workorder_id, "running": live is not None, "stages": summarize_timings(live or workorder[1])}
+    finally:
+        session.close()
+
+@app.post("/workorders/{workorder_id}/resume")
+def resume_workorder(workorder_id: int):
+    """Continue an interrupted workorder with only its unfinished rows and leads."""
+    session = SessionLocal()
+    try:
+        if not session.query(Workorder.id).filter(Workorder.id == workorder_id).first():
+            raise HTTPException(status_code=404, detail="Workorder not found")
+        if not submit_workorder_job(resume_workorder_job, workorder_id, SessionLocal):
+            raise HTTPException(status_code=409, detail="Workorder job is already running")
+        return {"id": workorder_id, "resumed": True, **get_enrichment_progress(session, workorder_id)}
+    finally:
+        session.close()
+
+@app.post("/workorders/{workorder_id}/retry")
+def retry_workorder(workorder_id: int, stage: Optional[str] = None):
+    """Re-run the failed stages of failed leads, optionally only those that failed at `stage`."""
+    if stage is not None and stage not in ENRICHMENT_STAGES:
+        raise HTTPException(status_code=400, detail=f"stage must be one of {', '.join(ENRICHMENT_STAGES)}")
+    session = SessionLocal()
+    try:
+        if not session.query(Workorder.id).filter(Workorder.id == workorder_id).first():
+            raise HTTPException(status_code=404, detail="Workorder not found")
+        if is_job_active(workorder_id):
+            raise HTTPException(status_code=409, detail="Workorder job is already running")
+        retried = reset_failed_leads(session, workorder_id, stage)
         session.commit()
-        return {"id": workorder.id, "filename": workorder.filename}
-    except Exception as e:
+        if retried:
+            submit_workorder_job(resume_workorder_job, workorder_id, SessionLocal)
+        return {"id": workorder_id, "retried": retried}
+    except SQLAlchemyError as e:
         session.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
     finally:
         session.close()
 
-def sanitize_for_json(obj):
-    if isinstance(obj, dict):
-        return {k: sanitize_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [sanitize_for_json(v) for v in obj]
-    elif isinstance(obj, float):
-        if math.isfinite(obj):
-            return obj
-        else:
-            return None  # or str(obj)
-    else:
-        return obj
+# Lead fields that can be requested from GET /workorders/{id}; large text fields are opt-in
+LEAD_FIELDS = {
+    "data": Lead.data,
+    "cluster_id": Lead.cluster_id,
+    "company_name": Lead.company_name,
+    "status": Lead.status,
+    "display_order": Lead.display_order,
+    "enrichment_status": Lead.enrichment_status,
+    "buyer_persona": Lead.buyer_persona,
+    "raw_webpage_text": Lead.raw_webpage_text,
+    "extraction_stats": Lead.extraction_stats,
+    "enrichment_stage": Lead.enrichment_stage,
+    "failed_stage": Lead.failed_stage,
+    "enrichment_error": Lead.enrichment_error,
+    "rerank_score": Lead.rerank_score,
+}
+DEFAULT_LEAD_FIELDS = ["data", "cluster_id", "company_name", "status", "display_order", "enrichment_status"]
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# Most neighbours the similarity endpoints return per request
+MAX_SIMILARITY_K = 1000
+
+def _json_response(payload):
+    # orjson writes NaN/inf as null and handles datetimes natively, so rows need no sanitizing pass
+    return Response(content=orjson.dumps(payload), media_type="application/json")
+
+def _encode_cursor(display_order, lead_id):
+    return base64.urlsafe_b64encode(orjson.dumps([display_order, lead_id])).decode()
+
+def _decode_cursor(cursor):
+    try:
+        display_order, lead_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if (display_order is not None and not isinstance(display_order, int)) or not isinstance(lead_id, int):
+            raise ValueError(cursor)
+        return display_order, lead_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_lead_fields(fields):
+    if not fields:
+        return DEFAULT_LEAD_FIELDS
+    names = [name.strip() for name in fields.split(",") if name.strip() and name.strip() != "id"]
+    unknown = [name for name in names if name not in LEAD_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown lead fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
 
 @app.get("/workorders/{workorder_id}")
-def get_workorder(workorder_id: int):
+def get_workorder(workorder_id: int, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, fields: Optional[str] = None):
+    """One page of a workorder's leads in display order.
+
+    Pass the returned `next_cursor` back as `cursor` for the next page; it is
+    null on the last page. `fields` is a comma-separated list of lead fields
+    (see LEAD_FIELDS); `raw_webpage_text` and `buyer_persona` are only
+    included when asked for.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    field_names = _parse_lead_fields(fields)
     session = SessionLocal()
     try:
         workorder = session.query(Workorder).filter(Workorder.id == workorder_id).first()
         if not workorder:
             raise HTTPException(status_code=404, detail="Workorder not found")
-        leads = session.query(Lead).filter(Lead.workorder_id == workorder_id).order_by(Lead.display_order.asc().nullslast(), Lead.id.asc()).all()
-        leads_data = [
-            sanitize_for_json({
-                "id": lead.id,
-                "data": lead.data,
-                "cluster_id": lead.cluster_id,
-                "buyer_persona": lead.buyer_persona,
-                "raw_webpage_text": lead.raw_webpage_text,
-                "company_name": lead.company_name,
-                "status": lead.status or 'unchecked',
-            })
-            for lead in leads
-        ]
-        return {
+        query = session.query(Lead.id, Lead.display_order, *[LEAD_FIELDS[name] for name in field_names]).filter(
+            Lead.workorder_id == workorder_id
+        )
+        rows = display_order_page(query, _decode_cursor(cursor) if cursor else None, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        leads_data = []
+        for row in rows:
+            lead = {"id": row[0]}
+            lead.update(zip(field_names, row[2:]))
+            if "status" in lead:
+                lead["status"] = lead["status"] or 'unchecked'
+            leads_data.append(lead)
+        payload = {
             "id": workorder.id,
             "filename": workorder.filename,
             "upload_date": workorder.upload_date,
             "status": workorder.status,
-            "leads": leads_data
+            "leads": leads_data,
+            "next_cursor": _encode_cursor(rows[-1][1], rows[-1][0]) if has_more else None,
         }
+        if not cursor:
+            payload["total_leads"] = session.query(func.count(Lead.id)).filter(Lead.workorder_id == workorder_id).scalar()
+        return _json_response(payload)
+    finally:
+        session.close()
+
+@app.get("/workorders/{workorder_id}/export")
+def export_workorder(workorder_id: int, format: str = 'csv'):
+    """Download the uploaded rows with persona, cluster_id, status and rerank_score added, in display order.
+
+    The file is streamed as leads are read in batches, so memory does not
+    grow with the workorder size.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    session = SessionLocal()
+    try:
+        filename = session.query(Workorder.filename).filter(Workorder.id == workorder_id).scalar()
+    finally:
+        session.close()
+    if filename is None:
+        raise HTTPException(status_code=404, detail="Workorder not found")
+    stream = stream_csv if format == 'csv' else stream_xlsx
+
+    def body():
+        # The session lives as long as the response is being sent
+        export_session = SessionLocal()
+        try:
+            yield from stream(export_session, workorder_id)
+        finally:
+            export_session.close()
+
+    export_name = f"{os.path.splitext(os.path.basename(filename))[0]}_enriched.{format}"
+    return StreamingResponse(body(), media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{export_name}"'})
+
+@app.get("/workorders/{workorder_id}/leads/{lead_id}")
+def get_lead(workorder_id: int, lead_id: int):
+    """All fields of one lead, including the scraped text and buyer persona."""
+    session = SessionLocal()
+    try:
+        row = session.query(Lead.id, *LEAD_FIELDS.values()).filter(
+            Lead.id == lead_id, Lead.workorder_id == workorder_id
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Lead not found")
+        lead = {"id": row[0]}
+        lead.update(zip(LEAD_FIELDS, row[1:]))
+        lead["status"] = lead["status"] or 'unchecked'
+        return _json_response(lead)
     finally:
         session.close()
 
@@ -168,63 +386,101 @@ def get_workorder(workorder_id: int):
 def persist_rerank(workorder_id: int, lead_ids: list = Body(...)):
     session = SessionLocal()
     try:
-        # Fetch all leads for this workorder
-        leads = session.query(Lead).filter(Lead.workorder_id == workorder_id).all()
-        # Separate leads by status
-        converted_leads = [lead for lead in leads if lead.status == 'converted' and lead.buyer_persona_embedding is not None]
-        failed_leads = [lead for lead in leads if lead.status == 'failed' and lead.buyer_persona_embedding is not None]
-        inprogress_leads = [lead for lead in leads if lead.status == 'in-progress' and lead.buyer_persona_embedding is not None]
-        unchecked_leads = [lead for lead in leads if (lead.status == 'unchecked' or not lead.status) and lead.buyer_persona_embedding is not None]
-
-
-        def to_np(embedding):
-            import numpy as np
-            if isinstance(embedding, (bytes, bytearray)):
-                return np.frombuffer(embedding, dtype=np.float32)
-            elif isinstance(embedding, np.ndarray):
-                return embedding
-            else:
-                return np.array(embedding, dtype=np.float32)
-
-        def cosine_similarity(a, b):
-            import numpy as np
-            if np.linalg.norm(a) == 0 or np.linalg.norm(b) == 0:
-                return 0.0
-            return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
-
-        # Prepare embeddings for converted
-        converted_embeddings = [(lead, to_np(lead.buyer_persona_embedding)) for lead in converted_leads]
-
-        # For each unchecked lead, compute similarity to closest converted lead
-        lead_scores = []
-        for lead in unchecked_leads:
-            emb = to_np(lead.buyer_persona_embedding)
-            if not converted_embeddings:
-                score = 0.0
-            else:
-                score = max([cosine_similarity(emb, conv_emb) for _, conv_emb in converted_embeddings])
-            lead_scores.append((lead, score))
-
-        # Sort unchecked by similarity descending
-        lead_scores.sort(key=lambda x: x[1], reverse=True)
-        sorted_unchecked = [lead for lead, _ in lead_scores]
-
-        # For converted, failed, in-progress: keep their previous display_order, sort by it
-        def by_display_order(lead):
-            return lead.display_order if lead.display_order is not None else 99999
-
-        sorted_converted = sorted(converted_leads, key=by_display_order)
-        sorted_failed = sorted(failed_leads, key=by_display_order)
-        sorted_inprogress = sorted(inprogress_leads, key=by_display_order)
-
-        # New order: unchecked first, then converted, in-progress, failed
-        new_order = sorted_unchecked + sorted_converted + sorted_inprogress + sorted_failed
-
-        # Update display_order
-        for order, lead in enumerate(new_order):
-            lead.display_order = order
+        new_order = rerank_workorder(session, workorder_id)
         session.commit()
-        return {"success": True, "reranked": [{"id": lead.id, "status": lead.status, "display_order": lead.display_order} for lead in new_order]}
+        return {"success": True, "reranked": [{"id": lead_id, "status": status, "display_order": order} for lead_id, status, order in new_order]}
+    finally:
+        session.close()
+
+@app.post("/workorders/{workorder_id}/recluster")
+def recluster_workorder(workorder_id: int):
+    """Queue a refit of the workorder's clusters from scratch instead of assigning incrementally."""
+    session = SessionLocal()
+    try:
+        if not session.query(Workorder.id).filter(Workorder.id == workorder_id).first():
+            raise HTTPException(status_code=404, detail="Workorder not found")
+        if not submit_workorder_job(recluster_workorder_job, workorder_id, SessionLocal):
+            raise HTTPException(status_code=409, detail="Workorder job is already running")
+        return {"id": workorder_id, "reclustering": True}
+    finally:
+        session.close()
+
+def _resolve_similarity_scope(session, workorder_id, scope):
+    if scope == 'workorder':
+        return workorder_scope(workorder_id)
+    if scope == 'global':
+        # Only workorders embedded with the same model are comparable
+        return global_scope(workorder_embedding_model(session, workorder_id))
+    raise HTTPException(status_code=400, detail="scope must be 'workorder' or 'global'")
+
+@app.get("/workorders/{workorder_id}/leads/{lead_id}/similar")
+def get_similar_leads(workorder_id: int, lead_id: int, k: int = 10, scope: str = 'workorder'):
+    """Top-k leads most similar to one lead, within its workorder or across all workorders."""
+    if not 1 <= k <= MAX_SIMILARITY_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_SIMILARITY_K}")
+    session = SessionLocal()
+    try:
+        index_scope = _resolve_similarity_scope(session, workorder_id, scope)
+        lead = session.query(Lead.id, Lead.buyer_persona_embedding).filter(
+            Lead.id == lead_id, Lead.workorder_id == workorder_id
+        ).first()
+        if not lead:
+            raise HTTPException(status_code=404, detail="Lead not found")
+        if lead.buyer_persona_embedding is None:
+            raise HTTPException(status_code=409, detail="Lead has no persona embedding yet")
+        backfill_workorders(session, [workorder_id])
+        matches = get_vector_index().search(
+            decode_embedding(lead.buyer_persona_embedding), k=k, scope=index_scope, exclude_ids={lead_id}
+        )
+        details = {
+            row.id: row for row in session.query(Lead.id, Lead.workorder_id, Lead.company_name, Lead.status)
+            .filter(Lead.id.in_([m[0] for m in matches])).all()
+        }
+        return {
+            "lead_id": lead_id,
+            "scope": scope,
+            "similar": [
+                {
+                    "id": match_id,
+                    "workorder_id": match_workorder_id,
+                    "company_name": details[match_id].company_name,
+                    "status": details[match_id].status or 'unchecked',
+                    "score": score,
+                }
+                for match_id, match_workorder_id, score in matches if match_id in details
+            ]
+        }
+    finally:
+        session.close()
+
+@app.get("/workorders/{workorder_id}/converted-matches")
+def get_converted_matches(workorder_id: int, k: int = 20, scope: str = 'global'):
+    """Unchecked leads of a workorder ranked by similarity to converted leads, by default from all workorders.
+
+    Global matches only consider workorders embedded with the same model.
+    """
+    if not 1 <= k <= MAX_SIMILARITY_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_SIMILARITY_K}")
+    session = SessionLocal()
+    try:
+        if not session.query(Workorder.id).filter(Workorder.id == workorder_id).first():
+            raise HTTPException(status_code=404, detail="Workorder not found")
+        index_scope = _resolve_similarity_scope(session, workorder_id, scope)
+        if is_global_scope(index_scope):
+            embedding_model = workorder_embedding_model(session, workorder_id)
+            backfill_workorders(session, [other_id for (other_id,) in session.query(Workorder.id).filter(
+                func.coalesce(Workorder.embedding_model, LEGACY_EMBEDDING_MODEL) == embedding_model).all()])
+        else:
+            backfill_workorders(session, [workorder_id])
+        matches = match_converted_leads(session, workorder_id, k=k, scope=index_scope)
+        return {
+            "workorder_id": workorder_id,
+            "scope": scope,
+            "matches": [
+                {"id": lead_id, "score": score, "closest_converted_lead_id": converted_id}
+                for lead_id, score, converted_id in matches
+            ]
+        }
     finally:
         session.close()
 
@@ -250,41 +506,33 @@ def update_lead_status(workorder_id: int, lead_id: int, status_data: dict = Body
         session.close()
 
 @app.post("/workorders/{workorder_id}/leads/status/batch")
-def update_multiple_lead_statuses(workorder_id: int, status_updates: dict = Body(...)):
-    """Update multiple lead statuses at once"""
+def update_multiple_lead_statuses(workorder_id: int, status_updates: dict = Body(...), key: str = 'index', rerank: bool = False):
+    """Update multiple lead statuses at once.
+
+    Keys of the body are lead indices in upload order, or lead ids with
+    `key=id`. With `rerank=true` the unchecked leads are reordered in the
+    same transaction and the new order is returned.
+    """
+    if key not in ('index', 'id'):
+        raise HTTPException(status_code=400, detail="key must be 'index' or 'id'")
     session = SessionLocal()
     try:
-        updated_leads = []
-        for lead_index, status in status_updates.items():
-            if status not in ['unchecked', 'converted', 'failed', 'in-progress']:
-                continue
-            
-            # Find lead by workorder_id and original index position
-            leads = session.query(Lead).filter(Lead.workorder_id == workorder_id).order_by(Lead.id).all()
-            try:
-                lead_idx = int(lead_index)
-                if 0 <= lead_idx < len(leads):
-                    lead = leads[lead_idx]
-                    lead.status = status
-                    updated_leads.append({"lead_id": lead.id, "index": lead_idx, "status": status})
-            except (ValueError, IndexError):
-                continue
-        
+        applied = apply_status_updates(session, workorder_id, status_updates, key=key)
+        response = {
+            "success": True,
+            "updated_leads": [
+                {"lead_id": lead_id, key: lead_key, "status": status} for lead_key, lead_id, status in applied
+            ]
+        }
+        if rerank:
+            response["reranked"] = [
+                {"id": lead_id, "status": status, "display_order": order}
+                for lead_id, status, order in rerank_workorder(session, workorder_id)
+            ]
         session.commit()
-        return {"success": True, "updated_leads": updated_leads}
+        return response
     except SQLAlchemyError as e:
         session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         session.close()
-
-def extract_company_name(data):
-    # Try common keys for company name
-    for key in data.keys():
-        if key.lower() in ["company", "company name", "organisation", "organization", "business", "firm"]:
-            return data[key]
-    # Fallback: first string value
-    for v in data.values():
-        if isinstance(v, str) and v.strip():
-            return v
-    return "" 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, BLOB
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Text, JSON, LargeBinary, Index
 from sqlalchemy.orm import declarative_base, relationship
 import datetime
 
@@ -11,6 +11,9 @@ class Workorder(Base):
     upload_date = Column(DateTime, default=datetime.datetime.utcnow)
     status = Column(String, default='uploaded')
     original_file_path = Column(String, nullable=False)
+    embedding_model = Column(String, nullable=True)  # Embedding provider/model id the leads are embedded with
+    embedding_dim = Column(Integer, nullable=True)  # Dimensions of that model's vectors, once known
+    stage_timings = Column(JSON, nullable=True)  # Latency histograms and error counts per pipeline stage
     leads = relationship('Lead', back_populates='workorder')
 
 class Lead(Base):
@@ -20,9 +23,29 @@ class Lead(Base):
     data = Column(JSON, nullable=False)
     raw_webpage_text = Column(Text, nullable=True)  # New field for scraped text
     buyer_persona = Column(Text, nullable=True)  # New field for generated persona
-    buyer_persona_embedding = Column(BLOB, nullable=True)  # Store as bytes for sqlite-vec
+    buyer_persona_embedding = Column(LargeBinary, nullable=True)  # Store as bytes for sqlite-vec
     cluster_id = Column(Integer, nullable=True)  # Cluster ID assigned by clustering algorithm
     company_name = Column(String, nullable=True)  # Company name extracted from data
     display_order = Column(Integer, nullable=True)  # Display order for persistent reranking
+    rerank_score = Column(Float, nullable=True)  # Best similarity to a converted lead at the last rerank (unchecked leads)
     status = Column(String, nullable=True, default='unchecked')  # Lead status (unchecked, converted, failed, in-progress)
-    workorder = relationship('Workorder', back_populates='leads') 
\ No newline at end of file
+    enrichment_status = Column(String, nullable=True, default='pending')  # Background enrichment state (pending, done, failed)
+    extraction_stats = Column(JSON, nullable=True)  # Scraped HTML size, parse time and page/prompt sizes
+    enrichment_stage = Column(String, nullable=True)  # Last completed enrichment stage (scrape, persona, embedding, cluster)
+    failed_stage = Column(String, nullable=True)  # Stage that failed when enrichment_status is failed
+    enrichment_error = Column(Text, nullable=True)  # Error message of the failed stage
+    enrichment_key = Column(String, nullable=True)  # Normalized website or company name; leads sharing it share enrichment
+    source_text_hash = Column(String, nullable=True)  # Hash of raw_webpage_text the persona was generated from
+    enriched_at = Column(DateTime, nullable=True)  # When the persona and embedding were generated
+    workorder = relationship('Workorder', back_populates='leads')
+
+    __table_args__ = (
+        # Lead pages in display order
+        Index('ix_leads_workorder_display_order', 'workorder_id', 'display_order'),
+        # Status filters and rerank; covers (id, status, display_order) lookups on SQLite
+        Index('ix_leads_workorder_status', 'workorder_id', 'status', 'display_order'),
+        # Pending-lead scans and progress counts of the enrichment job
+        Index('ix_leads_workorder_enrichment_status', 'workorder_id', 'enrichment_status'),
+        # Earlier enrichments of the same company, newest first
+        Index('ix_leads_enrichment_key', 'enrichment_key', 'enriched_at'),
+    ) 
\ No newline at end of file
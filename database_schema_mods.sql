@@ -34,4 +34,39 @@ ALTER TABLE leads ADD COLUMN company_name TEXT;
 ALTER TABLE leads ADD COLUMN display_order INTEGER;
 
 -- Add status column to leads table for tracking lead processing state
-ALTER TABLE leads ADD COLUMN status TEXT DEFAULT 'unchecked';
\ No newline at end of file
+ALTER TABLE leads ADD COLUMN status TEXT DEFAULT 'unchecked';
+
+-- Add enrichment_status column to leads table for background enrichment progress
+ALTER TABLE leads ADD COLUMN enrichment_status TEXT DEFAULT 'pending';
+UPDATE leads SET enrichment_status = 'done' WHERE buyer_persona IS NOT NULL OR raw_webpage_text IS NOT NULL;
+
+-- Add extraction_stats column to leads table for text extraction measurements
+ALTER TABLE leads ADD COLUMN extraction_stats JSON;
+
+-- Add per-stage checkpoint columns to leads table for resumable enrichment
+ALTER TABLE leads ADD COLUMN enrichment_stage TEXT;
+ALTER TABLE leads ADD COLUMN failed_stage TEXT;
+ALTER TABLE leads ADD COLUMN enrichment_error TEXT;
+
+-- Add embedding model columns to workorders table so vectors of different providers never mix
+ALTER TABLE workorders ADD COLUMN embedding_model TEXT;
+UPDATE workorders SET embedding_model = 'openai/text-embedding-3-small';
+ALTER TABLE workorders ADD COLUMN embedding_dim INTEGER;
+UPDATE workorders SET embedding_dim = 1536 WHERE embedding_model = 'openai/text-embedding-3-small';
+
+-- Add per-stage timing histograms to workorders table
+ALTER TABLE workorders ADD COLUMN stage_timings JSON;
+
+-- Add enrichment identity columns to leads table so companies are enriched once and reused
+ALTER TABLE leads ADD COLUMN enrichment_key TEXT;
+ALTER TABLE leads ADD COLUMN source_text_hash TEXT;
+ALTER TABLE leads ADD COLUMN enriched_at DATETIME;
+
+-- Add rerank score column to leads table so exports include the ranking
+ALTER TABLE leads ADD COLUMN rerank_score REAL;
+
+-- Indexes for per-workorder lead pages, status filters/rerank and enrichment progress
+CREATE INDEX IF NOT EXISTS ix_leads_workorder_display_order ON leads (workorder_id, display_order);
+CREATE INDEX IF NOT EXISTS ix_leads_workorder_status ON leads (workorder_id, status, display_order);
+CREATE INDEX IF NOT EXISTS ix_leads_workorder_enrichment_status ON leads (workorder_id, enrichment_status);
+CREATE INDEX IF NOT EXISTS ix_leads_enrichment_key ON leads (enrichment_key, enriched_at);
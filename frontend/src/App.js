@@ -55,7 +55,7 @@ function WorkorderList({ onUpload, workorders, error, onWorkorderClick, uploadin
                 <td style={{ padding: '0.75rem', color: '#222', fontWeight: 500 }}>{wo.id}</td>
                 <td style={{ padding: '0.75rem', color: '#2563eb', textDecoration: 'underline' }}>{wo.filename}</td>
                 <td style={{ padding: '0.75rem', color: '#555' }}>{wo.upload_date ? new Date(wo.upload_date).toLocaleString() : '-'}</td>
-                <td style={{ padding: '0.75rem', color: wo.status === 'uploaded' ? '#059669' : '#b91c1c', fontWeight: 500 }}>{wo.status}</td>
+                <td style={{ padding: '0.75rem', color: (wo.status === 'uploaded' || wo.status === 'done') ? '#059669' : '#b91c1c', fontWeight: 500 }}>{wo.status}</td>
               </tr>
             ))}
           </tbody>
@@ -101,6 +101,27 @@ function cosineSimilarity(a, b) {
   return dot / (Math.sqrt(normA) * Math.sqrt(normB));
 }
 
+// Lead fields shown in the table; raw webpage text is left out to keep pages small
+const LEAD_TABLE_FIELDS = 'data,cluster_id,company_name,status,display_order,buyer_persona';
+
+// Fetch a workorder and all of its leads, following the backend's pagination cursors
+async function fetchWorkorderPages(id) {
+  let workorder = null;
+  let leads = [];
+  let cursor = null;
+  do {
+    const params = new URLSearchParams({ fields: LEAD_TABLE_FIELDS, limit: '1000' });
+    if (cursor) params.set('cursor', cursor);
+    const res = await fetch(`${BACKEND_URL}/workorders/${id}?${params}`);
+    if (!res.ok) throw new Error(`Failed to load workorder ${id}`);
+    const page = await res.json();
+    if (!workorder) workorder = page;
+    leads = leads.concat(page.leads || []);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return { ...workorder, leads, next_cursor: null };
+}
+
 function WorkorderDetail() {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -112,8 +133,7 @@ function WorkorderDetail() {
   const [rerankedLeads, setRerankedLeads] = useState(null);
 
   useEffect(() => {
-    fetch(`${BACKEND_URL}/workorders/${id}`)
-      .then((res) => res.json())
+    fetchWorkorderPages(id)
       .then((data) => {
         setWorkorder(data);
         setLeads(data.leads || []);
@@ -179,8 +199,7 @@ function WorkorderDetail() {
 
   // Helper to reload workorder data
   const fetchWorkorder = async () => {
-    const res = await fetch(`${BACKEND_URL}/workorders/${id}`);
-    const data = await res.json();
+    const data = await fetchWorkorderPages(id);
     setWorkorder(data);
     setLeads(data.leads || []);
     setRerankedLeads(null); // Always use backend order after fetch